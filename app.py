@@ -2,8 +2,14 @@ import os
 import asyncio
 from aiohttp import web
 
+from bridge.deflate import DeflateWebSocketResponse
+from bridge.event_loop import install_event_loop
+from bridge.health import add_health_routes
+from bridge.static_cache import add_static_assets
+from bridge.workers import reuse_port
+
 async def websocket_handler(request):
-    ws = web.WebSocketResponse()
+    ws = DeflateWebSocketResponse()
     await ws.prepare(request)
     
     await ws.send_str("--- YGGDRASIL CENTRAL CORE v5.0 ---\n")
@@ -27,15 +33,19 @@ async def websocket_handler(request):
                     break
     finally:
         await ws.close()
+        ws.record_stats()
     return ws
 
 async def init_app():
     app = web.Application()
     app.add_routes([web.get('/ws', websocket_handler)])
-    app.router.add_static('/', path='public', show_index=True)
+    # ヘルスチェックは / 以下の静的ファイルより先に登録する (一覧ページを作らずに答える)
+    add_health_routes(app)
+    add_static_assets(app, '/', 'public', show_index=True)
     return app
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
+    print(f"イベントループ: {install_event_loop()}")
     app = asyncio.run(init_app())
-    web.run_app(app, host='0.0.0.0', port=port)
+    web.run_app(app, host='0.0.0.0', port=port, reuse_port=reuse_port())
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# ベンチマーク共通のユーティリティ (統計値、メモリ測定、PTY 上の最初の出力待ち)
+
+import os
+import statistics
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IDLE_SESSION = os.path.join(PROJECT_ROOT, 'benchmarks', 'idle_session.py')
+
+
+def percentile(values, pct):
+    """values の pct パーセンタイル (最近傍法)。空なら 0.0。"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize_ms(values):
+    """秒単位の測定値を、ミリ秒の mean/p50/p95/p99/max の文字列にまとめる。"""
+    if not values:
+        return "n/a"
+    ms = [v * 1000 for v in values]
+    return (f"mean {statistics.mean(ms):7.2f} ms  p50 {percentile(ms, 50):7.2f} ms  "
+            f"p95 {percentile(ms, 95):7.2f} ms  p99 {percentile(ms, 99):7.2f} ms  "
+            f"max {max(ms):7.2f} ms")
+
+
+def read_memory_kb(pid):
+    """
+    /proc/<pid>/smaps_rollup から Rss と Pss (kB) を読む。
+    Pss は共有ページをプロセス数で按分した値なので、copy-on-write の効果が見える。
+    """
+    values = {"Rss": 0, "Pss": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(':')
+                if key in values:
+                    values[key] = int(rest.split()[0])
+    except OSError:
+        pass
+    return values["Rss"], values["Pss"]
+
+
+async def wait_first_output(master_fd):
+    """PTY に最初の出力が届くまで待ち、そのバイト列を返す。"""
+    from bridge.pty_reader import PtyReader
+
+    reader = PtyReader(master_fd)
+    try:
+        return await reader.read()
+    finally:
+        reader.close()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# 入力プロトコルのマイクロベンチマーク
+# 1 コアで 1 秒あたりに処理できる入力メッセージ数を、
+#   - legacy : 以前のハンドラ (メッセージごとに json.loads + dict 参照 + PTY への write)
+#   - json   : InputHandler の JSON 経路 (後方互換)
+#   - binary : InputHandler のバイナリ経路 (1 バイトのオペコード + UTF-8)
+# で比較する。typing は 1 メッセージごとに write、paste は --burst 個のメッセージが
+# 同じイベントループの周回で届いた場合 (まとめて 1 回の write) を想定する。
+# write の宛先は /dev/null (システムコールのコストは含めるが、PTY の詰まりは含めない)。
+#
+# 使い方: python3 -m benchmarks.bench_input --messages 200000 --burst 64
+
+import argparse
+import json
+import os
+import time
+
+from aiohttp import WSMessage, WSMsgType
+
+from bridge.input_protocol import InputHandler, encode_input
+
+KEYS = ['j', 'k', '\r', '\x1bOA', '\x1bOB', 'あ']
+
+
+class NullSession:
+    """GameSession.queue_input() と同じくキー入力を溜め、flush() でまとめて書く。"""
+    def __init__(self):
+        self.fd = os.open(os.devnull, os.O_WRONLY)
+        self.pending = bytearray()
+        self.writes = 0
+
+    def queue_input(self, data):
+        self.pending += data
+
+    def flush(self):
+        if self.pending:
+            os.write(self.fd, self.pending)
+            self.pending.clear()
+            self.writes += 1
+
+    def close(self):
+        os.close(self.fd)
+
+
+def run_legacy(messages, burst, sink):
+    """以前の websocket_handler のループ本体と同じ処理。"""
+    for msg in messages:
+        if msg.type == WSMsgType.TEXT:
+            msg_data = json.loads(msg.data)
+            if msg_data['type'] == 'resize':
+                pass
+            elif msg_data['type'] == 'input':
+                os.write(sink.fd, msg_data['data'].encode('utf-8'))
+                sink.writes += 1
+
+
+def run_handler(messages, burst, sink):
+    handler = InputHandler(sink, lambda rows, cols: None)
+    feed = handler.feed
+    for i, msg in enumerate(messages, 1):
+        feed(msg)
+        if i % burst == 0:
+            sink.flush()
+    sink.flush()
+
+
+def make_messages(kind, count):
+    if kind == 'binary':
+        return [WSMessage(WSMsgType.BINARY, encode_input(KEYS[i % len(KEYS)]), None) for i in range(count)]
+    return [WSMessage(WSMsgType.TEXT, json.dumps({'type': 'input', 'data': KEYS[i % len(KEYS)]}), None)
+            for i in range(count)]
+
+
+def measure(runner, messages, burst):
+    sink = NullSession()
+    try:
+        started = time.thread_time()
+        runner(messages, burst, sink)
+        cpu = time.thread_time() - started
+    finally:
+        sink.close()
+    return len(messages) / cpu, sink.writes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="入力プロトコルの messages/sec (1 コア)")
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--burst', type=int, default=64, help="paste で同時に届くメッセージ数")
+    parser.add_argument('--repeat', type=int, default=3, help="各条件の試行回数 (最良値を採る)")
+    args = parser.parse_args()
+
+    cases = [
+        ('legacy', 'json', run_legacy),
+        ('json', 'json', run_handler),
+        ('binary', 'binary', run_handler),
+    ]
+    print(f"{args.messages} メッセージ, paste burst {args.burst}")
+    for scenario, burst in (('typing', 1), ('paste', args.burst)):
+        print(f"=== {scenario} ===")
+        for name, kind, runner in cases:
+            messages = make_messages(kind, args.messages)
+            results = [measure(runner, messages, burst) for _ in range(args.repeat)]
+            rate, writes = max(results)
+            print(f"  {name:7s}: {rate:12,.0f} msgs/sec/core  (PTY write {writes} 回)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# イベントループ (標準の asyncio と uvloop) の比較ベンチマーク
+# 同じサーバーを YGG_EVENT_LOOP だけ変えて起動し、それぞれについて
+#   - PTY 転送のスループット: benchmarks/flood_session.py の大量の出力を複数のクライアントで
+#     同時に受け取り切るまでの MiB/s と、サーバー (ワーカー) の CPU 時間
+#   - WebSocket のフレーム数/秒: 上と同じ測定で受け取ったフレーム数
+#   - エコーレイテンシ: benchmarks.bench_workers と同じ測定 (1 文字送ってエコーが返るまで)
+# を測る。uvloop が入っていなければ asyncio だけを測る。
+#
+# 使い方: python3 -m benchmarks.bench_loop --clients 4 --frames 2000 --repeat 3
+
+import argparse
+import asyncio
+import os
+import time
+
+import aiohttp
+
+from benchmarks.bench_common import PROJECT_ROOT, summarize_ms
+from benchmarks.bench_workers import echo_latency, start_server, stop_server
+from bridge.event_loop import uvloop
+
+FLOOD_SESSION = os.path.join(PROJECT_ROOT, 'benchmarks', 'flood_session.py')
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+def worker_pid(supervisor_pid):
+    """bridge.workers (1 ワーカー) が起動したサーバープロセスの PID。"""
+    with open(f"/proc/{supervisor_pid}/task/{supervisor_pid}/children") as f:
+        return int(f.read().split()[0])
+
+
+def read_own_cpu_seconds(pid):
+    """子プロセス (ゲーム) の分を含まない、プロセス自身の utime + stime。"""
+    with open(f"/proc/{pid}/stat") as f:
+        stat = f.read()
+    fields = stat[stat.rfind(')') + 2:].split()
+    return (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+
+
+async def flood(url, clients):
+    """clients 個のセッションで flood_session の出力を最後まで受け取る。(バイト数, フレーム数, 経過秒)"""
+    received = frames = 0
+
+    async def client(http):
+        nonlocal received, frames
+        async with http.ws_connect(url, max_msg_size=0) as ws:
+            async for msg in ws:
+                if msg.type in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                    received += len(msg.data)
+                    frames += 1
+
+    async with aiohttp.ClientSession() as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(http) for _ in range(clients)))
+        return received, frames, time.perf_counter() - started
+
+
+async def measure(loop_name, args):
+    url = f"ws://127.0.0.1:{args.port}/websocket"
+    env = {'YGG_EVENT_LOOP': loop_name, 'YGG_WORKERS': '1'}
+
+    runs = []
+    server = await start_server(args.server, 1, args.port,
+                                dict(env, YGG_GAME_SCRIPT=FLOOD_SESSION, YGG_FLOOD_FRAMES=str(args.frames)))
+    try:
+        pid = worker_pid(server.pid)
+        for _ in range(args.repeat):
+            cpu_started = read_own_cpu_seconds(pid)
+            received, frames, elapsed = await flood(url, args.clients)
+            runs.append((received / elapsed, frames / elapsed, read_own_cpu_seconds(pid) - cpu_started, received))
+    finally:
+        await stop_server(server)
+
+    server = await start_server(args.server, 1, args.port, env)
+    try:
+        echo = await echo_latency(url, args.echo_sessions, args.echo_rounds)
+    finally:
+        await stop_server(server)
+    # スループットは最良の試行を採る (他のプロセスの影響が最も少ないもの)
+    return max(runs), echo
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="asyncio と uvloop のイベントループの比較")
+    parser.add_argument('--server', default='server.py', help="起動するサーバースクリプト")
+    parser.add_argument('--port', type=int, default=8790)
+    parser.add_argument('--loops', nargs='+', default=['asyncio', 'uvloop'], choices=['asyncio', 'uvloop'])
+    parser.add_argument('--clients', type=int, default=4, help="同時に出力を受け取るクライアント数")
+    parser.add_argument('--frames', type=int, default=2000, help="1 セッションが出力する画面数")
+    parser.add_argument('--repeat', type=int, default=3, help="スループットの試行回数 (最良値を採る)")
+    parser.add_argument('--echo-sessions', type=int, default=20, help="エコー測定で開いておくセッション数")
+    parser.add_argument('--echo-rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    loops = args.loops
+    if 'uvloop' in loops and uvloop is None:
+        print("uvloop がインストールされていないため、asyncio だけを測ります (pip install uvloop)。")
+        loops = [name for name in loops if name != 'uvloop']
+
+    print(f"CPU コア数: {os.cpu_count()}, クライアント {args.clients} x {args.frames} 画面")
+    results = {}
+    for loop_name in loops:
+        (rate, frame_rate, cpu, size), echo = await measure(loop_name, args)
+        results[loop_name] = (rate, cpu / (size / 1024 / 1024))
+        print(f"=== {loop_name} ===")
+        print(f"  PTY 転送      : {rate / 1024 / 1024:8.1f} MiB/s, サーバー CPU {cpu * 1000:7.1f} ms "
+              f"({cpu * 1000 / (size / 1024 / 1024):6.2f} ms/MiB)")
+        print(f"  WebSocket     : {frame_rate:8.0f} frames/s")
+        print(f"  エコー ({args.echo_sessions} セッション): {summarize_ms(echo)}")
+
+    if len(results) == 2:
+        (base_rate, base_cpu), (rate, cpu) = results['asyncio'], results['uvloop']
+        print(f"uvloop / asyncio: スループット {100 * (rate - base_rate) / base_rate:+.1f}%, "
+              f"CPU (ms/MiB) {100 * (cpu - base_cpu) / base_cpu:+.1f}%")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# 録画のオーバーヘッドのベンチマーク
+# 全画面の再描画を大量に出力するセッション (benchmarks/flood_session.py) を GameSession で
+# 転送し、録画なし / 録画ありで転送のスループットと CPU 時間を比べる。CPU 時間は
+# イベントループのスレッド (転送ループ) と、それ以外 (録画の書き込みスレッドとファイルの圧縮) に分けて示す。
+# --queue-kb を小さくすると、ディスクが追いつかない場合の捨て方 (dropped) も確認できる。
+#
+# 使い方: python3 -m benchmarks.bench_recording --frames 3000 --repeat 3
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from benchmarks.bench_common import PROJECT_ROOT
+from bridge.recording import RecordingSettings
+from bridge.session import SessionRegistry
+from bridge.spawn import spawn_session
+
+FLOOD_SESSION = os.path.join(PROJECT_ROOT, 'benchmarks', 'flood_session.py')
+
+
+async def run_once(frames, recording):
+    """1 セッション分を最後まで転送し、(転送ループの CPU 秒, それ以外の CPU 秒, 経過秒, 転送バイト数, 録画) を返す。"""
+    registry = SessionRegistry(grace_seconds=0, hibernate_seconds=0, idle_timeout_seconds=0)
+    registry.recording = recording
+    env = dict(os.environ, YGG_FLOOD_FRAMES=str(frames))
+    process, master_fd = await spawn_session(FLOOD_SESSION, env=env)
+    cpu_started = time.process_time()
+    loop_cpu_started = time.thread_time()
+    started = time.perf_counter()
+    # セッションの終了ログは測定結果の表示の邪魔になるので捨てる
+    with contextlib.redirect_stdout(io.StringIO()):
+        session = registry.create(None, process, master_fd)
+        # スループットは PTY の EOF までで測る (最後のファイルの書き出しと圧縮は含めない)
+        while not session.ended:
+            await asyncio.sleep(0.002)
+        elapsed = time.perf_counter() - started
+        await session.wait_closed()
+    loop_cpu = time.thread_time() - loop_cpu_started
+    other_cpu = time.process_time() - cpu_started - loop_cpu
+    return loop_cpu, other_cpu, elapsed, session.coalescer.stats.bytes, session.recorder
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="録画のオーバーヘッド (CPU 時間とスループット)")
+    parser.add_argument('--frames', type=int, default=3000, help="1 セッションが出力する画面数")
+    parser.add_argument('--repeat', type=int, default=3, help="各条件の試行回数 (最良値を採る)")
+    parser.add_argument('--queue-kb', type=int, default=RecordingSettings.QUEUE_BYTES // 1024)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="ygg-record-") as directory:
+        cases = [
+            ("録画なし", RecordingSettings(directory="")),
+            ("録画あり", RecordingSettings(directory=directory, queue_bytes=args.queue_kb * 1024)),
+        ]
+        results = {}
+        for name, recording in cases:
+            runs = [await run_once(args.frames, recording) for _ in range(args.repeat)]
+            loop_cpu, other_cpu, elapsed, size, recorder = min(runs, key=lambda r: r[0])
+            results[name] = (loop_cpu, size / elapsed)
+            line = (f"{name}: {size / 1024 / 1024 / elapsed:6.1f} MiB/s ({size / 1024 / 1024:.1f} MiB), "
+                    f"転送ループ CPU {loop_cpu * 1000:7.1f} ms ({loop_cpu * 1e6 / (size / 1024):5.2f} us/KiB), "
+                    f"書き込みスレッド CPU {other_cpu * 1000:7.1f} ms")
+            if recorder is not None:
+                compressed = sum(os.path.getsize(p) for p in recorder.files)
+                line += (f"\n          {recorder.events} events, {recorder.dropped} dropped, "
+                         f"{recorder.bytes_written / 1024 / 1024:.1f} MiB -> gzip {compressed / 1024:.0f} KiB "
+                         f"({len(recorder.files)} ファイル)")
+            print(line)
+        (base_cpu, base_rate), (cpu, rate) = results["録画なし"], results["録画あり"]
+        print(f"オーバーヘッド: 転送ループ CPU {100 * (cpu - base_cpu) / base_cpu:+.1f}%, "
+              f"スループット {100 * (rate - base_rate) / base_rate:+.1f}%")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# セッション起動経路のマイクロベンチマーク
+# 旧経路 (preexec_fn=os.setsid → fork+exec) と bridge.spawn の高速経路
+# (start_new_session=True → vfork) を、同時に保持しているセッション数
+# 10 / 100 / 500 のそれぞれで比較する。
+#
+# サーバーが多数のセッションを抱えている状態を再現するため、保持セッションごとに
+# PTY と子プロセス (cat) を持ち、親プロセス側にもセッション分のメモリ (--ballast-kb) を確保する。
+#
+# 使い方: python3 -m benchmarks.bench_spawn --levels 10 100 500 --samples 20
+
+import argparse
+import asyncio
+import fcntl
+import os
+import pty
+import sys
+import time
+
+from benchmarks.bench_common import IDLE_SESSION, summarize_ms, wait_first_output
+from bridge.spawn import set_winsize, spawn_session
+
+
+async def spawn_preexec(script):
+    """旧経路: Python の preexec_fn で setsid する (vfork/posix_spawn が使えない)。"""
+    master_fd, slave_fd = pty.openpty()
+    set_winsize(master_fd, 24, 80)
+    try:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, script,
+            stdin=slave_fd, stdout=slave_fd, stderr=slave_fd,
+            preexec_fn=os.setsid
+        )
+    finally:
+        os.close(slave_fd)
+    fcntl.fcntl(master_fd, fcntl.F_SETFL, os.O_NONBLOCK)
+    return process, master_fd
+
+
+async def spawn_fast(script):
+    return await spawn_session(script)
+
+
+class Holders:
+    """ベンチマーク中に保持しておく「他のセッション」。"""
+    def __init__(self, ballast_kb):
+        self.ballast_kb = ballast_kb
+        self.sessions = []
+        self.ballast = []
+
+    async def grow_to(self, count):
+        while len(self.sessions) < count:
+            master_fd, slave_fd = pty.openpty()
+            process = await asyncio.create_subprocess_exec(
+                "cat", stdin=slave_fd, stdout=slave_fd, stderr=slave_fd,
+                start_new_session=True
+            )
+            os.close(slave_fd)
+            self.sessions.append((process, master_fd))
+            block = bytearray(self.ballast_kb * 1024)
+            for offset in range(0, len(block), 4096):
+                block[offset] = 1  # ページを実際に確保させる
+            self.ballast.append(block)
+
+    async def close(self):
+        for process, master_fd in self.sessions:
+            process.kill()
+        for process, master_fd in self.sessions:
+            await process.wait()
+            os.close(master_fd)
+        self.sessions.clear()
+        self.ballast.clear()
+
+
+async def measure(spawn, script, samples):
+    spawn_times = []
+    ready_times = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        process, master_fd = await spawn(script)
+        spawned = time.perf_counter()
+        await wait_first_output(master_fd)
+        ready = time.perf_counter()
+        process.kill()
+        await process.wait()
+        os.close(master_fd)
+        spawn_times.append(spawned - started)
+        ready_times.append(ready - started)
+    return spawn_times, ready_times
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="spawn latency: preexec_fn vs start_new_session")
+    parser.add_argument('--levels', type=int, nargs='+', default=[10, 100, 500],
+                        help="同時に保持しておくセッション数")
+    parser.add_argument('--samples', type=int, default=20, help="各条件で起動する回数")
+    parser.add_argument('--ballast-kb', type=int, default=512,
+                        help="保持セッション 1 つあたりに親プロセスが確保するメモリ (KiB)")
+    parser.add_argument('--script', default=IDLE_SESSION)
+    args = parser.parse_args()
+
+    holders = Holders(args.ballast_kb)
+    try:
+        for level in sorted(args.levels):
+            await holders.grow_to(level)
+            print(f"=== 同時セッション数 {level} ===")
+            for name, spawn in (("preexec_fn", spawn_preexec), ("fast", spawn_fast)):
+                spawn_times, ready_times = await measure(spawn, args.script, args.samples)
+                print(f"  [{name:10}] spawn呼び出し : {summarize_ms(spawn_times)}")
+                print(f"  [{name:10}] 最初の出力まで: {summarize_ms(ready_times)}")
+    finally:
+        await holders.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
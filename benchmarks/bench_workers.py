@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# ワーカー数によるスケーリングのベンチマーク
+# bridge.workers でサーバーを 1〜N ワーカー起動し、それぞれについて
+#   - sessions/sec: 接続 → 最初のフレーム受信 → 切断 を並列に繰り返した時の完了数
+#   - エコーレイテンシ: 多数のセッションを開いたまま 1 文字ずつ送り、PTY のエコーが
+#     WebSocket で返ってくるまでの時間
+# を測る。ゲームには benchmarks/idle_session.py を使う (アーカイブの import は本物と同じ)。
+#
+# 使い方: python3 -m benchmarks.bench_workers --workers 1 2 4 --duration 10
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+
+import aiohttp
+
+from benchmarks.bench_common import IDLE_SESSION, PROJECT_ROOT, summarize_ms
+
+
+async def start_server(server, workers, port, extra_env=None):
+    env = os.environ.copy()
+    env.update({
+        'PORT': str(port),
+        'YGG_GAME_SCRIPT': IDLE_SESSION,
+        'YGG_SESSION_GRACE_SEC': '0',
+        'PYTHONUNBUFFERED': '1',
+    })
+    env.update(extra_env or {})
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, '-m', 'bridge.workers', '--workers', str(workers), server,
+        cwd=PROJECT_ROOT, env=env,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+        start_new_session=True
+    )
+    # 全ワーカーが起動メッセージを出すまで待つ
+    ready = 0
+    while ready < workers:
+        line = await asyncio.wait_for(process.stdout.readline(), timeout=60)
+        if not line:
+            raise RuntimeError("サーバーが起動前に終了しました")
+        if "aiohttpサーバーが" in line.decode(errors='replace'):
+            ready += 1
+    # 以降のログは読み捨てる (パイプが詰まらないように)
+    asyncio.create_task(drain(process.stdout))
+    return process
+
+
+async def drain(stream):
+    while await stream.readline():
+        pass
+
+
+async def stop_server(process):
+    os.killpg(process.pid, signal.SIGINT)
+    try:
+        await asyncio.wait_for(process.wait(), timeout=30)
+    except asyncio.TimeoutError:
+        os.killpg(process.pid, signal.SIGKILL)
+        await process.wait()
+
+
+async def session_churn(url, concurrency, duration):
+    """接続して最初のフレームを受け取ったら切断する、を duration 秒間繰り返す。"""
+    done = 0
+    latencies = []
+    deadline = time.perf_counter() + duration
+
+    async def client(http):
+        nonlocal done
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            async with http.ws_connect(url) as ws:
+                await ws.receive()
+            latencies.append(time.perf_counter() - started)
+            done += 1
+
+    async with aiohttp.ClientSession() as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return done / elapsed, latencies
+
+
+async def echo_latency(url, sessions, rounds):
+    """sessions 個のセッションを開いたまま、各セッションで rounds 回エコーを測る。"""
+    latencies = []
+
+    async def client(http):
+        async with http.ws_connect(url) as ws:
+            await ws.receive()  # バナー
+            for i in range(rounds):
+                char = chr(ord('a') + i % 26)
+                started = time.perf_counter()
+                await ws.send_str(json.dumps({'type': 'input', 'data': char}))
+                while True:
+                    msg = await ws.receive()
+                    if msg.type != aiohttp.WSMsgType.TEXT and msg.type != aiohttp.WSMsgType.BINARY:
+                        return
+                    data = msg.data if isinstance(msg.data, str) else msg.data.decode(errors='replace')
+                    if char in data:
+                        break
+                latencies.append(time.perf_counter() - started)
+
+    async with aiohttp.ClientSession() as http:
+        await asyncio.gather(*(client(http) for _ in range(sessions)))
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="bridge.workers のワーカー数によるスケーリング")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    parser.add_argument('--server', default='server.py', help="起動するサーバースクリプト")
+    parser.add_argument('--port', type=int, default=8790)
+    parser.add_argument('--duration', type=float, default=10.0, help="sessions/sec の測定時間 (秒)")
+    parser.add_argument('--concurrency', type=int, default=16, help="同時に接続を繰り返すクライアント数")
+    parser.add_argument('--echo-sessions', type=int, default=50, help="エコー測定で開いておくセッション数")
+    parser.add_argument('--echo-rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    url = f"ws://127.0.0.1:{args.port}/websocket"
+    print(f"CPU コア数: {os.cpu_count()}")
+    for workers in args.workers:
+        server = await start_server(args.server, workers, args.port)
+        try:
+            rate, connect_times = await session_churn(url, args.concurrency, args.duration)
+            echo = await echo_latency(url, args.echo_sessions, args.echo_rounds)
+        finally:
+            await stop_server(server)
+        print(f"=== {workers} ワーカー ===")
+        print(f"  sessions/sec      : {rate:8.1f}")
+        print(f"  接続→最初のフレーム: {summarize_ms(connect_times)}")
+        print(f"  エコー ({args.echo_sessions} セッション): {summarize_ms(echo)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Zygote と create_subprocess_exec の比較ベンチマーク
+# セッションを N 個起動し、起動レイテンシ (要求から最初の出力まで) と
+# セッションあたりの RSS / PSS を比較する。
+#
+# 使い方: python3 -m benchmarks.bench_zygote --sessions 50
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from benchmarks.bench_common import IDLE_SESSION, read_memory_kb, summarize_ms, wait_first_output
+from bridge.spawn import spawn_session
+from bridge.zygote import ZygoteSpawner
+
+
+async def spawn_subprocess(script):
+    """ゲームサーバーのコールドスタートと同じ経路 (create_subprocess_exec)。"""
+    return await spawn_session(script)
+
+
+async def run(mode, script, sessions):
+    spawner = None
+    if mode == "zygote":
+        spawner = ZygoteSpawner(script)
+        await spawner.start()
+
+    latencies = []
+    live = []
+    try:
+        for _ in range(sessions):
+            started = time.perf_counter()
+            if spawner:
+                session = await spawner.acquire()
+                process, master_fd = session.process, session.master_fd
+            else:
+                process, master_fd = await spawn_subprocess(script)
+            await wait_first_output(master_fd)
+            latencies.append(time.perf_counter() - started)
+            live.append((process, master_fd))
+
+        memory = [read_memory_kb(process.pid) for process, _ in live]
+        rss = [m[0] for m in memory]
+        pss = [m[1] for m in memory]
+        zygote_pss = read_memory_kb(spawner.process.pid)[1] if spawner else 0
+    finally:
+        for process, master_fd in live:
+            process.kill()
+        for process, master_fd in live:
+            await process.wait()
+            os.close(master_fd)
+        if spawner:
+            await spawner.close()
+
+    print(f"[{mode}] {sessions} sessions")
+    print(f"  spawn latency : {summarize_ms(latencies)}")
+    print(f"  RSS / session : {statistics.mean(rss) / 1024:7.1f} MiB")
+    print(f"  PSS / session : {statistics.mean(pss) / 1024:7.1f} MiB")
+    total = (sum(pss) + zygote_pss) / 1024
+    print(f"  PSS total     : {total:7.1f} MiB" + (" (zygote 本体を含む)" if spawner else ""))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="zygote vs create_subprocess_exec")
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--script', default=IDLE_SESSION,
+                        help="各セッションで実行するスクリプト (既定: benchmarks/idle_session.py)")
+    parser.add_argument('--mode', choices=("both", "subprocess", "zygote"), default="both")
+    args = parser.parse_args()
+
+    modes = ("subprocess", "zygote") if args.mode == "both" else (args.mode,)
+    for mode in modes:
+        await run(mode, args.script, args.sessions)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# ベンチマーク用のセッションプロセス。
+# curses の全画面再描画に近い出力 (カーソル移動、色、日本語を含む 80x24 の画面) を
+# YGG_FLOOD_FRAMES 枚、できるだけ速く書いて終了する (転送経路のスループット測定用)。
+
+import os
+import sys
+
+ROWS, COLS = 24, 80
+LABELS = ["ENEMY", "YOU", "戦闘ログ", "H-CODE", "ステータス", "COMMAND"]
+
+
+def frame(n):
+    parts = ["\x1b[H"]
+    for row in range(ROWS):
+        label = LABELS[(n + row) % len(LABELS)]
+        gauge = "#" * ((n + row) % 40)
+        parts.append(f"\x1b[{row + 1};1H\x1b[3{row % 8}m{label:>10} \x1b[0m[{gauge:<40}] {n:08d}\x1b[K")
+    return "".join(parts)
+
+
+def main():
+    frames = int(os.environ.get("YGG_FLOOD_FRAMES", 2000))
+    out = sys.stdout.buffer
+    for n in range(frames):
+        out.write(frame(n).encode("utf-8"))
+    out.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# ベンチマーク用のセッションプロセス。
+# オーケストレーターと同じアーカイブモジュールとデータファイルを読み込み、
+# 画面を 1 枚出力したあとは入力を待ち続ける (メモリ使用量の測定用)。
+
+import curses
+import json
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GAMES_DIR = os.path.join(PROJECT_ROOT, 'games')
+
+for path in (PROJECT_ROOT, GAMES_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import archive_combat
+import archive_social
+import cyborg_garage
+import archive_trade
+import archive_snipe
+import archive_next_war
+import archive_election
+import archive_mato_senki
+
+DATA_FILES = [
+    os.path.join(PROJECT_ROOT, 'game_data', 'kanata_dialogue.json'),
+    os.path.join(PROJECT_ROOT, 'game_design', 'h_code_sequence_dictionary.json'),
+    os.path.join(PROJECT_ROOT, 'game_design', 'next_war_h_codes.json'),
+]
+
+
+def main():
+    data = {}
+    for path in DATA_FILES:
+        with open(path, 'r', encoding='utf-8') as f:
+            data[path] = json.load(f)
+    sys.stdout.write("\x1b[2J\x1b[H--- YGGDRASIL CENTRAL CORE (bench) ---\r\n")
+    sys.stdout.flush()
+    while os.read(0, 1024):
+        pass
+
+
+if __name__ == "__main__":
+    main()
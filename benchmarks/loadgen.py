@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# WebSocket 負荷生成ツール
+# N 個の模擬クライアントを同時に接続し、実際のプレイに近いキー操作を送り続けて
+#   - キー入力 → 画面更新 (エコー) が届くまでのレイテンシ (p50/p95/p99)
+#   - スループット (送ったキー数/秒、受信メッセージ数/秒、受信バイト数/秒)
+#   - サーバー (とその子孫のゲームプロセス) の RSS の推移
+# を測り、JSON のレポートに書き出す。--compare で以前のレポートと並べて比較できる。
+#
+# プロトコルは URL のパスで選ぶ:
+#   /websocket : server.py 系。{"type":"input"} (--input binary ならバイナリの入力プロトコル) でキーを送る。WorldEngine の
+#                セーブデータ選択で Enter を押し、メインメニューを矢印キーで行き来する
+#                (メニューでは Enter を押さないので、セーブデータは書き換えない)。
+#   /ws        : app.py。'2' (戦闘開始) と '1' (攻撃) のテキストコマンドを送る。
+#
+# 使い方:
+#   サーバーもこのツールから起動する:
+#     python3 -m benchmarks.loadgen --server server.py --game ./yggdrasil_orchestrator.py --clients 50
+#   起動済みのサーバーに対して (RSS は --pid のプロセスツリーを測る):
+#     python3 -m benchmarks.loadgen --url ws://127.0.0.1:8765/websocket --pid 12345 --clients 50
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from benchmarks.bench_common import PROJECT_ROOT, percentile, read_memory_kb, summarize_ms
+from bridge.input_protocol import INPUT_PROTOCOL_VERSION, encode_input, encode_resize
+
+# curses (keypad) はアプリケーションカーソルモード (DECCKM) にするので、
+# ブラウザの xterm.js と同じく ESC O A / ESC O B を送る
+KEY_UP = '\x1bOA'
+KEY_DOWN = '\x1bOB'
+KEY_ENTER = '\r'
+
+# /websocket: 最初にセーブデータ選択で Enter、あとはメインメニューを上下に移動し続ける
+PTY_OPENING = [KEY_ENTER]
+PTY_LOOP = [KEY_DOWN, KEY_DOWN, KEY_DOWN, KEY_UP, KEY_UP, KEY_UP]
+
+# /ws: 戦闘を開始して攻撃し続ける
+TEXT_OPENING = ['2']
+TEXT_LOOP = ['1', '1', '1', '2']
+
+
+def protocol_for(url):
+    return 'text' if urlsplit(url).path.rstrip('/') == '/ws' else 'pty'
+
+
+def process_tree(pid):
+    """pid とその子孫プロセスの PID 一覧 (/proc の ppid をたどる)。"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # comm に空白や括弧が入っていてもよいように、最後の ')' の後ろを読む
+        ppid = int(stat[stat.rfind(')') + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, ()))
+    return tree
+
+
+class LoadStats:
+    """全クライアント共通の測定値。"""
+    def __init__(self):
+        self.latencies = []
+        self.keys_sent = 0
+        self.timeouts = 0
+        self.messages = 0
+        self.bytes = 0
+        self.connected = 0
+        self.failed = 0
+        self.disconnected = 0
+
+
+async def run_client(http, url, protocol, stats, deadline, think, timeout, winsize, binary_input):
+    """1 クライアント分。キーを送るたびに次のメッセージが届くまでの時間を測る。"""
+    opening, loop = (PTY_OPENING, PTY_LOOP) if protocol == 'pty' else (TEXT_OPENING, TEXT_LOOP)
+
+    async def send_key(key):
+        if protocol == 'text':
+            await ws.send_str(key)
+        elif binary_input:
+            await ws.send_bytes(encode_input(key))
+        else:
+            await ws.send_str(json.dumps({'type': 'input', 'data': key}))
+
+    async def receive(wait):
+        """wait 秒以内に届いたメッセージを受け取る。切断されたら False。"""
+        msg = await ws.receive(timeout=wait)
+        if msg.type not in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+            return False
+        stats.messages += 1
+        stats.bytes += len(msg.data)
+        return True
+
+    async def drain():
+        """遅れて届いた描画の続きを読み捨てる (次の測定に混ざらないように)。"""
+        while True:
+            try:
+                if not await receive(0.005):
+                    return False
+            except asyncio.TimeoutError:
+                return True
+
+    try:
+        ws = await http.ws_connect(url)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        stats.failed += 1
+        return
+    stats.connected += 1
+    try:
+        if protocol == 'pty':
+            rows, cols = winsize
+            if binary_input:
+                await ws.send_bytes(encode_resize(rows, cols))
+            else:
+                await ws.send_str(json.dumps({'type': 'resize', 'rows': rows, 'cols': cols}))
+        try:
+            # 最初の画面 (起動直後のタイトルやバナー)
+            if not await receive(timeout) or not await drain():
+                stats.disconnected += 1
+                return
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+
+        step = 0
+        while time.perf_counter() < deadline:
+            key = opening[step] if step < len(opening) else loop[(step - len(opening)) % len(loop)]
+            step += 1
+            started = time.perf_counter()
+            try:
+                await send_key(key)
+            except ConnectionResetError:
+                stats.disconnected += 1
+                return
+            stats.keys_sent += 1
+            try:
+                if not await receive(timeout):
+                    stats.disconnected += 1
+                    return
+                stats.latencies.append(time.perf_counter() - started)
+                if not await drain():
+                    stats.disconnected += 1
+                    return
+            except asyncio.TimeoutError:
+                stats.timeouts += 1
+            await asyncio.sleep(think)
+    finally:
+        await ws.close()
+
+
+async def sample_rss(pid, interval, samples, started):
+    """interval 秒ごとに pid のプロセスツリーの RSS / PSS 合計を記録する。"""
+    while True:
+        rss = pss = 0
+        tree = process_tree(pid)
+        for member in tree:
+            member_rss, member_pss = read_memory_kb(member)
+            rss += member_rss
+            pss += member_pss
+        samples.append({
+            't': round(time.perf_counter() - started, 2),
+            'processes': len(tree),
+            'rss_kb': rss,
+            'pss_kb': pss,
+        })
+        await asyncio.sleep(interval)
+
+
+async def wait_port(host, port, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{host}:{port} に接続できません")
+            await asyncio.sleep(0.2)
+            continue
+        writer.close()
+        await writer.wait_closed()
+        return
+
+
+async def start_server(script, port, game):
+    env = os.environ.copy()
+    env.update({'PORT': str(port), 'PYTHONUNBUFFERED': '1'})
+    if game:
+        env['YGG_GAME_SCRIPT'] = game
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, script, cwd=PROJECT_ROOT, env=env,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+        start_new_session=True
+    )
+    await wait_port('127.0.0.1', port, timeout=60)
+    return process
+
+
+async def stop_server(process):
+    os.killpg(process.pid, signal.SIGINT)
+    try:
+        await asyncio.wait_for(process.wait(), timeout=30)
+    except asyncio.TimeoutError:
+        os.killpg(process.pid, signal.SIGKILL)
+        await process.wait()
+
+
+async def run_load(args, url, protocol, pid):
+    stats = LoadStats()
+    rss_samples = []
+    started = time.perf_counter()
+    sampler = asyncio.create_task(sample_rss(pid, args.rss_interval, rss_samples, started)) if pid else None
+
+    deadline = started + args.ramp + args.duration
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as http:
+        async def delayed_client(index):
+            # ramp 秒かけて均等に接続していく
+            if args.clients > 1:
+                await asyncio.sleep(args.ramp * index / (args.clients - 1))
+            await run_client(http, url, protocol, stats, deadline, args.think / 1000,
+                             args.timeout, (args.rows, args.cols), args.input == 'binary')
+
+        await asyncio.gather(*(delayed_client(i) for i in range(args.clients)))
+    elapsed = time.perf_counter() - started
+
+    if sampler:
+        sampler.cancel()
+    return stats, rss_samples, elapsed
+
+
+def build_report(args, url, protocol, stats, rss_samples, elapsed):
+    ms = [v * 1000 for v in stats.latencies]
+    peak = max(rss_samples, key=lambda s: s['rss_kb'], default=None)
+    return {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {
+            'url': url,
+            'protocol': protocol,
+            'input': args.input,
+            'server': args.server,
+            'game': args.game,
+            'clients': args.clients,
+            'duration': args.duration,
+            'ramp': args.ramp,
+            'think_ms': args.think,
+            'cpu_count': os.cpu_count(),
+        },
+        'clients': {
+            'connected': stats.connected,
+            'failed': stats.failed,
+            'disconnected': stats.disconnected,
+        },
+        'latency_ms': {
+            'count': len(ms),
+            'timeouts': stats.timeouts,
+            'p50': round(percentile(ms, 50), 3),
+            'p95': round(percentile(ms, 95), 3),
+            'p99': round(percentile(ms, 99), 3),
+            'max': round(max(ms, default=0.0), 3),
+        },
+        'throughput': {
+            'elapsed': round(elapsed, 3),
+            'keys_per_sec': round(stats.keys_sent / elapsed, 1),
+            'messages_per_sec': round(stats.messages / elapsed, 1),
+            'bytes_per_sec': round(stats.bytes / elapsed, 1),
+        },
+        'rss': {
+            'peak_kb': peak['rss_kb'] if peak else None,
+            'peak_processes': peak['processes'] if peak else None,
+            'samples': rss_samples,
+        },
+    }
+
+
+def print_report(report, latencies):
+    config, clients, throughput = report['config'], report['clients'], report['throughput']
+    print(f"=== {config['url']} ({config['protocol']}, {config['clients']} クライアント) ===")
+    print(f"  接続      : 成功 {clients['connected']}, 失敗 {clients['failed']}, 途中切断 {clients['disconnected']}")
+    print(f"  エコー    : {summarize_ms(latencies)}  (タイムアウト {report['latency_ms']['timeouts']})")
+    print(f"  スループット: {throughput['keys_per_sec']:.1f} keys/s, "
+          f"{throughput['messages_per_sec']:.1f} msgs/s, {throughput['bytes_per_sec'] / 1024:.1f} KiB/s")
+    if report['rss']['peak_kb'] is not None:
+        print(f"  RSS (最大) : {report['rss']['peak_kb'] / 1024:.1f} MiB "
+              f"({report['rss']['peak_processes']} プロセス)")
+
+
+def print_comparison(report, baseline):
+    """以前のレポートとの差を表示する。"""
+    rows = [
+        ('p50 (ms)', ('latency_ms', 'p50')),
+        ('p95 (ms)', ('latency_ms', 'p95')),
+        ('p99 (ms)', ('latency_ms', 'p99')),
+        ('keys/s', ('throughput', 'keys_per_sec')),
+        ('msgs/s', ('throughput', 'messages_per_sec')),
+        ('RSS 最大 (kB)', ('rss', 'peak_kb')),
+    ]
+    print(f"=== 比較 (基準: {baseline['started_at']}, {baseline['config']['clients']} クライアント) ===")
+    for label, (section, key) in rows:
+        old, new = baseline[section].get(key), report[section].get(key)
+        if old is None or new is None:
+            continue
+        change = f"{(new - old) / old * 100:+6.1f}%" if old else "   n/a"
+        print(f"  {label:14s} {old:12.2f} -> {new:12.2f}  {change}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="WebSocket の負荷生成とキー入力→エコーのレイテンシ測定")
+    parser.add_argument('--url', help="接続先 (例: ws://127.0.0.1:8765/websocket)。省略時は --server を起動する")
+    parser.add_argument('--server', default='server.py', help="--url 省略時に起動するサーバースクリプト")
+    parser.add_argument('--game', help="起動するサーバーに渡す YGG_GAME_SCRIPT")
+    parser.add_argument('--port', type=int, default=8791, help="--server を起動するポート")
+    parser.add_argument('--pid', type=int, help="起動済みサーバーの PID (RSS の測定対象)")
+    parser.add_argument('--clients', type=int, default=20, help="同時接続クライアント数")
+    parser.add_argument('--duration', type=float, default=30.0, help="全員が接続してからの測定時間 (秒)")
+    parser.add_argument('--ramp', type=float, default=5.0, help="全クライアントが接続し終えるまでの時間 (秒)")
+    parser.add_argument('--think', type=float, default=200.0, help="キー入力の間隔 (ミリ秒)")
+    parser.add_argument('--timeout', type=float, default=5.0, help="エコー待ちのタイムアウト (秒)")
+    parser.add_argument('--input', choices=('json', 'binary'), default='json',
+                        help="/websocket へのキー入力の形式")
+    parser.add_argument('--rows', type=int, default=24)
+    parser.add_argument('--cols', type=int, default=80)
+    parser.add_argument('--rss-interval', type=float, default=1.0, help="RSS を測る間隔 (秒)")
+    parser.add_argument('--report', help="レポートの出力先 (既定: loadgen-<日時>.json)")
+    parser.add_argument('--compare', help="比較する以前のレポート")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        url, pid = args.url, args.pid
+    else:
+        path = '/ws' if os.path.basename(args.server) == 'app.py' else '/websocket'
+        url = f"ws://127.0.0.1:{args.port}{path}"
+        server = await start_server(args.server, args.port, args.game)
+        pid = server.pid
+    protocol = protocol_for(url)
+    if protocol == 'pty' and args.input == 'binary':
+        url += ('&' if '?' in url else '?') + f"input={INPUT_PROTOCOL_VERSION}"
+
+    try:
+        stats, rss_samples, elapsed = await run_load(args, url, protocol, pid)
+    finally:
+        if server:
+            await stop_server(server)
+
+    report = build_report(args, url, protocol, stats, rss_samples, elapsed)
+    print_report(report, stats.latencies)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            print_comparison(report, json.load(f))
+
+    path = args.report or time.strftime('loadgen-%Y%m%d-%H%M%S.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"レポートを {path} に書き出しました。")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
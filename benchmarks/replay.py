@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# 記録した入力の再生による性能の回帰テスト
+# benchmarks/traces/ の入力トレース (asciicast v2 の "i" と "r" イベント、bridge.recording の録画と同じ形式)
+# を、ブラウザなしでオーケストレーターに PTY 経由で流し込み、トレースごとに
+#   - 出力バイト数 / フレーム数 (サーバーと同じ OutputCoalescer でまとめた数)
+#   - ゲームプロセスの CPU 時間 / 経過時間
+# を測る。--compare で以前のレポートと比べ、しきい値を超えて悪化していれば終了コード 1 で終わる。
+#
+# ゲームはプロファイルを game_data/ に保存するため、スクリプトと games/ などは毎回
+# 一時ディレクトリにコピーしてから実行する (リポジトリのセーブデータは変わらない)。
+# 乱数の種は YGG_REPLAY_SEED で固定する。
+#
+# 使い方: python3 -m benchmarks.replay --report before.json
+#         (変更後) python3 -m benchmarks.replay --compare before.json --threshold cpu_seconds=20
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import signal
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_common import PROJECT_ROOT
+from bridge.coalesce import OutputCoalescer
+from bridge.pty_reader import PtyReader
+from bridge.spawn import set_winsize, spawn_session
+
+TRACES_DIR = os.path.join(PROJECT_ROOT, 'benchmarks', 'traces')
+DEFAULT_SCRIPTS = ['yggdrasil_orchestrator.py', 'yggdrasil_orchestrator_v2.py', 'yggdrasil_orchestrator_v4.py']
+
+# オーケストレーターと一緒に一時ディレクトリへコピーするもの
+SANDBOX_ITEMS = ('core_engine.py', 'games', 'game_data', 'game_design')
+
+# 比べる指標と、悪化とみなす増加率 (%) の既定値
+METRICS = [
+    ('bytes', "出力バイト数"),
+    ('frames', "フレーム数"),
+    ('cpu_seconds', "CPU 時間 (s)"),
+    ('wall_seconds', "経過時間 (s)"),
+]
+DEFAULT_THRESHOLDS = {'bytes': 5.0, 'frames': 10.0, 'cpu_seconds': 25.0, 'wall_seconds': 15.0}
+
+
+def load_trace(path):
+    """
+    asciicast v2 のファイルから (ヘッダー, [(秒, 種類, bytes), ...]) を読む。
+    再生に使うのはキー入力 ("i") とリサイズ ("r") だけ。
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        events = []
+        for line in f:
+            if not line.strip():
+                continue
+            at, kind, data = json.loads(line)
+            if kind in ('i', 'r'):
+                events.append((at, kind, data.encode('utf-8')))
+    return header, events
+
+
+def make_sandbox(script, directory):
+    """スクリプトと games/ などを directory にコピーし、コピーしたスクリプトのパスを返す。"""
+    ignore = shutil.ignore_patterns('__pycache__')
+    for name in SANDBOX_ITEMS:
+        source = os.path.join(PROJECT_ROOT, name)
+        if os.path.isdir(source):
+            shutil.copytree(source, os.path.join(directory, name), ignore=ignore)
+        elif os.path.exists(source):
+            shutil.copy2(source, directory)
+    target = os.path.join(directory, os.path.basename(script))
+    shutil.copy2(script, target)
+    return target
+
+
+class OutputMonitor:
+    """PTY 出力をサーバーと同じようにフレームにまとめて読み捨て、最後に出力があった時刻を覚える。"""
+    def __init__(self, master_fd):
+        self.reader = PtyReader(master_fd)
+        self.coalescer = OutputCoalescer(self.reader)
+        self.last_output = time.monotonic()
+        self.task = asyncio.create_task(self._pump())
+
+    async def _pump(self):
+        while await self.coalescer.read_frame():
+            self.last_output = time.monotonic()
+
+    @property
+    def ended(self):
+        return self.task.done()
+
+    async def settle(self, quiet, limit):
+        """出力が quiet 秒途切れるまで待つ (出力し続けるゲームのため、最大 limit 秒)。"""
+        deadline = time.monotonic() + limit
+        while not self.ended:
+            now = time.monotonic()
+            remaining = quiet - (now - self.last_output)
+            if remaining <= 0 or now >= deadline:
+                return
+            await asyncio.sleep(min(remaining, deadline - now))
+
+
+def _children_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def replay_once(script, header, events, args):
+    """トレースを 1 回再生して測定値を返す。"""
+    with tempfile.TemporaryDirectory(prefix="ygg-replay-") as sandbox:
+        target = make_sandbox(script, sandbox)
+        env = dict(os.environ, YGG_REPLAY_SEED=str(args.seed))
+        rows, cols = header.get('height', 24), header.get('width', 80)
+        cpu_before = _children_cpu_seconds()
+        started = time.monotonic()
+        process, master_fd = await spawn_session(target, rows=rows, cols=cols, env=env)
+        monitor = OutputMonitor(master_fd)
+        sent = 0
+        killed = False
+        try:
+            for at, kind, data in events:
+                # 記録時の間隔 (--speed で短縮) と、前の入力への出力が落ち着くまでの両方を待つ
+                delay = started + at / args.speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await monitor.settle(args.settle / 1000, args.settle_limit)
+                if monitor.ended:
+                    break  # トレースの途中でゲームが終了した
+                if kind == 'i':
+                    os.write(master_fd, data)
+                    monitor.coalescer.note_input()
+                else:
+                    cols, _, rows = data.decode().partition('x')
+                    set_winsize(master_fd, int(rows), int(cols))
+                sent += 1
+            try:
+                await asyncio.wait_for(process.wait(), args.exit_timeout)
+            except asyncio.TimeoutError:
+                # トレースの最後まで入力しても終了しなかった
+                killed = True
+                os.killpg(process.pid, signal.SIGKILL)
+                await process.wait()
+            await monitor.task
+        finally:
+            monitor.reader.close()
+            os.close(master_fd)
+        wall = time.monotonic() - started
+        stats = monitor.coalescer.stats
+        return {
+            'bytes': stats.bytes,
+            'frames': stats.frames,
+            'cpu_seconds': round(_children_cpu_seconds() - cpu_before, 4),
+            'wall_seconds': round(wall, 4),
+            'returncode': process.returncode,
+            'inputs_sent': sent,
+            'inputs_total': len(events),
+            'killed': killed,
+        }
+
+
+async def replay(script, trace_path, args):
+    """--repeat 回再生し、指標ごとの中央値をとる。"""
+    header, events = load_trace(trace_path)
+    runs = [await replay_once(script, header, events, args) for _ in range(args.repeat)]
+    result = dict(runs[-1])
+    for key, _ in METRICS:
+        result[key] = statistics.median(run[key] for run in runs)
+    return result
+
+
+def status_text(result):
+    if result['killed']:
+        return "終了せず (強制終了)"
+    if result['inputs_sent'] < result['inputs_total']:
+        return f"途中で終了 (入力 {result['inputs_sent']}/{result['inputs_total']}, exit {result['returncode']})"
+    return f"exit {result['returncode']}"
+
+
+def print_results(results):
+    for script, traces in results.items():
+        print(f"=== {script} ===")
+        for name, result in traces.items():
+            print(f"  {name:16s} {result['bytes']:9.0f} bytes  {result['frames']:6.0f} frames  "
+                  f"CPU {result['cpu_seconds']:7.3f}s  wall {result['wall_seconds']:7.2f}s  "
+                  f"{status_text(result)}")
+
+
+def compare(results, baseline, thresholds):
+    """以前のレポートとの差を表示し、しきい値を超えた悪化のリストを返す。"""
+    regressions = []
+    print(f"=== 比較 (基準: {baseline['started_at']}) ===")
+    for script, traces in results.items():
+        for name, result in traces.items():
+            old = baseline['results'].get(script, {}).get(name)
+            if old is None:
+                print(f"  {script} / {name}: 基準なし")
+                continue
+            print(f"  {script} / {name}")
+            for key, label in METRICS:
+                before, after = old[key], result[key]
+                change = (after - before) / before * 100 if before else (0.0 if after == before else float('inf'))
+                mark = ""
+                if change > thresholds[key]:
+                    mark = f"  << 悪化 (しきい値 {thresholds[key]:g}%)"
+                    regressions.append(f"{script} / {name}: {label} {change:+.1f}%")
+                print(f"    {label:14s} {before:12.3f} -> {after:12.3f}  {change:+7.1f}%{mark}")
+            # 以前は最後まで再生して正常終了していたのに、そうでなくなった
+            was_ok = old['returncode'] == 0 and old['inputs_sent'] == old['inputs_total'] and not old['killed']
+            is_ok = result['returncode'] == 0 and result['inputs_sent'] == result['inputs_total'] and not result['killed']
+            if was_ok and not is_ok:
+                print(f"    状態           {status_text(old)} -> {status_text(result)}  << 悪化")
+                regressions.append(f"{script} / {name}: {status_text(result)}")
+    return regressions
+
+
+def parse_thresholds(values):
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    for value in values:
+        key, _, pct = value.partition('=')
+        if key not in thresholds:
+            raise SystemExit(f"不明な指標です: {key} ({', '.join(thresholds)})")
+        thresholds[key] = float(pct)
+    return thresholds
+
+
+def find_traces(names):
+    if not names:
+        return sorted(os.path.join(TRACES_DIR, n) for n in os.listdir(TRACES_DIR) if n.endswith('.cast'))
+    return [n if os.path.exists(n) else os.path.join(TRACES_DIR, n + '.cast') for n in names]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="入力トレースの再生による性能の回帰テスト")
+    parser.add_argument('scripts', nargs='*', default=DEFAULT_SCRIPTS, help="再生先のオーケストレーター")
+    parser.add_argument('--trace', action='append', default=[],
+                        help="再生するトレース (名前または .cast のパス、複数可。既定は benchmarks/traces/ の全部)")
+    parser.add_argument('--repeat', type=int, default=1, help="各トレースの再生回数 (中央値をとる)")
+    parser.add_argument('--speed', type=float, default=1.0, help="記録時の入力間隔を何倍速で再生するか")
+    parser.add_argument('--settle', type=float, default=50.0, help="次の入力の前に出力が途切れるのを待つ時間 (ミリ秒)")
+    parser.add_argument('--settle-limit', type=float, default=2.0, help="出力が途切れない時に待つ上限 (秒)")
+    parser.add_argument('--exit-timeout', type=float, default=10.0, help="最後の入力のあと終了を待つ時間 (秒)")
+    parser.add_argument('--seed', type=int, default=1, help="ゲームの乱数の種")
+    parser.add_argument('--threshold', action='append', default=[], metavar='METRIC=PCT',
+                        help="悪化とみなす増加率 (例: cpu_seconds=20)。既定: " +
+                             ", ".join(f"{k}={v:g}" for k, v in DEFAULT_THRESHOLDS.items()))
+    parser.add_argument('--report', help="レポートの出力先 (既定: replay-<日時>.json)")
+    parser.add_argument('--compare', help="比較する以前のレポート")
+    args = parser.parse_args()
+    thresholds = parse_thresholds(args.threshold)
+
+    started_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+    results = {}
+    for script in args.scripts:
+        results[script] = {}
+        for trace_path in find_traces(args.trace):
+            name = os.path.splitext(os.path.basename(trace_path))[0]
+            results[script][name] = await replay(os.path.join(PROJECT_ROOT, script), trace_path, args)
+    print_results(results)
+
+    report = {
+        'started_at': started_at,
+        'config': {key: getattr(args, key) for key in ('repeat', 'speed', 'settle', 'seed')},
+        'results': results,
+    }
+    path = args.report or time.strftime('replay-%Y%m%d-%H%M%S.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"レポートを {path} に書き出しました。")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), thresholds)
+        if regressions:
+            print(f"性能の悪化が {len(regressions)} 件あります:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("しきい値を超える悪化はありません。")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
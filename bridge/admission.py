@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: 入場制御と待合室
+# DESCRIPTION: 新しいゲームプロセスを起動してよいかを、同時セッション数・起動レート・
+#              メモリと CPU の余裕から判断する。上限を超えた接続は待合室に並ばせて順番を知らせ、
+#              既にプレイ中のセッションの応答性を優先する。
+
+import asyncio
+import os
+import time
+from collections import deque
+
+from aiohttp import WSCloseCode
+
+from bridge.deflate import ClientConnectionResetError
+from bridge.input_protocol import decode_resize
+
+WAITING_MESSAGE = "\x1b[H\x1b[2J\x1b[0mサーバーが混み合っています。順番をお待ちください... (待ち順: {position} 番目)\r\n"
+FULL_MESSAGE = "\x1b[0m\r\nサーバーが満員です。しばらくしてから接続し直してください。\r\n"
+DRAINING_MESSAGE = "\x1b[0m\r\nサーバーを更新しています。しばらくしてから接続し直してください。\r\n"
+
+
+class AdmissionRejected(Exception):
+    """待合室も満員で、並ぶこともできない。"""
+
+
+def _read_meminfo_available_mb():
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _read_cgroup_available_mb():
+    """cgroup v2 のメモリ上限があれば、上限 - 使用量 (コンテナ内ではこちらが実際の余裕)。"""
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            limit = f.read().strip()
+        if limit == "max":
+            return None
+        with open("/sys/fs/cgroup/memory.current") as f:
+            current = int(f.read().strip())
+        return (int(limit) - current) / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_cpu_times():
+    """/proc/stat の合計 CPU 時間 (busy, total) を jiffies で返す。"""
+    try:
+        with open("/proc/stat") as f:
+            fields = [int(v) for v in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0)  # idle + iowait
+    total = sum(fields[:8])
+    return total - idle, total
+
+
+class AdmissionController:
+    """
+    セッションの入場制御。
+
+    次の条件をすべて満たす時だけ新しいセッションを入れる:
+      - 同時セッション数 (切り離し中も含む) が max_sessions 未満 (0 なら無制限)
+      - 起動レートのトークンバケットに残りがある (spawn_rate 個/秒、最大 spawn_burst 個)
+      - 空きメモリが min_memory_mb 以上 (cgroup の上限があればそちらを優先)
+      - CPU 使用率が max_cpu_percent 未満
+
+    満たせない間、接続は待合室 (FIFO) に並ぶ。待合室が max_waiting 人を超えたら断る。
+    再接続 (既存セッションへの復帰) はここを通らないので、混雑時もプレイ中のプレイヤーは待たされない。
+    """
+    # 環境変数で調整できる
+    MAX_SESSIONS = int(os.environ.get("YGG_MAX_SESSIONS", 0))
+    SPAWN_RATE = float(os.environ.get("YGG_SPAWN_RATE", 10))
+    SPAWN_BURST = int(os.environ.get("YGG_SPAWN_BURST", 20))
+    MIN_MEMORY_MB = float(os.environ.get("YGG_MIN_MEMORY_MB", 128))
+    MAX_CPU_PERCENT = float(os.environ.get("YGG_MAX_CPU_PERCENT", 95))
+    MAX_WAITING = int(os.environ.get("YGG_WAITING_ROOM_MAX", 100))
+    SAMPLE_INTERVAL = 1.0
+    DISPATCH_INTERVAL = 0.1
+
+    def __init__(self, registry, max_sessions=None, spawn_rate=None, spawn_burst=None,
+                 min_memory_mb=None, max_cpu_percent=None, max_waiting=None):
+        """
+        Args:
+            registry (SessionRegistry): 現在のセッション数を数える対象。
+        """
+        self.registry = registry
+        self.max_sessions = self.MAX_SESSIONS if max_sessions is None else max_sessions
+        self.spawn_rate = self.SPAWN_RATE if spawn_rate is None else spawn_rate
+        self.spawn_burst = self.SPAWN_BURST if spawn_burst is None else spawn_burst
+        self.min_memory_mb = self.MIN_MEMORY_MB if min_memory_mb is None else min_memory_mb
+        self.max_cpu_percent = self.MAX_CPU_PERCENT if max_cpu_percent is None else max_cpu_percent
+        self.max_waiting = self.MAX_WAITING if max_waiting is None else max_waiting
+
+        self.memory_available_mb = None
+        self.cpu_percent = 0.0
+        self._tokens = float(self.spawn_burst)
+        self._refilled_at = time.monotonic()
+        self._spawning = 0
+        self._waiters = deque()
+        self._dispatcher = None
+        self._sampler = None
+        self._cpu_times = None
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.max_queue = 0
+        self.last_block_reason = None
+        # サーバーの停止中 (DrainController が設定する) は誰も入場させない
+        self.draining = False
+
+    async def start(self):
+        self._sample()
+        self._sampler = asyncio.create_task(self._sample_loop())
+
+    async def close(self):
+        for task in (self._sampler, self._dispatcher):
+            if task:
+                task.cancel()
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    def _sample(self):
+        available = [v for v in (_read_meminfo_available_mb(), _read_cgroup_available_mb()) if v is not None]
+        self.memory_available_mb = min(available) if available else None
+        times = _read_cpu_times()
+        if times and self._cpu_times:
+            busy = times[0] - self._cpu_times[0]
+            total = times[1] - self._cpu_times[1]
+            if total > 0:
+                self.cpu_percent = 100.0 * busy / total
+        self._cpu_times = times
+
+    async def _sample_loop(self):
+        while True:
+            await asyncio.sleep(self.SAMPLE_INTERVAL)
+            self._sample()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.spawn_burst, self._tokens + (now - self._refilled_at) * self.spawn_rate)
+        self._refilled_at = now
+
+    def block_reason(self):
+        """今すぐ入場できない理由 (入場できるなら None)。"""
+        if self.draining:
+            return "draining"
+        if self.max_sessions and len(self.registry) + self._spawning >= self.max_sessions:
+            return "sessions"
+        self._refill()
+        if self.spawn_rate > 0 and self._tokens < 1:
+            return "spawn_rate"
+        if self.memory_available_mb is not None and self.memory_available_mb < self.min_memory_mb:
+            return "memory"
+        if self.cpu_percent >= self.max_cpu_percent:
+            return "cpu"
+        return None
+
+    def _grant(self):
+        if self.spawn_rate > 0:
+            self._tokens -= 1
+        self._spawning += 1
+        self.admitted += 1
+
+    def try_admit(self):
+        """待たずに入場できるなら枠を確保して True を返す。"""
+        if self._waiters:
+            return False
+        reason = self.block_reason()
+        if reason is not None:
+            self.last_block_reason = reason
+            return False
+        self._grant()
+        return True
+
+    def describe(self):
+        return (f"max_sessions={self.max_sessions or '無制限'}, "
+                f"spawn_rate={self.spawn_rate:g}/s (burst {self.spawn_burst}), "
+                f"min_memory={self.min_memory_mb:g} MiB, max_cpu={self.max_cpu_percent:g}%, "
+                f"waiting_room={self.max_waiting}")
+
+    def spawned(self):
+        """admit() で入場したセッションの起動が終わった (または中止した) 時に呼ぶ。"""
+        self._spawning -= 1
+
+    def _renumber(self):
+        for position, waiter in enumerate(self._waiters, 1):
+            waiter['position'] = position
+
+    async def _dispatch(self):
+        try:
+            while self._waiters:
+                while self._waiters:
+                    reason = self.block_reason()
+                    if reason:
+                        self.last_block_reason = reason
+                        break
+                    waiter = self._waiters.popleft()
+                    self._grant()
+                    waiter['admitted'].set_result(None)
+                self._renumber()
+                await asyncio.sleep(self.DISPATCH_INTERVAL)
+        finally:
+            self._dispatcher = None
+
+    async def admit(self, on_position=None):
+        """
+        入場できるまで待つ。戻ったら呼び出し側はセッションを起動し、spawned() を呼ぶこと。
+
+        Args:
+            on_position: 待ち順が変わるたびに await される関数 (引数は 1 始まりの順番)。
+        Raises:
+            AdmissionRejected: 待合室が満員。
+        """
+        if self.try_admit():
+            return
+        if self.draining:
+            self.rejected += 1
+            raise AdmissionRejected("サーバーを停止中です")
+        if len(self._waiters) >= self.max_waiting:
+            self.rejected += 1
+            raise AdmissionRejected(f"待合室が満員です ({len(self._waiters)} 人)")
+
+        waiter = {'admitted': asyncio.get_running_loop().create_future(), 'position': None}
+        self._waiters.append(waiter)
+        self._renumber()
+        self.queued += 1
+        self.max_queue = max(self.max_queue, len(self._waiters))
+        print(f"待合室: {len(self._waiters)} 人待ち (理由: {self.last_block_reason})")
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        reported = None
+        try:
+            while not waiter['admitted'].done():
+                if on_position and waiter['position'] != reported:
+                    reported = waiter['position']
+                    await on_position(reported)
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter['admitted']), timeout=0.5)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            admitted = waiter['admitted']
+            if not admitted.done():
+                admitted.cancel()
+                self._waiters.remove(waiter)
+                self._renumber()
+            elif not admitted.cancelled() and admitted.exception() is None:
+                self.spawned()  # 入場が決まった直後に切断された
+            raise
+
+    def reject_waiting(self, reason):
+        """待合室に並んでいる全員を AdmissionRejected で帰す (サーバーの停止時)。"""
+        waiters, self._waiters = self._waiters, deque()
+        for waiter in waiters:
+            if not waiter['admitted'].done():
+                waiter['admitted'].set_exception(AdmissionRejected(reason))
+                self.rejected += 1
+
+    def summary(self):
+        return (f"admitted {self.admitted}, queued {self.queued}, rejected {self.rejected}, "
+                f"waiting {self.waiting} (max {self.max_queue}), "
+                f"mem {self.memory_available_mb or 0:.0f} MiB, cpu {self.cpu_percent:.0f}%")
+
+
+async def wait_for_admission(admission, ws, sender):
+    """
+    WebSocket の接続を入場させる。待つ間は待ち順を端末に表示し、切断されたら列から抜ける。
+
+    Returns:
+        tuple: (入場できたか, 待っている間に届いた最後のリサイズ要求 (rows, cols) または None)
+    """
+    if admission.try_admit():
+        return True, None
+    last_resize = None
+
+    async def show_position(position):
+        # 待っている間に切断したクライアントには送らない (列から抜けるのは watch_client() で分かる)
+        if ws.closed:
+            return
+        try:
+            await sender.send(WAITING_MESSAGE.format(position=position).encode('utf-8'))
+        except (ConnectionResetError, ClientConnectionResetError):
+            pass
+
+    async def watch_client():
+        nonlocal last_resize
+        async for msg in ws:
+            size = decode_resize(msg)
+            if size is not None:
+                last_resize = size
+        # ここに来たらクライアントが切断した
+
+    admit_task = asyncio.create_task(admission.admit(show_position))
+    watch_task = asyncio.create_task(watch_client())
+    try:
+        await asyncio.wait({admit_task, watch_task}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watch_task.cancel()
+    if not admit_task.done():
+        admit_task.cancel()
+        try:
+            await admit_task
+        except asyncio.CancelledError:
+            pass
+        return False, None
+
+    try:
+        admit_task.result()
+    except AdmissionRejected as e:
+        print(f"入場を断りました: {e}")
+        message = DRAINING_MESSAGE if admission.draining else FULL_MESSAGE
+        if not ws.closed:
+            try:
+                await sender.send(message.encode('utf-8'))
+                await ws.close(code=WSCloseCode.TRY_AGAIN_LATER, message=b'server full')
+            except (ConnectionResetError, ClientConnectionResetError):
+                pass  # 断られる前にクライアントが切断していた
+        return False, None
+    if ws.closed:
+        admission.spawned()
+        return False, None
+    return True, last_resize
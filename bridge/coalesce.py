@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: 出力フレームの結合 (コアレッシング)
+# DESCRIPTION: curses の再描画で細切れに届く PTY 出力を、フラッシュ窓ごとに
+#              1 つの WebSocket フレームへまとめる。
+
+import asyncio
+import os
+import time
+
+
+class FrameStats:
+    """
+    送出したフレーム数とバイト数を数え、frames/sec と bytes/frame を算出する。
+    """
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.frames = 0
+        self.bytes = 0
+        self.reads = 0
+
+    def add_frame(self, size, reads):
+        self.frames += 1
+        self.bytes += size
+        self.reads += reads
+
+    def merge(self, other):
+        self.frames += other.frames
+        self.bytes += other.bytes
+        self.reads += other.reads
+
+    @property
+    def frames_per_sec(self):
+        elapsed = time.monotonic() - self.started_at
+        return self.frames / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def bytes_per_frame(self):
+        return self.bytes / self.frames if self.frames else 0.0
+
+    def summary(self):
+        return (f"{self.frames} frames, {self.frames_per_sec:.1f} frames/sec, "
+                f"{self.bytes_per_frame:.0f} bytes/frame "
+                f"({self.reads} PTY reads -> {self.frames} frames)")
+
+
+# 全セッション合計 (切断されたセッションの統計もここへ積算する)
+TOTAL_STATS = FrameStats()
+
+
+class OutputCoalescer:
+    """
+    PtyReader から最初の出力が届いたら、フラッシュ窓の間だけ続きを待ち、
+    その間に届いた出力を 1 フレームにまとめて返す。
+
+    窓の幅は状況に合わせて MIN_WINDOW〜MAX_WINDOW の間で変化する:
+      - キー入力の直後 (INPUT_GRACE 秒以内) は MIN_WINDOW に固定し、エコーを急ぐ
+      - BULK_FRAME_BYTES 以上の大きなフレームが続くと倍々に広げる (画面全体の再描画)
+      - 小さなフレームが続くと半分ずつ狭める
+    """
+    # 環境変数 YGG_COALESCE_MIN_MS / YGG_COALESCE_MAX_MS で調整できる
+    MIN_WINDOW = float(os.environ.get("YGG_COALESCE_MIN_MS", 4)) / 1000
+    MAX_WINDOW = float(os.environ.get("YGG_COALESCE_MAX_MS", 16)) / 1000
+    INPUT_GRACE = 0.05
+    BULK_FRAME_BYTES = 2048
+
+    def __init__(self, reader, min_window=None, max_window=None):
+        """
+        Args:
+            reader (PtyReader): 出力元のリーダー。
+            min_window (float): フラッシュ窓の下限 (秒)。省略時は MIN_WINDOW。
+            max_window (float): フラッシュ窓の上限 (秒)。省略時は MAX_WINDOW。
+        """
+        self.reader = reader
+        self.min_window = min_window if min_window is not None else self.MIN_WINDOW
+        self.max_window = max_window if max_window is not None else self.MAX_WINDOW
+        self.window = self.min_window
+        self.stats = FrameStats()
+        self._last_input = 0.0
+        self._reads_seen = 0
+
+    def note_input(self):
+        """クライアントからのキー入力を PTY に書いた時に呼ぶ。"""
+        self._last_input = time.monotonic()
+
+    def _typing(self):
+        return time.monotonic() - self._last_input < self.INPUT_GRACE
+
+    def _adapt(self, frame_size):
+        if self._typing():
+            self.window = self.min_window
+        elif frame_size >= self.BULK_FRAME_BYTES:
+            self.window = min(self.window * 2, self.max_window)
+        else:
+            self.window = max(self.window / 2, self.min_window)
+
+    async def read_frame(self):
+        """
+        次の 1 フレーム分の出力を返す。
+
+        Returns:
+            bytes: まとめた出力。EOF なら b''。
+        """
+        data = await self.reader.read()
+        if not data:
+            return b''
+
+        parts = [data]
+        if not self.reader.at_eof:
+            window = self.min_window if self._typing() else self.window
+            await asyncio.sleep(window)
+            more = self.reader.read_nowait()
+            if more:
+                parts.append(more)
+
+        frame = parts[0] if len(parts) == 1 else b''.join(parts)
+        reads = self.reader.read_count - self._reads_seen
+        self._reads_seen = self.reader.read_count
+        self.stats.add_frame(len(frame), reads)
+        self._adapt(len(frame))
+        return frame
+
+    def close(self):
+        """このセッションの統計を全体合計へ積算する。"""
+        TOTAL_STATS.merge(self.stats)
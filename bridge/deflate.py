@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: permessage-deflate の調整
+# DESCRIPTION: aiohttp 標準の圧縮 (レベル 1 固定、全フレーム圧縮) の代わりに、
+#              圧縮レベル・ウィンドウサイズ・コンテキスト引き継ぎ・最小フレームサイズを
+#              設定でき、セッションごとの圧縮率と CPU 時間を記録する WebSocketResponse。
+#              aiohttp の内部 API (WebSocketWriter._write_websocket_frame など) に依存するので、
+#              requirements.txt で動作を確かめた版に固定している。見つからない版では差し替えず、
+#              aiohttp 標準の圧縮 (compress=True) で動く。
+
+import asyncio
+import os
+import time
+import zlib
+
+from aiohttp import WSMsgType, hdrs, web
+
+try:
+    from aiohttp.http_websocket import WebSocketWriter, ws_ext_gen
+except ImportError:
+    WebSocketWriter = object  # _DeflateWriter は使われない (DEFLATE_HOOKS_AVAILABLE が False)
+    ws_ext_gen = None
+try:
+    from aiohttp.client_exceptions import ClientConnectionResetError
+except ImportError:  # aiohttp < 3.10
+    ClientConnectionResetError = ConnectionResetError
+
+# 圧縮の差し替えに使う aiohttp の内部 API。クラスにあるものは import 時に、
+# インスタンスの属性は _pre_start() で作られた writer / protocol を見て確かめる
+_RESPONSE_HOOKS = ('_handshake', '_pre_start')
+_WRITER_ATTRS = ('_write_websocket_frame', '_output_size', '_limit', 'compress', 'notakeover')
+_PROTOCOL_ATTRS = ('_paused', '_drain_helper')
+DEFLATE_HOOKS_AVAILABLE = (ws_ext_gen is not None
+                           and all(hasattr(web.WebSocketResponse, name) for name in _RESPONSE_HOOKS))
+
+# 圧縮メッセージの末尾に付く 0x00 0x00 0xff 0xff は送らない (RFC 7692 7.2.1)
+DEFLATE_TRAILING = b'\x00\x00\xff\xff'
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, default).lower() in ("1", "true", "yes")
+
+
+class DeflateSettings:
+    """
+    圧縮の設定。環境変数で既定値を変えられる:
+      YGG_DEFLATE           0 で permessage-deflate を無効化
+      YGG_DEFLATE_LEVEL     zlib の圧縮レベル (1〜9)
+      YGG_DEFLATE_WBITS     サーバー側のウィンドウサイズ (9〜15)
+      YGG_DEFLATE_TAKEOVER  0 でメッセージごとに辞書をリセット (server_no_context_takeover)
+      YGG_DEFLATE_MIN_BYTES これより小さいフレームは圧縮せずに送る
+    """
+    ENABLED = _env_flag("YGG_DEFLATE", "1")
+    LEVEL = int(os.environ.get("YGG_DEFLATE_LEVEL", 6))
+    WBITS = int(os.environ.get("YGG_DEFLATE_WBITS", 15))
+    CONTEXT_TAKEOVER = _env_flag("YGG_DEFLATE_TAKEOVER", "1")
+    MIN_BYTES = int(os.environ.get("YGG_DEFLATE_MIN_BYTES", 64))
+
+    def __init__(self, enabled=None, level=None, wbits=None, context_takeover=None, min_bytes=None):
+        self.enabled = self.ENABLED if enabled is None else enabled
+        self.level = self.LEVEL if level is None else level
+        self.wbits = self.WBITS if wbits is None else wbits
+        self.context_takeover = self.CONTEXT_TAKEOVER if context_takeover is None else context_takeover
+        self.min_bytes = self.MIN_BYTES if min_bytes is None else min_bytes
+        if not 9 <= self.wbits <= 15:
+            raise ValueError(f"wbits は 9〜15 で指定してください: {self.wbits}")
+
+    def describe(self):
+        if not self.enabled:
+            return "permessage-deflate 無効"
+        if not DEFLATE_HOOKS_AVAILABLE:
+            return "aiohttp 標準の圧縮 (この aiohttp では圧縮の設定を反映できません)"
+        return (f"level={self.level}, wbits={self.wbits}, "
+                f"context_takeover={'on' if self.context_takeover else 'off'}, "
+                f"min_bytes={self.min_bytes}")
+
+
+class DeflateStats:
+    """
+    送信データフレームの圧縮前後のバイト数と、圧縮に使った CPU 時間を数える。
+    """
+    def __init__(self):
+        self.compressed_frames = 0
+        self.skipped_frames = 0
+        self.raw_bytes = 0
+        self.wire_bytes = 0
+        self.cpu_seconds = 0.0
+
+    def add_compressed(self, raw_size, wire_size, cpu_seconds):
+        self.compressed_frames += 1
+        self.raw_bytes += raw_size
+        self.wire_bytes += wire_size
+        self.cpu_seconds += cpu_seconds
+
+    def add_skipped(self, size):
+        self.skipped_frames += 1
+        self.raw_bytes += size
+        self.wire_bytes += size
+
+    def merge(self, other):
+        self.compressed_frames += other.compressed_frames
+        self.skipped_frames += other.skipped_frames
+        self.raw_bytes += other.raw_bytes
+        self.wire_bytes += other.wire_bytes
+        self.cpu_seconds += other.cpu_seconds
+
+    @property
+    def ratio(self):
+        """圧縮後 / 圧縮前 (小さいほど良い)。"""
+        return self.wire_bytes / self.raw_bytes if self.raw_bytes else 1.0
+
+    @property
+    def cpu_us_per_kb(self):
+        return self.cpu_seconds * 1e6 / (self.raw_bytes / 1024) if self.raw_bytes else 0.0
+
+    def summary(self):
+        return (f"{self.raw_bytes} -> {self.wire_bytes} bytes (ratio {self.ratio:.3f}), "
+                f"{self.compressed_frames} compressed / {self.skipped_frames} uncompressed frames, "
+                f"CPU {self.cpu_seconds * 1000:.1f} ms ({self.cpu_us_per_kb:.1f} us/KB)")
+
+
+# 全セッション合計
+TOTAL_DEFLATE_STATS = DeflateStats()
+
+
+class _DeflateWriter(WebSocketWriter):
+    """
+    データフレームを自前の compressobj で圧縮する WebSocketWriter。
+    制御フレームと圧縮を使わない接続は aiohttp の実装にそのまま任せる。
+    """
+    def __init__(self, protocol, transport, *, settings, stats, compress, notakeover, limit):
+        super().__init__(protocol, transport, compress=compress, notakeover=notakeover, limit=limit)
+        self.settings = settings
+        self.stats = stats
+        self._flush_mode = zlib.Z_FULL_FLUSH if notakeover else zlib.Z_SYNC_FLUSH
+        self._deflate = zlib.compressobj(settings.level, zlib.DEFLATED, -compress) if compress else None
+
+    async def send_frame(self, message, opcode, compress=None):
+        if self._deflate is None or opcode >= WSMsgType.CLOSE:
+            await super().send_frame(message, opcode, compress)
+            return
+        if self._closing:
+            raise ClientConnectionResetError("Cannot write to closing transport")
+
+        # 圧縮は同期的に行う (await を挟まないので、辞書の状態とフレームの順序がずれない)
+        if len(message) < self.settings.min_bytes:
+            self._write_websocket_frame(message, opcode, 0)
+            self.stats.add_skipped(len(message))
+        else:
+            started = time.thread_time()
+            payload = self._deflate.compress(message) + self._deflate.flush(self._flush_mode)
+            payload = payload.removesuffix(DEFLATE_TRAILING)
+            self.stats.add_compressed(len(message), len(payload), time.thread_time() - started)
+            self._write_websocket_frame(payload, opcode, 0x40)  # RSV1 = 圧縮済み
+
+        if self._output_size > self._limit:
+            self._output_size = 0
+            if self.protocol._paused:
+                await self.protocol._drain_helper()
+
+
+class DeflateWebSocketResponse(web.WebSocketResponse):
+    """
+    DeflateSettings に従って permessage-deflate を交渉・適用する WebSocketResponse。
+    クライアントが拡張を提示しなかった場合は、通常どおり非圧縮で送る。
+
+    また、クローズフレームなしで消えたクライアント (回線断やスリープ) を TCP のタイムアウトより
+    ずっと早く見つけるため、ハートビートの ping を送る。環境変数で調整できる:
+      YGG_WS_HEARTBEAT_SEC     何も受信しない状態がこの秒数続いたら ping を送る (0 で無効)
+      YGG_WS_PONG_TIMEOUT_SEC  ping からこの秒数以内に pong が来なければ切断する
+    """
+    HEARTBEAT = float(os.environ.get("YGG_WS_HEARTBEAT_SEC", 10))
+    PONG_TIMEOUT = float(os.environ.get("YGG_WS_PONG_TIMEOUT_SEC", 5))
+
+    def __init__(self, *args, settings=None, **kwargs):
+        self.deflate_settings = settings or DeflateSettings()
+        self.deflate_stats = DeflateStats()
+        kwargs['compress'] = self.deflate_settings.enabled
+        kwargs.setdefault('heartbeat', self.HEARTBEAT or None)
+        super().__init__(*args, **kwargs)
+        if kwargs['heartbeat'] and hasattr(self, '_pong_heartbeat'):
+            # aiohttp の既定は heartbeat の半分
+            self._pong_heartbeat = self.PONG_TIMEOUT
+
+    @property
+    def peer_timed_out(self):
+        """ハートビートの pong が返らず、こちらから切断した (相手が黙って消えた) か。"""
+        return isinstance(self.exception(), asyncio.TimeoutError)
+
+    def _handshake(self, request):
+        result = super()._handshake(request)
+        if not DEFLATE_HOOKS_AVAILABLE or len(result) != 4:
+            return result
+        headers, protocol, compress, notakeover = result
+        if compress:
+            # クライアントが server_max_window_bits を指定していればその範囲で、こちらの設定を使う
+            compress = min(compress, self.deflate_settings.wbits)
+            notakeover = notakeover or not self.deflate_settings.context_takeover
+            headers[hdrs.SEC_WEBSOCKET_EXTENSIONS] = ws_ext_gen(
+                compress=compress, isserver=True, server_notakeover=notakeover)
+        return headers, protocol, compress, notakeover
+
+    def _pre_start(self, request):
+        protocol, writer = super()._pre_start(request)
+        if not (DEFLATE_HOOKS_AVAILABLE
+                and all(hasattr(writer, name) for name in _WRITER_ATTRS)
+                and all(hasattr(writer.protocol, name) for name in _PROTOCOL_ATTRS)):
+            return protocol, writer  # aiohttp 標準の writer のまま (圧縮レベル 1)
+        writer = _DeflateWriter(
+            writer.protocol, writer.transport,
+            settings=self.deflate_settings, stats=self.deflate_stats,
+            compress=writer.compress, notakeover=writer.notakeover, limit=writer._limit)
+        return protocol, writer
+
+    def record_stats(self):
+        """このセッションの圧縮統計を全体合計へ積算する。"""
+        TOTAL_DEFLATE_STATS.merge(self.deflate_stats)
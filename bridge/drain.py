@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: 停止前のドレイン
+# DESCRIPTION: デプロイのたびに届く SIGTERM で、プレイ中のアーカイブを道連れにしないための停止手順。
+#              新しい接続を断り、接続中のプレイヤーに終了までの残り時間を知らせ、
+#              アーカイブを終えてメニューに戻った (= save_profile() が済んだ) セッションから順に終了させる。
+#              期限までに戻らなかったセッションは終了させ、クライアントには再接続を促すコードで閉じる。
+
+import asyncio
+import math
+import os
+import signal
+import time
+
+from aiohttp import WSCloseCode, web
+
+from bridge.metrics import DRAIN_REJECTED, DRAIN_SESSIONS
+from bridge.resources import MENU_LABEL, UNKNOWN_LABEL, read_archive
+from bridge.session import session_token
+
+NOTICE = "サーバー更新のため {seconds} 秒後に終了します。アーカイブを終えてメニューに戻るとセーブされます。"
+
+
+class DrainController:
+    """
+    SIGTERM / SIGINT を受けてからサーバーを止めるまでの手順。サーバーごとに 1 つ (app['drain'])。
+    環境変数で既定値を変えられる:
+      YGG_DRAIN_SEC         残ったセッションを終了させるまでの猶予
+                            (Render は SIGTERM の 30 秒後に SIGKILL するので、既定はそれより短い 25 秒)
+      YGG_DRAIN_NOTICE_SEC  プレイヤーへのお知らせと進捗のログを出し直す間隔
+
+    ドレイン中にもう一度シグナルが来たら猶予を打ち切る (1 秒以内の重複は、端末の Ctrl+C と
+    bridge.workers からの転送が両方届いたものとみなして無視する)。
+    """
+    DEADLINE_SECONDS = float(os.environ.get("YGG_DRAIN_SEC", 25))
+    NOTICE_INTERVAL = float(os.environ.get("YGG_DRAIN_NOTICE_SEC", 5))
+    # メニューに戻ってから終了させるまでの待ち時間 (プロセス名はセーブの直前にメニューへ戻るため)
+    MENU_SETTLE_SECONDS = 1.0
+    # 残ったセッションの後始末を待つ時間
+    CLOSE_TIMEOUT = 3.0
+    POLL_INTERVAL = 0.5
+    RETRY_AFTER = 5
+    DUPLICATE_SIGNAL_SECONDS = 1.0
+
+    def __init__(self, app, deadline_seconds=None):
+        self.app = app
+        self.deadline_seconds = self.DEADLINE_SECONDS if deadline_seconds is None else deadline_seconds
+        self.draining = False
+        self.started_at = None
+        self.results = {}
+        self._finished = set()
+        self._requested = asyncio.Event()
+        self._forced = asyncio.Event()
+
+    @property
+    def seconds_remaining(self):
+        if not self.draining:
+            return 0.0
+        return max(0.0, self.started_at + self.deadline_seconds - time.monotonic())
+
+    def install(self):
+        """SIGTERM / SIGINT でドレインを始めるようにする。"""
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self._on_signal, signum)
+
+    def _on_signal(self, signum):
+        name = signal.Signals(signum).name
+        if not self._requested.is_set():
+            print(f"ドレイン: {name} を受け取りました。新しい接続を断り、"
+                  f"{self.deadline_seconds:g}秒以内にセッションを片付けてから停止します。")
+            self.started_at = time.monotonic()
+            self._requested.set()
+        elif time.monotonic() - self.started_at >= self.DUPLICATE_SIGNAL_SECONDS and not self._forced.is_set():
+            print(f"ドレイン: 2 回目の {name} を受け取りました。残りのセッションをすぐに終了します。")
+            self._forced.set()
+
+    def refuse_if_draining(self, request):
+        """
+        ドレイン中なら新規の接続を 503 で断る。生きているセッションへの再接続 (回線断からの復帰) は通す。
+        """
+        if not self.draining or self.app['sessions'].find(session_token(request)) is not None:
+            return
+        DRAIN_REJECTED.inc()
+        raise web.HTTPServiceUnavailable(text="サーバーを更新しています。\n",
+                                         headers={"Retry-After": str(self.RETRY_AFTER)})
+
+    async def wait(self):
+        """シグナルが届くまで待ち、ドレインを行う。戻ったら runner.cleanup() してよい。"""
+        await self._requested.wait()
+        await self.drain()
+
+    def _finish(self, session, result):
+        self._finished.add(session)
+        session.close_code = WSCloseCode.SERVICE_RESTART  # クライアントは新しいサーバーへ再接続する
+        session.terminate()
+        self._count(result)
+
+    def _count(self, result):
+        self.results[result] = self.results.get(result, 0) + 1
+        DRAIN_SESSIONS.inc(label_values=(result,))
+
+    async def drain(self):
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+        self.draining = True
+        admission = self.app.get('admission')
+        if admission is not None:
+            admission.draining = True
+            admission.reject_waiting("サーバーを停止中です")
+
+        sessions = self.app['sessions']
+        pending = {s for s in sessions if not s.ended}
+        print(f"ドレイン: {len(pending)} セッションの終了を待ちます。")
+        menu_since = {}
+        notified_at = None
+        while pending:
+            now = time.monotonic()
+            # ドレインの直前に入場して起動中だったセッションも拾う
+            pending.update(s for s in sessions if not s.ended and s not in self._finished)
+            for session in [s for s in pending if s.ended]:
+                pending.discard(session)
+                self._count("exited")
+            in_archive = {}
+            for session in list(pending):
+                archive = read_archive(session.process.pid)
+                if archive != MENU_LABEL:
+                    # ラベルが読めないセッションも、メニューにいると確かめられないので期限まで待つ
+                    menu_since.pop(session, None)
+                    in_archive[session] = archive or UNKNOWN_LABEL
+                elif now - menu_since.setdefault(session, now) >= self.MENU_SETTLE_SECONDS:
+                    pending.discard(session)
+                    self._finish(session, "menu")
+            if not pending:
+                break
+
+            if self.seconds_remaining <= 0 or self._forced.is_set():
+                result = "forced" if self._forced.is_set() else "deadline"
+                archives = ", ".join(sorted(set(in_archive.values()))) or "なし"
+                print(f"ドレイン: {len(pending)} セッションを終了させます ({result}, 実行中のアーカイブ: {archives})。")
+                for session in pending:
+                    self._finish(session, result)
+                pending.clear()
+                break
+
+            if notified_at is None or now - notified_at >= self.NOTICE_INTERVAL:
+                notified_at = now
+                seconds = math.ceil(self.seconds_remaining)
+                print(f"ドレイン: 残り {len(pending)} セッション "
+                      f"(アーカイブ実行中 {len(in_archive)})、期限まで {seconds} 秒。")
+                notices = [asyncio.create_task(s.notify(NOTICE.format(seconds=seconds)))
+                           for s in pending if s.attached]
+                if notices:
+                    # 遅いクライアントの送信キューが空くのを待って止まらないよう、待つのは 1 周期まで
+                    await asyncio.wait(notices, timeout=self.POLL_INTERVAL)
+
+            try:
+                await asyncio.wait_for(self._forced.wait(), self.POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+        closing = [asyncio.create_task(s.wait_closed()) for s in sessions]
+        if closing:
+            _, still_open = await asyncio.wait(closing, timeout=self.CLOSE_TIMEOUT)
+            for task in still_open:
+                task.cancel()  # 残りは runner.cleanup() の SessionRegistry.close() が待つ
+        elapsed = time.monotonic() - self.started_at
+        summary = ", ".join(f"{k}={v}" for k, v in sorted(self.results.items())) or "セッションなし"
+        print(f"ドレイン: 完了しました ({elapsed:.1f}秒, {summary})。サーバーを停止します。")
+
+    def describe(self):
+        return f"猶予 {self.deadline_seconds:g}s (SIGTERM / SIGINT で開始)"
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: イベントループの選択
+# DESCRIPTION: YGG_EVENT_LOOP=uvloop の時、標準の asyncio のループの代わりに uvloop (libuv 製) を使う。
+#              uvloop が入っていない環境 (Windows や pip install していない場合) では標準のループのまま動く。
+#              比較は python3 -m benchmarks.bench_loop で行う。
+
+import asyncio
+import os
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# asyncio (既定) または uvloop
+EVENT_LOOP = os.environ.get("YGG_EVENT_LOOP", "asyncio")
+
+
+def install_event_loop(name=None):
+    """
+    asyncio.run() / web.run_app() の前に呼び、以降に作られるループの種類を決める。
+
+    Args:
+        name (str): "asyncio" か "uvloop"。None なら YGG_EVENT_LOOP に従う。
+    Returns:
+        str: 実際に使うループの名前 (uvloop が使えなければ "asyncio")。
+    """
+    name = (EVENT_LOOP if name is None else name).strip().lower()
+    if name == "uvloop":
+        if uvloop is None:
+            print("イベントループ: uvloop がインストールされていないため、標準の asyncio を使います。")
+            return "asyncio"
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        return "uvloop"
+    if name != "asyncio":
+        print(f"イベントループ: 不明な YGG_EVENT_LOOP={name!r} のため、標準の asyncio を使います。")
+    return "asyncio"
+
+
+def describe_event_loop():
+    """実行中のループの種類 (起動ログ用)。"""
+    loop = asyncio.get_running_loop()
+    if uvloop is not None and isinstance(loop, uvloop.Loop):
+        return f"uvloop {uvloop.__version__}"
+    return f"asyncio ({type(loop).__name__})"
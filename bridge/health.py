@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: ヘルスチェック (/healthz と /readyz)
+# DESCRIPTION: Render などのロードバランサーからの定期的なプローブに、メモリ上の状態だけで答える
+#              (静的ファイルの配信やディレクトリ一覧を通らない)。
+#              /healthz はイベントループが応答しているか (生存)、/readyz はそれに加えて
+#              新しいプレイヤーを受け入れられるか (準備完了) を返す。準備ができていない間は 503 を返し、
+#              このインスタンスにトラフィックを回さないようにする。
+
+import asyncio
+import os
+import time
+
+from aiohttp import hdrs, web
+
+from bridge.metrics import READINESS_FAILURES
+
+
+class HealthMonitor:
+    """
+    プローブに答えるための状態。サーバーごとに 1 つ (app['health'])。
+    環境変数で既定値を変えられる:
+      YGG_HEALTH_MAX_LAG_MS       イベントループの遅れがこれを超えたら生存・準備完了とも失敗にする
+      YGG_HEALTH_POOL_EMPTY_SEC   ウォームプールが空のまま事前起動に失敗し続けて、この秒数が経ったら
+                                  準備完了を失敗にする (補充中に一時的に空になるのは正常で、その間も
+                                  その場で起動できるため)
+    """
+    MAX_LAG = float(os.environ.get("YGG_HEALTH_MAX_LAG_MS", 500)) / 1000
+    POOL_EMPTY_SECONDS = float(os.environ.get("YGG_HEALTH_POOL_EMPTY_SEC", 30))
+    # ループの遅れを測る間隔 (sleep() がどれだけ遅れて戻るかを見る)
+    LAG_INTERVAL = 0.25
+
+    def __init__(self, app, max_lag=None, pool_empty_seconds=None):
+        self.app = app
+        self.max_lag = self.MAX_LAG if max_lag is None else max_lag
+        self.pool_empty_seconds = self.POOL_EMPTY_SECONDS if pool_empty_seconds is None else pool_empty_seconds
+        self.loop_lag = 0.0
+        self._ticked_at = time.monotonic()
+        self._task = None
+
+    async def start(self, app=None):
+        self._ticked_at = time.monotonic()
+        self._task = asyncio.create_task(self._lag_loop())
+
+    async def close(self, app=None):
+        if self._task:
+            self._task.cancel()
+
+    async def _lag_loop(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.LAG_INTERVAL)
+            self._ticked_at = time.monotonic()
+            self.loop_lag = max(0.0, self._ticked_at - started - self.LAG_INTERVAL)
+
+    @property
+    def current_lag(self):
+        """直近の遅れ。測定タスクが止まっている (ループが詰まっていた) 場合はその時間も含める。"""
+        stalled = time.monotonic() - self._ticked_at - self.LAG_INTERVAL
+        return max(self.loop_lag, stalled)
+
+    def liveness_problems(self):
+        if self.current_lag > self.max_lag:
+            return ["loop_lag"]
+        return []
+
+    def readiness_problems(self):
+        """準備完了でない理由の一覧 (空なら準備完了)。"""
+        problems = self.liveness_problems()
+        drain = self.app.get('drain')
+        if drain is not None and drain.draining:
+            problems.append("draining")
+        spawner = self.app.get('spawner')
+        if spawner is not None:
+            if getattr(spawner, 'size', 0) > 0 and self._pool_starved(spawner):
+                problems.append("warm_pool_empty")
+            process = getattr(spawner, 'process', None)
+            if process is not None and process.returncode is not None:
+                problems.append("zygote_down")
+        admission = self.app.get('admission')
+        sessions = self.app.get('sessions')
+        if admission is not None and sessions is not None:
+            if admission.max_sessions and len(sessions) >= admission.max_sessions:
+                problems.append("sessions_full")
+        return problems
+
+    def _pool_starved(self, pool):
+        """ウォームプールが pool_empty_seconds より長く空で、補充も失敗し続けている。"""
+        if pool.empty_since is None or pool.refill_failures == 0:
+            return False
+        return time.monotonic() - pool.empty_since > self.pool_empty_seconds
+
+    def _response(self, problems):
+        headers = {hdrs.CACHE_CONTROL: "no-store"}
+        lag_ms = f"lag_ms={self.current_lag * 1000:.1f}"
+        if problems:
+            return web.Response(status=503, text=f"not ready: {','.join(problems)} {lag_ms}\n",
+                                headers=headers)
+        return web.Response(text=f"ok {lag_ms}\n", headers=headers)
+
+    async def healthz(self, request):
+        return self._response(self.liveness_problems())
+
+    async def readyz(self, request):
+        problems = self.readiness_problems()
+        for reason in problems:
+            READINESS_FAILURES.inc(label_values=(reason,))
+        return self._response(problems)
+
+    def describe(self):
+        return (f"/healthz, /readyz (max_lag={self.max_lag * 1000:g} ms, "
+                f"warm_pool_empty={self.pool_empty_seconds:g}s)")
+
+
+def add_health_routes(app):
+    """
+    /healthz と /readyz を追加する。ループの遅れの測定はアプリの起動時に始まる。
+    静的ファイルを / 以下に配信するアプリでは、そのルートより先に追加すること。
+    """
+    health = HealthMonitor(app)
+    app['health'] = health
+    app.on_startup.append(health.start)
+    app.on_cleanup.append(health.close)
+    app.router.add_get('/healthz', health.healthz)
+    app.router.add_get('/readyz', health.readyz)
+    return health
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: クライアント → サーバーの入力プロトコル
+# DESCRIPTION: キー入力ごとの JSON ({"type":"input","data":...}) に代わる、バイナリフレームの
+#              コンパクトな入力プロトコル。先頭 1 バイトがオペコードで、その後ろにペイロードが続く。
+#                0x00 INPUT  : UTF-8 のキー入力 (そのまま PTY に書く)
+#                0x01 RESIZE : rows, cols (それぞれ 2 バイト、ビッグエンディアン)
+#                0x02 PING   : キープアライブ (ペイロードは任意、応答はしない)
+#              クライアントは WebSocket の URL に ?input=<バージョン> を付けて使うバージョンを示す。
+#              テキストフレームの JSON は従来どおり受け付ける (古いクライアント用)。
+#              リサイズの行数・桁数はクライアントが自由に決められるので、ここで 1..MAX_TERMINAL_SIZE に
+#              収めてから渡す (65535x65535 の画面バッファを確保させない)。
+
+import json
+import struct
+
+from aiohttp import web
+
+INPUT_PROTOCOL_VERSION = 1
+SUPPORTED_VERSIONS = (1,)
+
+OP_INPUT = 0x00
+OP_RESIZE = 0x01
+OP_PING = 0x02
+
+_RESIZE = struct.Struct('!HH')
+
+# 受け付ける行数・桁数の上限
+MAX_TERMINAL_SIZE = 500
+
+
+class InputProtocolError(ValueError):
+    """クライアントから解釈できない入力メッセージが届いた。"""
+
+
+def input_protocol_version(request):
+    """
+    WebSocket の URL の ?input=<バージョン>。指定がなければ現行バージョン
+    (バイナリフレームを送ってこない古いクライアントには関係しない)。
+    """
+    value = request.query.get("input")
+    if value is None:
+        return INPUT_PROTOCOL_VERSION
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def clamp_size(rows, cols):
+    """クライアントが要求した端末サイズを 1..MAX_TERMINAL_SIZE に収める。"""
+    rows, cols = int(rows), int(cols)
+    return (min(max(rows, 1), MAX_TERMINAL_SIZE), min(max(cols, 1), MAX_TERMINAL_SIZE))
+
+
+def encode_input(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return bytes((OP_INPUT,)) + data
+
+
+def encode_resize(rows, cols):
+    return bytes((OP_RESIZE,)) + _RESIZE.pack(rows, cols)
+
+
+def encode_ping(payload=b''):
+    return bytes((OP_PING,)) + payload
+
+
+def decode_resize(msg):
+    """リサイズ要求なら (rows, cols)、それ以外は None (入場待ちの間など、リサイズだけ拾う場合用)。"""
+    if msg.type == web.WSMsgType.BINARY:
+        data = msg.data
+        if len(data) == 1 + _RESIZE.size and data[0] == OP_RESIZE:
+            return clamp_size(*_RESIZE.unpack_from(data, 1))
+    elif msg.type == web.WSMsgType.TEXT:
+        try:
+            data = json.loads(msg.data)
+        except ValueError:
+            return None
+        if isinstance(data, dict) and data.get('type') == 'resize' and 'rows' in data and 'cols' in data:
+            try:
+                return clamp_size(data['rows'], data['cols'])
+            except (ValueError, TypeError):
+                return None
+    return None
+
+
+class InputHandler:
+    """
+    1 接続分の入力メッセージを解釈して、セッションへのキー入力とリサイズに振り分ける。
+
+    キー入力は session.queue_input() に渡すので、貼り付けなどで同時に届いた入力は
+    まとめて 1 回の write で PTY に書かれる。
+    """
+    def __init__(self, session, on_resize, version=INPUT_PROTOCOL_VERSION):
+        """
+        Args:
+            session (GameSession): キー入力の書き込み先。
+            on_resize: リサイズ要求で呼ぶ関数 (引数は clamp_size() 済みの rows, cols)。
+            version (int): クライアントが ?input= で示したプロトコルのバージョン。
+        """
+        self.session = session
+        self.on_resize = on_resize
+        self.version = version
+        self.pings = 0
+
+    def feed(self, msg):
+        """
+        受信した WebSocket メッセージを 1 つ処理する。
+
+        Raises:
+            InputProtocolError: 未対応のバージョンやオペコード、壊れたメッセージ。
+        """
+        if msg.type == web.WSMsgType.BINARY:
+            self._feed_binary(msg.data)
+        elif msg.type == web.WSMsgType.TEXT:
+            self._feed_json(msg.data)
+
+    def _feed_binary(self, data):
+        if self.version not in SUPPORTED_VERSIONS:
+            raise InputProtocolError(f"未対応の入力プロトコルです (version={self.version})")
+        if not data:
+            raise InputProtocolError("空のバイナリフレームです")
+        op = data[0]
+        if op == OP_INPUT:
+            self.session.queue_input(data[1:])
+        elif op == OP_RESIZE:
+            if len(data) != 1 + _RESIZE.size:
+                raise InputProtocolError(f"RESIZE の長さが不正です ({len(data)} バイト)")
+            self.on_resize(*clamp_size(*_RESIZE.unpack_from(data, 1)))
+        elif op == OP_PING:
+            self.pings += 1
+        else:
+            raise InputProtocolError(f"不明なオペコードです (0x{op:02x})")
+
+    def _feed_json(self, text):
+        try:
+            msg_data = json.loads(text)
+            kind = msg_data['type']
+            if kind == 'resize':
+                self.on_resize(*clamp_size(msg_data['rows'], msg_data['cols']))
+            elif kind == 'input':
+                self.session.queue_input(msg_data['data'].encode('utf-8'))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise InputProtocolError(f"JSON の入力メッセージが不正です: {e}") from e
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: Prometheus 形式のメトリクス
+# DESCRIPTION: /metrics で Prometheus のテキスト形式を返す。転送ループ側では整数の加算と
+#              ヒストグラムのバケット探索しか行わず、セッションごとの統計の合算や文字列化は
+#              スクレイプされた時にだけ行う。
+
+import bisect
+import time
+
+from aiohttp import web
+
+from bridge.coalesce import TOTAL_STATS
+from bridge.deflate import TOTAL_DEFLATE_STATS
+from bridge.send_queue import TOTAL_QUEUE_STATS
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# レイテンシ用のバケット (秒)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# クライアントのいないセッションが残っていた時間 (秒〜時間の単位)
+ORPHAN_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """単調増加するカウンター。ラベルがある場合は inc() にラベル値をタプルで渡す。"""
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, amount=1, label_values=()):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for label_values, value in sorted(self._values.items()):
+            if isinstance(value, float):
+                value = round(value, 6)
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+class Histogram:
+    """
+    固定バケットのヒストグラム。observe() はバケットの二分探索と加算だけ。
+    """
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # 最後は +Inf
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value):
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sum += value
+        self._count += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        cumulative = 0
+        for bound, count in zip(self.buckets, self._counts):
+            cumulative += count
+            yield f'{self.name}_bucket{{le="{bound:g}"}} {cumulative}'
+        yield f'{self.name}_bucket{{le="+Inf"}} {self._count}'
+        yield f"{self.name}_sum {self._sum:.6f}"
+        yield f"{self.name}_count {self._count}"
+
+
+def _gauge(name, help_text, samples):
+    """samples: [(ラベル名タプル, ラベル値タプル, 値)] またはスカラー値。"""
+    yield f"# HELP {name} {help_text}"
+    yield f"# TYPE {name} gauge"
+    if not isinstance(samples, list):
+        samples = [((), (), samples)]
+    for label_names, label_values, value in samples:
+        yield f"{name}{_format_labels(label_names, label_values)} {value}"
+
+
+def _counter(name, help_text, value):
+    yield f"# HELP {name} {help_text}"
+    yield f"# TYPE {name} counter"
+    yield f"{name} {value}"
+
+
+# 転送ループやハンドラから直接更新するメトリクス
+SPAWN_LATENCY = Histogram(
+    "ygg_spawn_latency_seconds", "入場許可からゲームプロセスの準備完了までの時間")
+KEYSTROKE_LATENCY = Histogram(
+    "ygg_keystroke_to_output_seconds", "キー入力を PTY に書いてから次の出力が読めるまでの時間")
+CHILD_EXITS = Counter(
+    "ygg_child_exits_total", "終了したゲームプロセスの数 (終了コード別、負の値はシグナル)", labels=("code",))
+PTY_INPUT_BYTES = Counter(
+    "ygg_pty_input_bytes_total", "クライアントから PTY に書き込んだバイト数")
+PTY_INPUT_WRITES = Counter(
+    "ygg_pty_input_writes_total", "キー入力の PTY への write() 回数 (同時に届いた入力はまとめて書く)")
+WS_MESSAGES_IN = Counter(
+    "ygg_ws_messages_received_total", "クライアントから受信した WebSocket メッセージ数")
+SESSION_IDLE_EVENTS = Counter(
+    "ygg_session_idle_events_total",
+    "無操作による状態遷移の数 (hibernate=休止, wake=再開, reap=終了)", labels=("event",))
+SESSION_CPU_SECONDS = Counter(
+    "ygg_session_cpu_seconds_total", "ゲームプロセスが使った CPU 時間 (実行中のアーカイブ別)", labels=("archive",))
+SESSION_PLAYER_SECONDS = Counter(
+    "ygg_session_player_seconds_total",
+    "クライアントが接続していた時間 (実行中のアーカイブ別、休止中は除く)", labels=("archive",))
+SESSIONS_STARTED = Counter(
+    "ygg_sessions_started_total", "開始したセッション数 (new=新規起動, reattach=再接続)", labels=("kind",))
+STATIC_REQUESTS = Counter(
+    "ygg_static_requests_total",
+    "静的ファイルのリクエスト数 (返した Content-Encoding 別、not_modified=304, miss=404)", labels=("result",))
+RECORDING_BYTES = Counter(
+    "ygg_recording_bytes_total", "録画ファイルに書き込んだバイト数 (圧縮前)")
+RECORDING_DROPPED = Counter(
+    "ygg_recording_dropped_events_total", "書き込みが追いつかず録画から捨てたイベント数")
+DRAIN_SESSIONS = Counter(
+    "ygg_drain_sessions_total",
+    "停止時のドレインで片付いたセッション数 (exited=自分で終了, menu=メニューに戻った所で終了, "
+    "deadline=期限切れで終了, forced=2 回目のシグナルで終了)", labels=("result",))
+DRAIN_REJECTED = Counter(
+    "ygg_drain_rejected_total", "ドレイン中に断った新規接続の数")
+ORPHAN_LIFETIME = Histogram(
+    "ygg_orphan_lifetime_seconds",
+    "クライアントが切断してから、再接続されるかゲームプロセスが回収されるまでの時間", buckets=ORPHAN_BUCKETS)
+ORPHANS = Counter(
+    "ygg_orphans_total",
+    "クライアントのいなくなったセッションの行き先 (reattached=再接続, reclaimed=終了させて回収, "
+    "exited=ゲームが自分で終了)", labels=("outcome",))
+WS_DEAD_PEERS = Counter(
+    "ygg_ws_dead_peers_total", "ハートビートの pong が返らず切断した接続の数")
+OUTPUT_THROTTLED = Counter(
+    "ygg_output_throttled_total", "出力の上限に達して間引きを始めた回数 (実行中のアーカイブ別)", labels=("archive",))
+OUTPUT_THROTTLED_SECONDS = Counter(
+    "ygg_output_throttled_seconds_total", "出力を間引いていた時間 (実行中のアーカイブ別)", labels=("archive",))
+OUTPUT_THROTTLE_SAVED_BYTES = Counter(
+    "ygg_output_throttle_saved_bytes_total",
+    "間引きで送らずに済んだバイト数 (最新の画面にまとめた分、実行中のアーカイブ別)", labels=("archive",))
+READINESS_FAILURES = Counter(
+    "ygg_readiness_failures_total", "/readyz が 503 を返した回数 (理由別)", labels=("reason",))
+
+STARTED_AT = time.time()
+
+
+def render(app):
+    """アプリの状態と積算値から、Prometheus のテキスト形式を組み立てる。"""
+    lines = []
+    sessions = list(app['sessions']) if 'sessions' in app else []
+
+    states = {"attached": 0, "detached": 0, "hibernating": 0}
+    for session in sessions:
+        states[session.state] += 1
+    lines += _gauge("ygg_sessions", "現在のゲームセッション数 (hibernating=無操作で休止中)", [
+        (("state",), (state,), count) for state, count in states.items()
+    ])
+
+    # 終了済みセッションの積算値 + 動作中のセッションの値
+    pty_bytes = TOTAL_STATS.bytes + sum(s.coalescer.stats.bytes for s in sessions)
+    pty_reads = TOTAL_STATS.reads + sum(s.coalescer.stats.reads for s in sessions)
+    pty_frames = TOTAL_STATS.frames + sum(s.coalescer.stats.frames for s in sessions)
+    lines += _counter("ygg_pty_output_bytes_total", "PTY から読み取ったバイト数", pty_bytes)
+    lines += _counter("ygg_pty_reads_total", "PTY の read() 回数", pty_reads)
+    lines += _counter("ygg_output_frames_total", "コアレッシング後の出力フレーム数", pty_frames)
+    lines += PTY_INPUT_BYTES.render()
+    lines += PTY_INPUT_WRITES.render()
+    lines += WS_MESSAGES_IN.render()
+
+    queues = [s.send_queue for s in sessions if s.send_queue is not None]
+    frames_out = TOTAL_QUEUE_STATS.frames_out + sum(q.stats.frames_out for q in queues)
+    merged = TOTAL_QUEUE_STATS.merged_frames + sum(q.stats.merged_frames for q in queues)
+    stalls = TOTAL_QUEUE_STATS.stalls + sum(q.stats.stalls for q in queues)
+    lines += _counter("ygg_ws_frames_sent_total", "送信した WebSocket フレーム数", frames_out)
+    lines += _counter("ygg_ws_frames_merged_total", "送信キューでまとめた (捨てた) フレーム数", merged)
+    lines += _counter("ygg_send_queue_stalls_total", "書き込みバッファが溢れて送信を待った回数", stalls)
+    lines += _gauge("ygg_send_queue_depth", "送信待ちフレーム数 (全セッション合計)", sum(q.depth for q in queues))
+    lines += _gauge("ygg_send_queue_depth_max", "送信待ちフレーム数 (セッションごとの最大)",
+                    max((q.depth for q in queues), default=0))
+    lines += _gauge("ygg_transport_write_buffer_bytes", "書き込みバッファに溜まっているバイト数 (全セッション合計)",
+                    sum(q.write_buffer_size for q in queues))
+
+    lines += _counter("ygg_ws_deflate_raw_bytes_total", "圧縮前のバイト数 (終了した接続分)", TOTAL_DEFLATE_STATS.raw_bytes)
+    lines += _counter("ygg_ws_deflate_wire_bytes_total", "圧縮後のバイト数 (終了した接続分)", TOTAL_DEFLATE_STATS.wire_bytes)
+
+    lines += SESSIONS_STARTED.render()
+    lines += SESSION_IDLE_EVENTS.render()
+    lines += SESSION_CPU_SECONDS.render()
+    lines += SESSION_PLAYER_SECONDS.render()
+    lines += _gauge("ygg_session_cpu_percent_max", "直近のサンプルで最も CPU を使っていたセッションの使用率",
+                    round(max((s.cpu_percent for s in sessions), default=0.0), 1))
+    lines += SPAWN_LATENCY.render()
+    lines += KEYSTROKE_LATENCY.render()
+    lines += CHILD_EXITS.render()
+    lines += WS_DEAD_PEERS.render()
+    lines += ORPHAN_LIFETIME.render()
+    lines += ORPHANS.render()
+    lines += STATIC_REQUESTS.render()
+    lines += OUTPUT_THROTTLED.render()
+    lines += OUTPUT_THROTTLED_SECONDS.render()
+    lines += OUTPUT_THROTTLE_SAVED_BYTES.render()
+    lines += _gauge("ygg_sessions_throttled", "出力を間引いているセッション数",
+                    sum(1 for s in sessions if s.budget.throttled_since is not None))
+    lines += RECORDING_BYTES.render()
+    lines += RECORDING_DROPPED.render()
+
+    drain = app.get('drain')
+    if drain is not None:
+        lines += _gauge("ygg_draining", "停止前のドレイン中なら 1", int(drain.draining))
+        lines += _gauge("ygg_drain_seconds_remaining", "ドレインの期限までの秒数 (ドレイン中でなければ 0)",
+                        round(drain.seconds_remaining, 1))
+        lines += DRAIN_SESSIONS.render()
+        lines += DRAIN_REJECTED.render()
+
+    spawner = app.get('spawner')
+    if spawner is not None and hasattr(spawner, 'ready_count'):
+        lines += _gauge("ygg_warm_pool_ready", "待機中の事前起動プロセス数", spawner.ready_count)
+        lines += _counter("ygg_warm_pool_hits_total", "待機プロセスを払い出せた回数", spawner.hits)
+        lines += _counter("ygg_warm_pool_misses_total", "その場で起動した回数", spawner.misses)
+
+    admission = app.get('admission')
+    if admission is not None:
+        lines += _gauge("ygg_waiting_room", "待合室で待っている接続数", admission.waiting)
+        lines += _counter("ygg_admission_admitted_total", "入場を許可した数", admission.admitted)
+        lines += _counter("ygg_admission_queued_total", "待合室に並んだ数", admission.queued)
+        lines += _counter("ygg_admission_rejected_total", "満員で断った数", admission.rejected)
+        lines += _gauge("ygg_memory_available_mb", "空きメモリ (MiB)", round(admission.memory_available_mb or 0, 1))
+        lines += _gauge("ygg_cpu_busy_percent", "CPU 使用率", round(admission.cpu_percent, 1))
+
+    health = app.get('health')
+    if health is not None:
+        lines += _gauge("ygg_event_loop_lag_seconds", "イベントループの遅れ (sleep() が予定より遅れて戻った時間)",
+                        round(health.current_lag, 4))
+        lines += READINESS_FAILURES.render()
+
+    lines += _gauge("ygg_process_start_time_seconds", "サーバーの起動時刻 (UNIX 時間)", STARTED_AT)
+    lines.append("")
+    return "\n".join(lines)
+
+
+async def metrics_handler(request):
+    return web.Response(body=render(request.app).encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
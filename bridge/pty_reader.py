@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: PTY master 側のイベント駆動リーダー
+# DESCRIPTION: run_in_executor + sleep によるポーリングを置き換え、
+#              loop.add_reader() で読み取り可能になった瞬間に出力を取り込む。
+
+import asyncio
+import errno
+import os
+
+
+class PtyReader:
+    """
+    PTY の master fd をイベントループに登録し、出力が届いた時点で読み取るリーダー。
+    アイドル中のセッションはスレッドもタイマーも消費しない。
+
+    読み取りサイズは直近の結果に合わせて MIN_READ_SIZE〜MAX_READ_SIZE の範囲で
+    倍増/半減する (キーエコーは小さく、画面全体の再描画は大きくまとめて読む)。
+    """
+    MIN_READ_SIZE = 1024
+    MAX_READ_SIZE = 64 * 1024
+    # 未送信の出力がこれを超えたら読み取りを止め、子プロセス側を PTY で待たせる
+    HIGH_WATER = 256 * 1024
+
+    def __init__(self, master_fd, loop=None):
+        """
+        Args:
+            master_fd (int): 非ブロッキングに設定済みの PTY master fd。
+            loop: 使用するイベントループ (省略時は実行中のループ)。
+        """
+        self.master_fd = master_fd
+        self.loop = loop or asyncio.get_running_loop()
+        self.read_size = self.MIN_READ_SIZE
+        self.read_count = 0
+        self._chunks = []
+        self._pending = 0
+        self._eof = False
+        self._error = None
+        self._closed = False
+        self._reading = False
+        self._waiter = None
+        self._resume_reading()
+
+    def _resume_reading(self):
+        if not self._reading and not self._eof and not self._closed:
+            self.loop.add_reader(self.master_fd, self._on_readable)
+            self._reading = True
+
+    def _pause_reading(self):
+        if self._reading:
+            self.loop.remove_reader(self.master_fd)
+            self._reading = False
+
+    def _wakeup(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.master_fd, self.read_size)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            # スレーブ側が全て閉じられると Linux では EIO が返る (= EOF)
+            if e.errno != errno.EIO:
+                self._error = e
+            data = b''
+
+        if not data:
+            self._eof = True
+            self._pause_reading()
+        else:
+            size = len(data)
+            self.read_count += 1
+            if size == self.read_size and self.read_size < self.MAX_READ_SIZE:
+                self.read_size *= 2
+            elif size < self.read_size // 4 and self.read_size > self.MIN_READ_SIZE:
+                self.read_size //= 2
+            self._chunks.append(data)
+            self._pending += size
+            if self._pending >= self.HIGH_WATER:
+                self._pause_reading()
+        self._wakeup()
+
+    async def read(self):
+        """
+        溜まっている出力をまとめて返す。出力が無ければ届くまで待つ。
+
+        Returns:
+            bytes: PTY の出力。EOF またはクローズ後は b''。
+        """
+        while not self._chunks and not self._eof and not self._closed:
+            self._waiter = self.loop.create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+
+        if self._error is not None and not self._chunks:
+            error, self._error = self._error, None
+            raise error
+        return self.read_nowait()
+
+    def read_nowait(self):
+        """
+        待たずに、その時点で溜まっている出力だけを返す。
+
+        Returns:
+            bytes: 溜まっている出力 (無ければ b'')。EOF の判定は read() で行う。
+        """
+        if not self._chunks:
+            return b''
+        if len(self._chunks) == 1:
+            data = self._chunks[0]
+        else:
+            data = b''.join(self._chunks)
+        self._chunks.clear()
+        self._pending = 0
+        self._resume_reading()
+        return data
+
+    @property
+    def at_eof(self):
+        return self._eof or self._closed
+
+    def close(self):
+        """fd の監視を解除する。fd 自体は呼び出し側が閉じる。"""
+        self._closed = True
+        self._pause_reading()
+        self._wakeup()
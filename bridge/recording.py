@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: セッションの録画 (asciicast v2)
+# DESCRIPTION: プレイヤーからの報告を調べるため、セッションの PTY 出力とキー入力を
+#              asciicast v2 形式 (asciinema で再生できる) のファイルに記録する。
+#              転送ループでは (時刻, 種類, bytes) を上限付きのキューに積むだけで、
+#              文字列化とディスクへの書き込みは録画ごとのタスクがまとめてスレッドで行う。
+#              ディスクが追いつかずキューが溢れた分は捨てて数える。
+#              ファイルは一定サイズでローテーションし、閉じたファイルは gzip で圧縮する。
+
+import asyncio
+import codecs
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bridge.metrics import RECORDING_BYTES, RECORDING_DROPPED
+
+# asciicast v2 のイベント種別
+EVENT_OUTPUT = "o"
+EVENT_INPUT = "i"
+EVENT_RESIZE = "r"
+EVENT_MARKER = "m"
+
+# 1 行 (1 イベント) に書く最大の文字数
+CHUNK_CHARS = 16384
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, default).lower() in ("1", "true", "yes")
+
+
+def _lower_priority():
+    # 書き込みスレッドだけ nice 19 にする (Linux ではスレッドごとに設定できる)。
+    # CPU が混んでいる時は転送ループとゲームプロセスが優先され、録画は後回しになる
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except OSError:
+        pass
+
+
+_executor = None
+
+
+def _writer_executor():
+    """全セッションの録画で共有する書き込みスレッド (1 本)。"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ygg-record",
+                                       initializer=_lower_priority)
+    return _executor
+
+
+class RecordingSettings:
+    """
+    録画の設定。環境変数で既定値を変えられる:
+      YGG_RECORD_DIR       録画ファイルの置き場所 (空なら録画しない)
+      YGG_RECORD_INPUT     0 でキー入力を記録しない (出力とリサイズだけ)
+      YGG_RECORD_QUEUE_KB  書き込み待ちの上限。超えた分のイベントは捨てる
+      YGG_RECORD_FLUSH_MS  書き込みをまとめる間隔
+      YGG_RECORD_ROTATE_MB 1 ファイルの大きさの上限 (超えたら次のファイルに移り、前のものを圧縮する)
+    """
+    DIRECTORY = os.environ.get("YGG_RECORD_DIR", "")
+    RECORD_INPUT = _env_flag("YGG_RECORD_INPUT", "1")
+    QUEUE_BYTES = int(os.environ.get("YGG_RECORD_QUEUE_KB", 1024)) * 1024
+    FLUSH_INTERVAL = float(os.environ.get("YGG_RECORD_FLUSH_MS", 200)) / 1000
+    ROTATE_BYTES = int(float(os.environ.get("YGG_RECORD_ROTATE_MB", 8)) * 1024 * 1024)
+    # エスケープシーケンスの多い録画はレベル 1 でも 1/10 程度になり、レベル 6 の 1/3 の CPU 時間で済む
+    GZIP_LEVEL = 1
+
+    def __init__(self, directory=None, record_input=None, queue_bytes=None, flush_interval=None,
+                 rotate_bytes=None):
+        self.directory = self.DIRECTORY if directory is None else directory
+        self.record_input = self.RECORD_INPUT if record_input is None else record_input
+        self.queue_bytes = self.QUEUE_BYTES if queue_bytes is None else queue_bytes
+        self.flush_interval = self.FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.rotate_bytes = self.ROTATE_BYTES if rotate_bytes is None else rotate_bytes
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def open(self, pid, rows=24, cols=80):
+        """セッション用の録画を開始する。録画が無効なら None。"""
+        if not self.enabled:
+            return None
+        recorder = SessionRecorder(self, f"{time.strftime('%Y%m%d-%H%M%S')}-{pid}", rows, cols)
+        recorder.start()
+        return recorder
+
+    def describe(self):
+        if not self.enabled:
+            return "録画なし"
+        what = "出力+入力" if self.record_input else "出力のみ"
+        return (f"{self.directory} ({what}, キュー {self.queue_bytes // 1024} KiB, "
+                f"{self.rotate_bytes / 1024 / 1024:g} MiB でローテーション)")
+
+
+class SessionRecorder:
+    """
+    1 セッション分の録画。output() / input() / resize() は転送ループから呼ばれるので、
+    時刻を取ってリストに積むだけにしている。
+    """
+    def __init__(self, settings, name, rows, cols):
+        self.settings = settings
+        self.name = name
+        self.events = 0
+        self.dropped = 0
+        self.bytes_written = 0
+        self.files = []
+        self._pending = []
+        self._pending_bytes = 0
+        self._dropped_unreported = 0
+        self._has_events = asyncio.Event()
+        self._flush_soon = asyncio.Event()
+        self._closing = False
+        self._task = None
+        # 以下は書き込みスレッド側だけが触る
+        self._file = None
+        self._path = None
+        self._part = 0
+        self._part_started = None
+        self._file_bytes = 0
+        self._decoders = {}
+        self._size = (cols, rows)
+        self._started_mono = time.monotonic()
+        self._started_wall = time.time()
+
+    def start(self):
+        self._task = asyncio.create_task(self._writer_loop())
+
+    # --- 転送ループ側 ---
+
+    def _record(self, kind, data):
+        if self._closing:
+            return
+        if self._pending_bytes + len(data) > self.settings.queue_bytes:
+            self.dropped += 1
+            self._dropped_unreported += 1
+            RECORDING_DROPPED.inc()
+            return
+        self._pending.append((time.monotonic(), kind, data))
+        self._pending_bytes += len(data)
+        if not self._has_events.is_set():
+            self._has_events.set()
+        elif self._pending_bytes * 2 > self.settings.queue_bytes and not self._flush_soon.is_set():
+            # キューが半分埋まったら、まとめる間隔を待たずに書き始める
+            self._flush_soon.set()
+
+    def output(self, data):
+        self._record(EVENT_OUTPUT, data)
+
+    def input(self, data):
+        if self.settings.record_input:
+            self._record(EVENT_INPUT, data)
+
+    def resize(self, rows, cols):
+        self._record(EVENT_RESIZE, f"{cols}x{rows}".encode())
+
+    async def close(self):
+        """残りのイベントを書き出し、最後のファイルを圧縮する。"""
+        if self._task is None:
+            return
+        self._closing = True
+        self._has_events.set()
+        self._flush_soon.set()
+        await self._task
+        self._task = None
+
+    # --- 書き込み側 ---
+
+    async def _writer_loop(self):
+        loop = asyncio.get_running_loop()
+        executor = _writer_executor()
+        try:
+            while True:
+                await self._has_events.wait()
+                if not self._closing:
+                    # 少し待って、その間のイベントを 1 回の書き込みにまとめる
+                    try:
+                        await asyncio.wait_for(self._flush_soon.wait(), self.settings.flush_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                self._has_events.clear()
+                self._flush_soon.clear()
+                batch, self._pending, self._pending_bytes = self._pending, [], 0
+                dropped, self._dropped_unreported = self._dropped_unreported, 0
+                if batch or dropped:
+                    self.events += len(batch)
+                    written = self.bytes_written
+                    await loop.run_in_executor(executor, self._write_batch, batch, dropped)
+                    RECORDING_BYTES.inc(self.bytes_written - written)
+                if self._closing and not self._pending:
+                    break
+        except Exception as e:
+            print(f"録画: {self.name} の書き込みに失敗したため録画を止めます: {e}")
+            self._closing = True
+            self._pending = []
+        finally:
+            await loop.run_in_executor(executor, self._close_file)
+
+    def _write_batch(self, batch, dropped):
+        if dropped:
+            # 捨てた分の位置が再生時に分かるよう、マーカーを残す
+            at = batch[0][0] if batch else time.monotonic()
+            batch.insert(0, (at, EVENT_MARKER, f"dropped {dropped} events".encode()))
+        lines = []
+        size = 0
+        for at, kind, data in batch:
+            if self._file is None or self._file_bytes + size >= self.settings.rotate_bytes:
+                if lines:
+                    self._write_lines(lines)
+                    lines, size = [], 0
+                self._rotate(at)
+            if kind == EVENT_RESIZE:
+                text = data.decode()
+                cols, _, rows = text.partition("x")
+                self._size = (int(cols), int(rows))
+            elif kind == EVENT_MARKER:
+                text = data.decode()
+            else:
+                # マルチバイト文字がフレームの境目で分かれていてもよいよう、種類ごとに逐次デコードする
+                decoder = self._decoders.get(kind)
+                if decoder is None:
+                    decoder = self._decoders[kind] = codecs.getincrementaldecoder("utf-8")("replace")
+                text = decoder.decode(data)
+            # json.dumps() は 1 つの文字列を処理し終えるまで GIL を離さないので、
+            # 大きなフレームは分けて書く (その間も転送ループが動けるように)
+            for start in range(0, len(text), CHUNK_CHARS):
+                line = self._line(at, kind, text[start:start + CHUNK_CHARS])
+                lines.append(line)
+                size += len(line)
+        if lines:
+            self._write_lines(lines)
+
+    def _line(self, at, kind, text):
+        offset = max(0.0, at - self._part_started) if self._part_started is not None else 0.0
+        # ensure_ascii (既定) のほうが速い。日本語は \uXXXX になるが、圧縮すれば大差ない
+        return (json.dumps([round(offset, 6), kind, text]) + "\n").encode("ascii")
+
+    def _write_lines(self, lines):
+        data = b"".join(lines)
+        self._file.write(data)
+        self._file.flush()
+        self._file_bytes += len(data)
+        self.bytes_written += len(data)
+
+    def _rotate(self, at):
+        self._close_file()
+        os.makedirs(self.settings.directory, exist_ok=True)
+        self._part += 1
+        self._path = os.path.join(self.settings.directory, f"{self.name}.{self._part}.cast")
+        self._file = open(self._path, "wb")
+        self._part_started = at
+        header = {
+            "version": 2,
+            "width": self._size[0],
+            "height": self._size[1],
+            "timestamp": int(self._started_wall + (at - self._started_mono)),
+            "env": {"TERM": "xterm-256color"},
+            "title": f"yggdrasil {self.name} part {self._part}",
+        }
+        self._file_bytes = 0
+        self._write_lines([(json.dumps(header) + "\n").encode("utf-8")])
+
+    def _close_file(self):
+        """いまのファイルを閉じて gzip で圧縮する (元のファイルは消す)。"""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        path, self._path = self._path, None
+        try:
+            with open(path, "rb") as src, gzip.open(path + ".gz", "wb", compresslevel=self.settings.GZIP_LEVEL) as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(path)
+            self.files.append(path + ".gz")
+        except OSError as e:
+            print(f"録画: {path} を圧縮できませんでした: {e}")
+            self.files.append(path)
+
+    def summary(self):
+        return (f"{self.events} events, {self.dropped} dropped, "
+                f"{self.bytes_written / 1024:.1f} KiB -> {', '.join(os.path.basename(p) for p in self.files)}")
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: セッションごとの資源制限と CPU 使用量の計測
+# DESCRIPTION: 暴走したアーカイブ (描画の無限ループなど) が 1 コアを占有して他のセッションを
+#              止めないよう、ゲームプロセスに RLIMIT_CPU / RLIMIT_AS を掛け、cgroup v2 が
+#              使える環境ではセッションごとの cgroup で cpu.weight を設定する。
+#              また、ゲームプロセスがどのアーカイブを実行中かをプロセス名 (comm) に書いておき、
+#              サーバー側で CPU 時間をアーカイブ別に集計できるようにする。
+
+import functools
+import os
+import resource
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GAMES_DIR = os.path.join(PROJECT_ROOT, 'games')
+
+# comm (最大 15 バイト) に書くアーカイブ名の接頭辞。"@combat" や "@menu" のようになる
+ARCHIVE_LABEL_PREFIX = "@"
+MENU_LABEL = "menu"
+# ラベルを読めない・付いていない (label_archives() を呼ばないスクリプトなど) プロセスのメトリクス上の名前
+UNKNOWN_LABEL = "unknown"
+
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+class ResourceLimits:
+    """
+    ゲームプロセスに掛ける rlimit。値はサーバー側で決め、子プロセスにはコマンドライン引数で渡す
+    (ウォームプールは子プロセスの環境変数を差し替えることがあるため)。
+
+    CPU 時間が cpu_seconds を超えると SIGXCPU、さらに GRACE_SECONDS 使うと SIGKILL で終了する。
+    """
+    # 環境変数 YGG_RLIMIT_CPU_SEC / YGG_RLIMIT_AS_MB で調整できる (0 なら制限しない)
+    CPU_SECONDS = int(os.environ.get("YGG_RLIMIT_CPU_SEC", 0))
+    ADDRESS_SPACE_MB = int(os.environ.get("YGG_RLIMIT_AS_MB", 0))
+    GRACE_SECONDS = 5
+
+    def __init__(self, cpu_seconds=None, address_space_mb=None):
+        self.cpu_seconds = self.CPU_SECONDS if cpu_seconds is None else cpu_seconds
+        self.address_space_mb = self.ADDRESS_SPACE_MB if address_space_mb is None else address_space_mb
+
+    def __bool__(self):
+        return bool(self.cpu_seconds or self.address_space_mb)
+
+    def args(self):
+        """bridge.session_entry / bridge.zygote に渡すコマンドライン引数。"""
+        return ["--rlimit-cpu", str(self.cpu_seconds), "--rlimit-as", str(self.address_space_mb)]
+
+    @staticmethod
+    def add_arguments(parser):
+        parser.add_argument('--rlimit-cpu', type=int, default=None,
+                            help="CPU 時間の上限 (秒、0 で無制限)")
+        parser.add_argument('--rlimit-as', type=int, default=None,
+                            help="アドレス空間の上限 (MiB、0 で無制限)")
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(args.rlimit_cpu, args.rlimit_as)
+
+    def apply(self):
+        """自分自身 (ゲームプロセス側) に制限を掛ける。"""
+        if self.cpu_seconds > 0:
+            resource.setrlimit(resource.RLIMIT_CPU,
+                               (self.cpu_seconds, self.cpu_seconds + self.GRACE_SECONDS))
+        if self.address_space_mb > 0:
+            limit = self.address_space_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    def describe(self):
+        cpu = f"{self.cpu_seconds}s" if self.cpu_seconds > 0 else "無制限"
+        memory = f"{self.address_space_mb} MiB" if self.address_space_mb > 0 else "無制限"
+        return f"RLIMIT_CPU={cpu}, RLIMIT_AS={memory}"
+
+
+class CpuCgroup:
+    """
+    セッションごとの cgroup v2 (cpu.weight) を作る。
+
+    cgroup v2 ではプロセスを持つ cgroup の子に cpu コントローラを割り当てられないため、
+    サーバー自身とは別の、委譲されたディレクトリを YGG_CGROUP_ROOT で指定した時だけ有効になる
+    (例: systemd の Delegate=yes で作ったサブツリー)。
+    """
+    # 環境変数 YGG_CGROUP_ROOT / YGG_CPU_WEIGHT で調整できる (cpu.weight は 1〜10000、既定は 100)
+    ROOT = os.environ.get("YGG_CGROUP_ROOT", "")
+    WEIGHT = int(os.environ.get("YGG_CPU_WEIGHT", 100))
+
+    def __init__(self, root=None, weight=None):
+        self.root = self.ROOT if root is None else root
+        self.weight = self.WEIGHT if weight is None else weight
+        self.available = bool(self.root) and self._enable_cpu_controller()
+
+    def _enable_cpu_controller(self):
+        try:
+            with open(os.path.join(self.root, "cgroup.controllers")) as f:
+                if "cpu" not in f.read().split():
+                    print(f"cgroup: {self.root} で cpu コントローラが使えません。cpu.weight は設定しません。")
+                    return False
+            with open(os.path.join(self.root, "cgroup.subtree_control"), "w") as f:
+                f.write("+cpu")
+        except OSError as e:
+            print(f"cgroup: {self.root} を使えません ({e})。cpu.weight は設定しません。")
+            return False
+        return True
+
+    def add(self, pid):
+        """pid 用の cgroup を作って移す。作れなければ None。"""
+        if not self.available:
+            return None
+        path = os.path.join(self.root, f"ygg-session-{pid}")
+        try:
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, "cpu.weight"), "w") as f:
+                f.write(str(self.weight))
+            with open(os.path.join(path, "cgroup.procs"), "w") as f:
+                f.write(str(pid))
+        except OSError as e:
+            print(f"cgroup: セッション (PID: {pid}) を {path} に移せませんでした: {e}")
+            self.remove(path)
+            return None
+        return path
+
+    def remove(self, path):
+        """プロセスがいなくなった cgroup を削除する。"""
+        if path is None:
+            return
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+
+    def describe(self):
+        if not self.available:
+            return "cgroup なし"
+        return f"cgroup={self.root}, cpu.weight={self.weight}"
+
+
+def read_cpu_seconds(pid):
+    """
+    /proc/<pid>/stat の utime + stime (+ 回収済みの子プロセス分) を秒で返す。
+    プロセスがもういなければ None。
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # comm に空白や括弧が入っていてもよいように、最後の ')' の後ろを読む
+    fields = stat[stat.rfind(')') + 2:].split()
+    # fields[0] が 3 番目の state。utime/stime/cutime/cstime は 14〜17 番目
+    return sum(int(v) for v in fields[11:15]) / _CLOCK_TICKS
+
+
+def read_archive(pid):
+    """
+    ゲームプロセスが実行中のアーカイブ名 (label_archives() で書いたもの)。メニューなら MENU_LABEL。
+    comm を読めない、またはラベルが付いていなければ None (メニューにいるとはみなさない)。
+    """
+    try:
+        with open(f"/proc/{pid}/comm") as f:
+            comm = f.read().strip()
+    except OSError:
+        return None
+    if comm.startswith(ARCHIVE_LABEL_PREFIX):
+        return comm[len(ARCHIVE_LABEL_PREFIX):]
+    return None
+
+
+# --- ゲームプロセス側 ---
+
+def _set_label(name):
+    try:
+        with open("/proc/self/comm", "w") as f:
+            f.write((ARCHIVE_LABEL_PREFIX + name)[:15])
+    except OSError:
+        pass
+
+
+def _labelled_play(label, play):
+    @functools.wraps(play)
+    def wrapper(*args, **kwargs):
+        _set_label(label)
+        try:
+            return play(*args, **kwargs)
+        finally:
+            _set_label(MENU_LABEL)
+    return wrapper
+
+
+def label_archives():
+    """
+    読み込み済みの games/ のモジュールについて、play() を持つクラスを包み、
+    実行中はプロセス名をそのアーカイブ名にする。オーケストレーターの実行前に呼ぶ
+    (import 済みのモジュールがそのまま使われるので、ゲーム側の変更は要らない)。
+    """
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, '__file__', None)
+        if not path or os.path.dirname(os.path.abspath(path)) != GAMES_DIR:
+            continue
+        label = name[len("archive_"):] if name.startswith("archive_") else name
+        for value in list(vars(module).values()):
+            if (isinstance(value, type) and value.__module__ == name
+                    and callable(value.__dict__.get('play'))):
+                value.play = _labelled_play(label, value.__dict__['play'])
+    _set_label(MENU_LABEL)
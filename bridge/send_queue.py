@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: 遅いクライアント向けの送信キュー
+# DESCRIPTION: PTY の読み取りと WebSocket への送信を切り離す。クライアントが遅れている間に
+#              溜まった出力は 1 フレームにまとめ (差分モードでは最新の画面との差分 1 つに畳み)、
+#              読み取り側、ひいてはゲームプロセスを送信待ちで止めないようにする。
+#              セッションの出力の上限 (bridge.throttle) に達した間も、同じように最新の画面にまとめる。
+
+import asyncio
+import os
+import time
+
+from bridge.input_protocol import clamp_size
+from bridge.vt_screen import Screen, message_to_ansi
+
+# 画面全体の消去。これより前のまだ送っていない出力は、最新の画面には関係しない
+CLEAR_SCREEN = b'\x1b[2J'
+# 差分のテキストは Unicode の罫線で書くので、送る前に文字集合を ASCII (G0) に戻す
+CHARSET_RESET = '\x1b(B\x0f'
+
+
+class QueueStats:
+    """
+    送信キューの深さ・まとめたフレーム数・送信待ちの回数を数える。
+    """
+    def __init__(self):
+        self.frames_in = 0
+        self.frames_out = 0
+        self.merged_frames = 0
+        self.max_depth = 0
+        self.stalls = 0
+        self.blocked_seconds = 0.0
+        self.throttled_seconds = 0.0
+
+    def merge(self, other):
+        self.frames_in += other.frames_in
+        self.frames_out += other.frames_out
+        self.merged_frames += other.merged_frames
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.stalls += other.stalls
+        self.blocked_seconds += other.blocked_seconds
+        self.throttled_seconds += other.throttled_seconds
+
+    def summary(self):
+        return (f"{self.frames_in} frames in -> {self.frames_out} sent, "
+                f"{self.merged_frames} merged/dropped, max depth {self.max_depth}, "
+                f"{self.stalls} stalls, reader blocked {self.blocked_seconds:.2f}s, "
+                f"throttled {self.throttled_seconds:.1f}s")
+
+
+# 全セッション合計
+TOTAL_QUEUE_STATS = QueueStats()
+
+
+class SendQueue:
+    """
+    セッションごとの送信キュー。
+
+    put() は基本的に待たずに戻り、別タスクが送信する。送信タスクは送る時点で
+    溜まっている出力をすべてまとめて 1 回で送るので、クライアントが遅いほどフレームが減る。
+      - 生バイトのモード (FrameSender): 溜まったバイト列を連結する (内容は欠けない)。
+        MAX_PENDING_BYTES を超えた場合に限り、put() が送信を待つ (メモリの上限)。
+      - 差分モード (DiffSender): 受け取った出力はすぐ画面に反映し、送る時には
+        クライアントが持っている画面から最新の画面への差分だけを送る。途中の画面は捨てる。
+
+    トランスポートの書き込みバッファが HIGH_WATER を超えている間は送らずに
+    LOW_WATER まで下がるのを待ち、その間に届いた出力はまとめられる。
+
+    出力の上限 (OutputBudget) に達した間 (間引き中) は、次に送れるまで待つ。生バイトのモードでは
+    さらに、画面全体の消去より前の未送信分を捨て、サーバー側の Screen に流し込んで
+    クライアントの画面からの差分だけを ANSI で送る (同じ画面の再描画なら何も送らない)。
+    """
+    # 環境変数 YGG_SEND_QUEUE_KB で調整できる
+    MAX_PENDING_BYTES = int(os.environ.get("YGG_SEND_QUEUE_KB", 1024)) * 1024
+    HIGH_WATER = 64 * 1024
+    LOW_WATER = 16 * 1024
+    POLL_INTERVAL = 0.01
+    # 間引き中の Screen を作る時に流し込む履歴の上限 (これより長ければ Screen を使わずに間引く)
+    MIRROR_SEED_LIMIT = 64 * 1024
+
+    def __init__(self, sender, transport=None, max_pending_bytes=None, budget=None, screen_seed=None):
+        """
+        Args:
+            sender (FrameSender | DiffSender): 実際の送信を行うオブジェクト。
+            transport (asyncio.Transport): 書き込みバッファを監視する接続 (request.transport)。
+            max_pending_bytes (int): 生バイトモードで溜めておける上限。省略時は MAX_PENDING_BYTES。
+            budget (OutputBudget): セッションの出力の上限。None なら制限しない。
+            screen_seed: 生バイトモードの間引きで使う関数。クライアントに送った出力の履歴
+                (最後の画面消去から) と端末サイズを (bytes, rows, cols) で返す。
+        """
+        self.sender = sender
+        self.transport = transport
+        self.max_pending_bytes = max_pending_bytes or self.MAX_PENDING_BYTES
+        self.budget = budget if budget else None
+        self._screen_seed = screen_seed
+        self._throttled = False
+        self._mirror = None
+        self._saved_bytes = 0
+        self._free_bytes = 0
+        self.stats = QueueStats()
+        self._pending = []
+        self._pending_bytes = 0
+        self._dirty = False
+        self._wakeup = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._closing = False
+        self._error = None
+        self._task = None
+
+    @property
+    def depth(self):
+        """送信待ちのフレーム数。"""
+        if self.sender.stateful:
+            return 1 if self._dirty else 0
+        return len(self._pending)
+
+    @property
+    def write_buffer_size(self):
+        if self.transport is None:
+            return 0
+        return self.transport.get_write_buffer_size()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def put(self, data, charge=True):
+        """
+        出力 1 フレーム分をキューに積む。
+
+        Args:
+            charge (bool): False なら出力の上限のバイト数に数えない (再接続時の再送など)。
+        """
+        if self._error is not None:
+            raise ConnectionResetError(f"送信タスクが停止しています: {self._error}")
+        self.stats.frames_in += 1
+        if not charge:
+            self._free_bytes += len(data)
+        elif self._throttled:
+            self.budget.demand(len(data))
+        if self.sender.stateful:
+            if self._dirty:
+                self.stats.merged_frames += 1
+            self.sender.feed(data)
+            self._dirty = True
+        else:
+            if self._throttled:
+                clear_at = data.rfind(CLEAR_SCREEN)
+                if clear_at >= 0:
+                    self._saved_bytes += self._pending_bytes + clear_at
+                    self.stats.merged_frames += len(self._pending)
+                    self._pending = []
+                    self._pending_bytes = 0
+                    data = data[clear_at:]
+            self._pending.append(data)
+            self._pending_bytes += len(data)
+        self.stats.max_depth = max(self.stats.max_depth, self.depth)
+        self._wakeup.set()
+
+        if self._pending_bytes > self.max_pending_bytes:
+            self._drained.clear()
+            started = time.monotonic()
+            await self._drained.wait()
+            self.stats.blocked_seconds += time.monotonic() - started
+
+    async def _wait_writable(self):
+        if self.write_buffer_size <= self.HIGH_WATER:
+            return
+        self.stats.stalls += 1
+        while self.write_buffer_size > self.LOW_WATER and not self.transport.is_closing():
+            await asyncio.sleep(self.POLL_INTERVAL)
+
+    async def _wait_budget(self):
+        """出力の上限に達していれば、次のフレームを送れるまで待つ。"""
+        # 再接続時の再送 (上限に数えない出力) を含む間は待たせない
+        if self.budget is None or self._closing or self._free_bytes or not self.depth:
+            return
+        delay = self.budget.delay()
+        if delay <= 0:
+            return
+        if not self._throttled:
+            self._start_throttle()
+        await asyncio.sleep(delay)
+
+    def _start_throttle(self):
+        self._throttled = True
+        self._saved_bytes = 0
+        self.budget.start_throttle()
+        if not self.sender.stateful and self._screen_seed is not None:
+            self._mirror = self._make_mirror()
+
+    def _make_mirror(self):
+        """クライアントの画面と同じ内容の Screen を作る。履歴が長すぎれば None。"""
+        history, rows, cols = self._screen_seed()
+        # PTY のサイズはクライアントの要求どおりなので、画面バッファの大きさを抑える
+        rows, cols = clamp_size(rows, cols)
+        pending = b''.join(self._pending)
+        # 履歴の末尾はまだ送っていない出力。送った分だけを流し込む
+        seed = history[:len(history) - len(pending)] if history.endswith(pending) else None
+        if seed is not None and len(seed) > self.MIRROR_SEED_LIMIT:
+            return None
+        screen = Screen(rows, cols)
+        if seed is not None:
+            screen.feed(seed)
+            screen.snapshot()  # クライアントは既にこの画面を表示している
+        # seed が None (未送信分に画面消去があり履歴が切り詰められた) なら、最初の差分は画面全体になる
+        return screen
+
+    def resize(self, rows, cols):
+        """端末サイズの変更を間引き中の Screen に反映する (次の差分は画面全体になる)。"""
+        if self._mirror is not None:
+            self._mirror.resize(*clamp_size(rows, cols))
+
+    def _end_throttle(self):
+        self._throttled = False
+        self._mirror = None
+        self.stats.throttled_seconds += self.budget.end_throttle(self._saved_bytes)
+        self._saved_bytes = 0
+
+    async def _send_pending(self):
+        """溜まっている出力を送り、送ったバイト数を返す。"""
+        if self.sender.stateful:
+            if not self._dirty:
+                return 0
+            self._dirty = False
+            sent = await self.sender.send_update()
+        else:
+            if not self._pending:
+                return 0
+            frames = self._pending
+            self._pending = []
+            self._pending_bytes = 0
+            self._drained.set()
+            self.stats.merged_frames += len(frames) - 1
+            data = frames[0] if len(frames) == 1 else b''.join(frames)
+            if self._mirror is not None:
+                self._mirror.feed(data)
+                message = self._mirror.diff()
+                self._saved_bytes += len(data)
+                if message is None:
+                    self.stats.merged_frames += 1
+                    return 0  # 同じ画面の再描画だった
+                data = (CHARSET_RESET + message_to_ansi(message) + self._mirror.state_ansi()).encode('utf-8')
+                self._saved_bytes -= len(data)
+            await self.sender.send(data)
+            sent = len(data)
+        self.stats.frames_out += 1
+        return sent
+
+    async def _run(self):
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                await self._wait_writable()
+                # ゲームの出力がしばらく上限を下回っていれば、これを送って間引きを終える
+                ending = self._throttled and self.budget.calm()
+                if not ending:
+                    await self._wait_budget()
+                sent = await self._send_pending()
+                if self.budget is not None and sent:
+                    self.budget.spend(max(0, sent - self._free_bytes))
+                self._free_bytes = 0
+                if ending:
+                    self._end_throttle()
+                if self._closing and not self.depth:
+                    await self.sender.flush()
+                    return
+        except Exception as e:
+            self._error = e
+        finally:
+            self._drained.set()
+
+    async def close(self):
+        """溜まっている出力を送り切ってから送信タスクを止める。"""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        await self._task
+        if self._error is not None:
+            raise self._error
+
+    def abort(self):
+        """送り切らずに送信タスクを止める (close() の後に呼んでも害はない)。"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def record_stats(self):
+        """このセッションの統計を全体合計へ積算する。"""
+        if self._throttled:
+            self._end_throttle()
+        TOTAL_QUEUE_STATS.merge(self.stats)
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: ブリッジサーバーの共通部分
+# DESCRIPTION: server.py / server_v2.py / server_v5.py が共有する WebSocket ハンドラと起動手順
+#              (入場制御、スポナーからの受け取り、セッションへの接続と切断、入力、統計のログ、
+#              起動時の設定の表示、ドレインまで)。各サーバーは起動するオーケストレーター (スポナー)、
+#              端末サイズの扱い、トップページだけを渡す。
+
+import asyncio
+import os
+import time
+import traceback
+
+from aiohttp import WSCloseCode, web
+
+from bridge.admission import AdmissionController, wait_for_admission
+from bridge.deflate import DeflateSettings, DeflateWebSocketResponse
+from bridge.drain import DrainController
+from bridge.event_loop import describe_event_loop, install_event_loop
+from bridge.health import add_health_routes
+from bridge.input_protocol import InputHandler, InputProtocolError, input_protocol_version
+from bridge.metrics import SPAWN_LATENCY, WS_MESSAGES_IN, metrics_handler
+from bridge.resources import ResourceLimits
+from bridge.session import SessionRegistry, session_token
+from bridge.spawn import get_winsize
+from bridge.static_cache import add_static_assets
+from bridge.transport import make_sender
+from bridge.warm_pool import WarmPool
+from bridge.workers import reuse_port, worker_label
+from bridge.zygote import ZygoteSpawner
+
+
+def make_spawner(script, env=None, winsize=(24, 80)):
+    """
+    YGG_SPAWNER=zygote ならアーカイブを読み込み済みの zygote から fork するスポナー、
+    それ以外はウォームプール (YGG_WARM_POOL_SIZE=0 でプール無効 = 接続ごとにコールドスタート)。
+
+    Args:
+        script (str): 実行するオーケストレーターのパス。
+        env (dict): 子プロセスで上書きする環境変数 (TERM など)。
+        winsize (tuple): 起動時の PTY サイズ (rows, cols)。
+    """
+    if os.environ.get("YGG_SPAWNER") == "zygote":
+        return ZygoteSpawner(script, env=env, winsize=winsize)
+    return WarmPool(script, size=int(os.environ.get("YGG_WARM_POOL_SIZE", 2)),
+                    env=dict(os.environ, **env) if env else None, winsize=winsize)
+
+
+async def websocket_handler(request):
+    """
+    WebSocketクライアントからの接続を処理し、ゲームプロセスを中継するハンドラ
+    """
+    # 停止前のドレイン中は新しいセッションを始めない (再接続は受け付ける)
+    request.app['drain'].refuse_if_draining(request)
+    ws = DeflateWebSocketResponse()
+    await ws.prepare(request)
+    print(f"クライアントが接続しました: {request.remote}")
+
+    sender = make_sender(request, ws)
+    fixed_winsize = request.app['fixed_winsize']
+
+    # ?session=<token> で切断中のセッションがあれば、ゲームプロセスをそのまま引き継ぐ
+    sessions = request.app['sessions']
+    token = session_token(request)
+    session = sessions.find(token)
+    pending_resize = None
+    if session is not None:
+        print(f"セッションに再接続しました (PID: {session.process.pid})")
+    else:
+        # 入場制御: 上限を超えていれば待合室で順番を待つ (待ち順は端末に表示)
+        admission = request.app['admission']
+        admitted, pending_resize = await wait_for_admission(admission, ws, sender)
+        if not admitted:
+            print(f"入場前に接続を終了しました: {request.remote}")
+            return ws
+        spawn_started = time.perf_counter()
+        try:
+            # スポナー (ウォームプール/zygote) から起動済みのゲームプロセスを受け取る
+            spawned = await request.app['spawner'].acquire()
+            session = sessions.create(token, spawned.process, spawned.master_fd)
+        finally:
+            admission.spawned()
+        SPAWN_LATENCY.observe(time.perf_counter() - spawn_started)
+        print(f"ゲームプロセスを開始しました (PID: {session.process.pid})")
+    # 再接続では PTY が前のクライアントのサイズのままなので、差分モードの画面もそれに合わせてから再送する
+    sender.resize(*get_winsize(session.master_fd))
+
+    def resize(rows, cols):
+        if fixed_winsize is not None:
+            # クライアントからのリサイズ要求は無視するが、ログは残す
+            print(f"クライアントからリサイズ要求がありました ({cols}x{rows}) が、"
+                  f"サーバー側は{fixed_winsize[0]}x{fixed_winsize[1]}に固定されています。")
+            return
+        # ゲームの終了後に届いたリサイズは無視する (master_fd は閉じられている)
+        if not session.resize(rows, cols):
+            return
+        sender.resize(rows, cols)
+        print(f"ターミナルサイズを変更: {cols}x{rows}")
+
+    # 待合室にいる間に届いたリサイズ要求を反映する
+    if pending_resize and fixed_winsize is None:
+        resize(*pending_resize)
+
+    # PTY->WS はセッション側のタスクが送信キュー経由で行う (遅いクライアントの間はフレームをまとめる)
+    send_queue = await session.attach(ws, sender, request.transport)
+    # キー入力はバイナリのコンパクトな形式 (?input=1) と従来の JSON のどちらでも受け付ける
+    input_handler = InputHandler(session, resize, input_protocol_version(request))
+
+    try:
+        async for msg in ws:
+            WS_MESSAGES_IN.inc()
+            if msg.type == web.WSMsgType.ERROR:
+                print(f"WS->PTY: WebSocket接続でエラー: {ws.exception()}")
+            else:
+                input_handler.feed(msg)
+    except InputProtocolError as e:
+        print(f"WS->PTY: 不正な入力メッセージのため切断します: {e}")
+        await ws.close(code=WSCloseCode.UNSUPPORTED_DATA, message=b'bad input message')
+    except Exception as e:
+        print(f"WS->PTY: 予期せぬエラー: {e}")
+    finally:
+        # ゲームプロセスは猶予時間の間は残し、再接続を待つ
+        session.detach(send_queue, dead_peer=ws.peer_timed_out)
+        ws.record_stats()
+        send_queue.record_stats()
+        print(f"圧縮統計: {ws.deflate_stats.summary()}")
+        print(f"送信キュー統計: {send_queue.stats.summary()}")
+        print(f"クライアントとの接続を終了しました: {request.remote}")
+    return ws
+
+
+async def create_app(spawner, index_page=None, fixed_winsize=None):
+    """
+    スポナーを起動し、セッション・入場制御・ドレインと各ルートを備えたアプリを作る。
+
+    Args:
+        spawner (WarmPool | ZygoteSpawner): ゲームプロセスを払い出すスポナー (start() はここで呼ぶ)。
+        index_page (str): / で返す public/ 以下のページ。None なら静的ファイルを配信しない。
+        fixed_winsize (tuple): (rows, cols)。指定するとクライアントからのリサイズを無視する。
+    """
+    app = web.Application()
+    await spawner.start()
+    app['spawner'] = spawner
+    app['fixed_winsize'] = fixed_winsize
+    app['sessions'] = SessionRegistry()
+    app['sessions'].start()
+    app['admission'] = AdmissionController(app['sessions'])
+    await app['admission'].start()
+    app['drain'] = DrainController(app)
+
+    async def close_spawner(app):
+        await app['admission'].close()
+        await app['sessions'].close()
+        await app['spawner'].close()
+    app.on_cleanup.append(close_spawner)
+
+    if index_page is not None:
+        # 静的ファイルの提供 (public ディレクトリ全体、起動時にメモリに読み込む)
+        assets = add_static_assets(app, '/public', './public') # /public/index.html でアクセス可能
+
+        # ルートパスへのアクセス時にトップページを返すハンドラ
+        async def index_handler(request):
+            return assets.response(request, index_page)
+        app.router.add_get('/', index_handler)
+
+    # WebSocketハンドラの追加
+    app.router.add_get('/websocket', websocket_handler)
+    # Prometheus 形式のメトリクス (スクレイプ時にだけ集計する)
+    app.router.add_get('/metrics', metrics_handler)
+    # ロードバランサー向けのヘルスチェック (メモリ上の状態だけで答える)
+    add_health_routes(app)
+    return app
+
+
+async def serve(app):
+    """アプリを待ち受けに出し、SIGTERM / Ctrl+C でドレインしてから停止する。"""
+    # Render環境では環境変数からポートとホストを取得
+    host = os.environ.get("HOST", "0.0.0.0")
+    port = int(os.environ.get("PORT", 8765))
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    # bridge.workers から起動された場合は SO_REUSEPORT で他のワーカーとポートを共有する
+    site = web.TCPSite(runner, host, port, reuse_port=reuse_port())
+    await site.start()
+
+    print(f"{worker_label()}aiohttpサーバーが http://{host}:{port} で起動しました。")
+    print(f"WebSocketは ws://{host}:{port}/websocket で利用可能です。")
+    print(f"イベントループ: {describe_event_loop()}")
+    print(f"WebSocket圧縮: {DeflateSettings().describe()}")
+    print(f"入場制御: {app['admission'].describe()}")
+    print(f"セッション: {app['sessions'].describe()}")
+    print(f"資源制限: {ResourceLimits().describe()}, {app['sessions'].cgroup.describe()}")
+    print(f"ドレイン: {app['drain'].describe()}")
+    print(f"ヘルスチェック: {app['health'].describe()}")
+
+    # SIGTERM (デプロイ時) / Ctrl+C が来るまで動き続け、セッションを片付けてから停止する
+    app['drain'].install()
+    await app['drain'].wait()
+    await runner.cleanup()
+
+
+def run_server(main):
+    """サーバーの __main__ から呼ぶ。イベントループを選んで main() を実行する。"""
+    # YGG_EVENT_LOOP=uvloop なら uvloop を使う (入っていなければ標準のループ)
+    install_event_loop()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nサーバーをシャットダウンします。")
+    except Exception as e:
+        print(f"サーバーの起動中にエラーが発生しました: {e}")
+        traceback.print_exc()
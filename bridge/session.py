@@ -0,0 +1,530 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: 切断に耐えるゲームセッション
+# DESCRIPTION: ゲームプロセスと PTY を WebSocket 接続から切り離して保持する。
+#              接続が切れても猶予時間内ならプロセスを生かしておき、同じトークンで
+#              再接続したクライアントに直近の出力 (または画面のスナップショット) を再送する。
+
+import asyncio
+import os
+import re
+import signal
+import time
+from collections import deque
+
+from aiohttp import WSCloseCode
+
+from bridge.coalesce import OutputCoalescer
+from bridge.metrics import (CHILD_EXITS, KEYSTROKE_LATENCY, ORPHAN_LIFETIME, ORPHANS, PTY_INPUT_BYTES,
+                            PTY_INPUT_WRITES, SESSION_CPU_SECONDS, SESSION_IDLE_EVENTS,
+                            SESSION_PLAYER_SECONDS, SESSIONS_STARTED, WS_DEAD_PEERS)
+from bridge.pty_reader import PtyReader
+from bridge.recording import RecordingSettings
+from bridge.resources import UNKNOWN_LABEL, CpuCgroup, read_archive, read_cpu_seconds
+from bridge.send_queue import SendQueue
+from bridge.spawn import get_winsize, set_winsize
+from bridge.throttle import OutputBudget
+
+# 再接続時、再送の前に端末をまっさらにする
+REPLAY_PREFIX = b'\x1b[0m\x1b[H\x1b[2J'
+
+# 別の接続にセッションを引き継がれた古い接続を閉じる時のクローズコード
+SESSION_TAKEN_OVER = 4000
+
+# notify() のお知らせ: カーソル位置を保存し、1 行目を赤地で上書きしてから戻す
+NOTICE_TEMPLATE = '\x1b7\x1b[1;1H\x1b[0;1;97;41m\x1b[2K {text}\x1b[0m\x1b8'
+
+# クライアントが生成するトークン (crypto.randomUUID() 等) の形式
+TOKEN_PATTERN = re.compile(r'^[A-Za-z0-9_-]{16,128}$')
+
+
+def session_token(request):
+    """
+    WebSocket の URL の ?session=<token> を返す。形式が不正なら None (再接続不可の新規セッション)。
+    """
+    token = request.query.get("session", "")
+    return token if TOKEN_PATTERN.match(token) else None
+
+
+class ScrollbackBuffer:
+    """
+    直近の PTY 出力を最大 limit バイトまで保持するリングバッファ。
+
+    画面全体の消去 (ESC[2J) を含むチャンクが来たら、それより前の出力は再送しても
+    すぐ消されるだけなので捨てる。curses のゲームでは、これで再送が最後の全画面描画からになる。
+    """
+    CLEAR_SCREEN = b'\x1b[2J'
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._chunks = deque()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, data):
+        clear_at = data.rfind(self.CLEAR_SCREEN)
+        if clear_at >= 0:
+            self._chunks.clear()
+            self._size = 0
+            data = data[clear_at:]
+        self._chunks.append(data)
+        self._size += len(data)
+        # チャンク単位で古いものから捨てる (最後の 1 つは大きくても残す)
+        while self._size > self.limit and len(self._chunks) > 1:
+            self._size -= len(self._chunks.popleft())
+
+    def getvalue(self):
+        return b''.join(self._chunks)
+
+
+class GameSession:
+    """
+    1 つのゲームプロセスと、その PTY 出力の行き先。
+
+    PTY の読み取りはクライアントの有無と関係なく続け (ゲームが書き込みで止まらないように)、
+    出力はスクロールバックに積みつつ、接続中のクライアントがいればその送信キューへ渡す。
+    """
+    def __init__(self, registry, token, process, master_fd):
+        self.registry = registry
+        self.token = token
+        self.process = process
+        self.master_fd = master_fd
+        self.reader = PtyReader(master_fd)
+        self.coalescer = OutputCoalescer(self.reader)
+        self.scrollback = ScrollbackBuffer(registry.scrollback_bytes)
+        self.created_at = time.monotonic()
+        self.detached_at = None
+        self.reattach_count = 0
+        self.ended = False
+        self.reclaimed = False
+        self.hibernating = False
+        self.last_activity = time.monotonic()
+        self.cgroup_path = None
+        # ウォームプールで待機していた間の CPU 時間は数えない
+        self.cpu_seconds = read_cpu_seconds(process.pid) or 0.0
+        self.cpu_percent = 0.0
+        self.archive = None
+        # 録画 (YGG_RECORD_DIR が設定されている時だけ。SessionRegistry.create() で設定する)
+        self.recorder = None
+        # クライアントへ送る出力の上限 (再接続しても引き継ぐ)
+        self.budget = OutputBudget(process.pid)
+        # ゲームの終了時にクライアントへ送るクローズコード (1000 ならクライアントはトークンを捨てる)
+        self.close_code = WSCloseCode.OK
+        self._cpu_sampled_at = time.monotonic()
+        self._ws = None
+        self._queue = None
+        self._pump_task = None
+        self._expire_task = None
+        self._ended = asyncio.Event()
+        self._input_at = None
+        self._pending_input = bytearray()
+        self._writer_waiting = False
+
+    @property
+    def attached(self):
+        return self._queue is not None
+
+    @property
+    def state(self):
+        """メトリクス用の状態 (hibernating / attached / detached)。"""
+        if self.hibernating:
+            return "hibernating"
+        return "attached" if self.attached else "detached"
+
+    @property
+    def idle_seconds(self):
+        """最後のキー入力または出力からの経過秒数。"""
+        return time.monotonic() - self.last_activity
+
+    @property
+    def send_queue(self):
+        """接続中のクライアントの送信キュー (切り離し中は None)。"""
+        return self._queue
+
+    def start(self):
+        self._pump_task = asyncio.create_task(self._pump())
+
+    def queue_input(self, data):
+        """
+        クライアントからのキー入力 (bytes) を PTY への書き込み待ちに積む。
+
+        同じイベントループの周回で届いた入力 (貼り付けで連続したフレームなど) は
+        まとめて 1 回の write で書く。PTY のバッファが一杯なら、書けるようになるまで持っておく。
+        """
+        if self.ended or not data:
+            return
+        self.last_activity = time.monotonic()
+        if self.hibernating:
+            self.wake()
+        if not self._pending_input and not self._writer_waiting:
+            asyncio.get_running_loop().call_soon(self._flush_input)
+        self._pending_input += data
+        PTY_INPUT_BYTES.inc(len(data))
+        if self.recorder is not None:
+            self.recorder.input(data)
+        # 最初のキー入力から次の出力までをキー入力→出力のレイテンシとして測る
+        if self._input_at is None:
+            self._input_at = time.monotonic()
+
+    def _flush_input(self):
+        if self.ended or not self._pending_input:
+            return
+        try:
+            written = os.write(self.master_fd, self._pending_input)
+        except BlockingIOError:
+            written = 0
+        except OSError:
+            # ゲームプロセス側が閉じている。後始末は _pump() が行う
+            self._pending_input.clear()
+            return
+        del self._pending_input[:written]
+        PTY_INPUT_WRITES.inc()
+        self.coalescer.note_input()
+        loop = asyncio.get_running_loop()
+        if self._pending_input and not self._writer_waiting:
+            loop.add_writer(self.master_fd, self._flush_input)
+            self._writer_waiting = True
+        elif not self._pending_input and self._writer_waiting:
+            loop.remove_writer(self.master_fd)
+            self._writer_waiting = False
+
+    async def _pump(self):
+        try:
+            while True:
+                output = await self.coalescer.read_frame()
+                if not output:
+                    break # 子プロセス側のPTYが全て閉じられた (プロセス終了)
+                self.last_activity = time.monotonic()
+                if self._input_at is not None:
+                    KEYSTROKE_LATENCY.observe(time.monotonic() - self._input_at)
+                    self._input_at = None
+                self.scrollback.append(output)
+                if self.recorder is not None:
+                    self.recorder.output(output)
+                queue = self._queue
+                if queue is not None:
+                    try:
+                        await queue.put(output)
+                    except ConnectionResetError:
+                        pass  # クライアント側のハンドラが detach() する
+        except Exception as e:
+            print(f"PTY->WS: 予期せぬエラー: {e}")
+        finally:
+            await self._finish()
+
+    async def _finish(self):
+        self.ended = True
+        if self._expire_task:
+            self._expire_task.cancel()
+        queue, ws = self._queue, self._ws
+        if queue is not None:
+            try:
+                await queue.close()
+                await ws.close(code=self.close_code)
+            except Exception:
+                pass  # 送り切る前にクライアントも切れていた
+        self.reader.close()
+        if self._writer_waiting:
+            asyncio.get_running_loop().remove_writer(self.master_fd)
+            self._writer_waiting = False
+        # 統計を全体合計へ移すのと登録の解除は同時に行う (/metrics で二重に数えないように)
+        self.coalescer.close()
+        self.registry.remove(self)
+        if self.process.returncode is None:
+            self.process.terminate()
+        await self.process.wait()
+        # ゲームが起動した子孫プロセスが残っていれば、プロセスグループごと止める
+        self._signal_group(signal.SIGKILL)
+        self.registry.cgroup.remove(self.cgroup_path)
+        os.close(self.master_fd)
+        if self.recorder is not None:
+            await self.recorder.close()
+        CHILD_EXITS.inc(label_values=(str(self.process.returncode),))
+        if self.detached_at is not None:
+            self._end_orphan("reclaimed" if self.reclaimed else "exited")
+        self._ended.set()
+        print(f"ゲームプロセス (PID: {self.process.pid}) が終了しました。Exit Code: {self.process.returncode}")
+        print(f"出力統計: {self.coalescer.stats.summary()}")
+        print(f"CPU 使用量: {self.cpu_seconds:.2f}s (最終サンプル時点)")
+        if self.recorder is not None:
+            print(f"録画: {self.recorder.summary()}")
+
+    async def attach(self, ws, sender, transport):
+        """
+        クライアントを接続する。再接続の場合はスクロールバックを先に再送する。
+        別のクライアントが接続中ならそちらを切断して引き継ぐ (モバイルで古い接続が残っている場合)。
+
+        Returns:
+            SendQueue: このクライアント用の送信キュー。
+        """
+        if self._expire_task:
+            self._expire_task.cancel()
+            self._expire_task = None
+        reattach = self.detached_at is not None or self._queue is not None
+        if self._queue is not None:
+            self._queue.abort()
+            asyncio.create_task(self._ws.close(code=SESSION_TAKEN_OVER, message=b'session taken over'))
+            self._queue = None
+
+        queue = SendQueue(sender, transport, budget=self.budget, screen_seed=self._screen_seed)
+        queue.start()
+        replay = self.scrollback.getvalue()
+        if self.detached_at is not None:
+            self._end_orphan("reattached")
+        if reattach:
+            self.reattach_count += 1
+            replay = REPLAY_PREFIX + replay
+            SESSIONS_STARTED.inc(label_values=("reattach",))
+        if replay:
+            # 再送が済むまで self._queue に登録しないので、新しい出力が再送を追い越すことはない
+            await queue.put(replay, charge=False)
+        self._ws = ws
+        self._queue = queue
+        self.detached_at = None
+        self.last_activity = time.monotonic()
+        return queue
+
+    def _screen_seed(self):
+        """送信キューが間引きに使う、クライアントの画面の元になる出力と端末サイズ。"""
+        rows, cols = get_winsize(self.master_fd)
+        return self.scrollback.getvalue(), rows, cols
+
+    def detach(self, queue, dead_peer=False):
+        """
+        クライアントの切断時に呼ぶ。猶予時間が 0 ならプロセスを終了し、
+        そうでなければ猶予時間の間だけ再接続を待つ。
+
+        Args:
+            dead_peer (bool): ハートビートに応答がなく切断した。猶予時間を dead_peer_grace_seconds
+                までに縮める (クライアントが生きていれば自分で再接続してくるため)。
+        """
+        queue.abort()
+        if self._queue is not queue:
+            return  # 既に別のクライアントに引き継がれている
+        self._queue = None
+        self._ws = None
+        if dead_peer:
+            WS_DEAD_PEERS.inc()
+        if self.ended:
+            return
+        self.detached_at = time.monotonic()
+        grace = self.registry.grace_seconds
+        if dead_peer:
+            grace = min(grace, self.registry.dead_peer_grace_seconds)
+            print(f"クライアントの応答がありません (PID: {self.process.pid})。")
+        if grace <= 0 or self.token is None:
+            self.terminate()
+        else:
+            print(f"セッションを切り離しました (PID: {self.process.pid})。{grace:.0f}秒以内の再接続を待ちます。")
+            self._expire_task = asyncio.create_task(self._expire_after(grace))
+
+    def _end_orphan(self, outcome):
+        ORPHAN_LIFETIME.observe(time.monotonic() - self.detached_at)
+        ORPHANS.inc(label_values=(outcome,))
+
+    async def _expire_after(self, grace):
+        await asyncio.sleep(grace)
+        print(f"再接続がないため、ゲームプロセスを終了します (PID: {self.process.pid})。")
+        self.terminate()
+
+    async def notify(self, text):
+        """
+        接続中のクライアントの端末に 1 行のお知らせを重ねて表示する。
+        スクロールバックと録画には残さない (再接続時に古いお知らせが出ないように)。
+        """
+        queue = self._queue
+        if queue is None:
+            return
+        try:
+            await queue.put(NOTICE_TEMPLATE.format(text=text).encode('utf-8'))
+        except ConnectionResetError:
+            pass
+
+    def resize(self, rows, cols):
+        """
+        PTY のウィンドウサイズを変え、送信キュー (間引き中の画面) に伝えて録画に残す。
+        ゲームが終了した後 (master_fd は閉じたか閉じる途中で、番号が別のセッションに再利用されうる)
+        に届いたリサイズは無視する。
+
+        Returns:
+            bool: サイズを変えたか。
+        """
+        if self.ended:
+            return False
+        set_winsize(self.master_fd, rows, cols)
+        if self._queue is not None:
+            self._queue.resize(rows, cols)
+        if self.recorder is not None:
+            self.recorder.resize(rows, cols)
+        return True
+
+    def sample_cpu(self):
+        """
+        ゲームプロセスの CPU 時間を読み、前回からの増分をその時点で実行中のアーカイブに計上する。
+        プレイヤーが接続していた時間も同じアーカイブに計上するので、アーカイブごとの
+        「プレイヤー 1 分あたりの CPU 時間」が求められる。
+        """
+        now = time.monotonic()
+        cpu = read_cpu_seconds(self.process.pid)
+        if cpu is None:
+            return
+        archive = read_archive(self.process.pid) or UNKNOWN_LABEL
+        elapsed = now - self._cpu_sampled_at
+        used = max(0.0, cpu - self.cpu_seconds)
+        if used:
+            SESSION_CPU_SECONDS.inc(used, (archive,))
+        if self.attached and not self.hibernating:
+            SESSION_PLAYER_SECONDS.inc(elapsed, (archive,))
+        self.cpu_percent = 100.0 * used / elapsed if elapsed > 0 else 0.0
+        self.cpu_seconds = cpu
+        self.archive = archive
+        self._cpu_sampled_at = now
+
+    def hibernate(self):
+        """
+        無操作のセッションのプロセスグループを SIGSTOP で止める。
+        メニューで待っている間も nodelay + sleep のループで CPU を使い続けるゲームがあるため。
+        """
+        if self.hibernating or self.ended or self.process.returncode is not None:
+            return
+        self._signal_group(signal.SIGSTOP)
+        self.hibernating = True
+        SESSION_IDLE_EVENTS.inc(label_values=("hibernate",))
+        print(f"無操作のためセッションを休止しました (PID: {self.process.pid}, {self.idle_seconds:.0f}秒)")
+
+    def wake(self):
+        """休止中のプロセスグループを SIGCONT で再開する。"""
+        if not self.hibernating:
+            return
+        self.hibernating = False
+        self._signal_group(signal.SIGCONT)
+        SESSION_IDLE_EVENTS.inc(label_values=("wake",))
+
+    def _signal_group(self, signum):
+        # ゲームプロセスは setsid() 済みなので、PID がそのままプロセスグループ ID
+        try:
+            os.killpg(self.process.pid, signum)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def terminate(self):
+        if self.process.returncode is None:
+            self.reclaimed = True
+            self.process.terminate()
+            # 止まったままだと SIGTERM のハンドラが動かないので再開させる
+            if self.hibernating:
+                self.hibernating = False
+                self._signal_group(signal.SIGCONT)
+
+    async def wait_closed(self):
+        await self._ended.wait()
+
+
+class SessionRegistry:
+    """
+    トークンごとのゲームセッション。サーバーごとに 1 つ (app['sessions'])。
+    定期的な見回りで各セッションの CPU 時間を計測し、無操作のセッションは休止 (SIGSTOP) させ、
+    さらに長く放置されたものは終了させる。
+    """
+    # 環境変数 YGG_SESSION_GRACE_SEC / YGG_DEAD_PEER_GRACE_SEC / YGG_SCROLLBACK_KB / YGG_HIBERNATE_SEC /
+    # YGG_IDLE_TIMEOUT_SEC で調整できる (休止と終了はそれぞれ 0 で無効)
+    GRACE_SECONDS = float(os.environ.get("YGG_SESSION_GRACE_SEC", 120))
+    # ハートビートで応答のないことが分かったクライアントの再接続を待つ時間
+    DEAD_PEER_GRACE_SECONDS = float(os.environ.get("YGG_DEAD_PEER_GRACE_SEC", 30))
+    SCROLLBACK_BYTES = int(os.environ.get("YGG_SCROLLBACK_KB", 256)) * 1024
+    HIBERNATE_SECONDS = float(os.environ.get("YGG_HIBERNATE_SEC", 60))
+    IDLE_TIMEOUT_SECONDS = float(os.environ.get("YGG_IDLE_TIMEOUT_SEC", 3600))
+    MONITOR_INTERVAL = 5.0
+
+    def __init__(self, grace_seconds=None, scrollback_bytes=None, hibernate_seconds=None,
+                 idle_timeout_seconds=None, dead_peer_grace_seconds=None):
+        self.grace_seconds = self.GRACE_SECONDS if grace_seconds is None else grace_seconds
+        self.dead_peer_grace_seconds = (self.DEAD_PEER_GRACE_SECONDS if dead_peer_grace_seconds is None
+                                        else dead_peer_grace_seconds)
+        self.scrollback_bytes = scrollback_bytes or self.SCROLLBACK_BYTES
+        self.hibernate_seconds = self.HIBERNATE_SECONDS if hibernate_seconds is None else hibernate_seconds
+        self.idle_timeout_seconds = (self.IDLE_TIMEOUT_SECONDS if idle_timeout_seconds is None
+                                     else idle_timeout_seconds)
+        self._by_token = {}
+        self._sessions = set()
+        self.cgroup = CpuCgroup()
+        self.recording = RecordingSettings()
+        self._monitor = None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __iter__(self):
+        return iter(list(self._sessions))
+
+    def start(self):
+        """セッションを見回るタスクを開始する。"""
+        self._monitor = asyncio.create_task(self._monitor_loop())
+
+    def describe(self):
+        hibernate = f"{self.hibernate_seconds:g}s" if self.hibernate_seconds > 0 else "無効"
+        timeout = f"{self.idle_timeout_seconds:g}s" if self.idle_timeout_seconds > 0 else "無効"
+        return (f"grace={self.grace_seconds:g}s (応答なし {self.dead_peer_grace_seconds:g}s), hibernate={hibernate}, idle_timeout={timeout}, "
+                f"{OutputBudget().describe()}, 録画={self.recording.describe()}")
+
+    async def _monitor_loop(self):
+        while True:
+            await asyncio.sleep(self.MONITOR_INTERVAL)
+            for session in list(self._sessions):
+                if not session.ended:
+                    session.sample_cpu()
+            self.reap()
+
+    def reap(self):
+        """無操作の時間に応じて、セッションを休止または終了させる。"""
+        for session in list(self._sessions):
+            if session.ended:
+                continue
+            idle = session.idle_seconds
+            if 0 < self.idle_timeout_seconds <= idle:
+                print(f"{idle:.0f}秒間操作がないため、ゲームプロセスを終了します (PID: {session.process.pid})。")
+                SESSION_IDLE_EVENTS.inc(label_values=("reap",))
+                session.terminate()
+            elif 0 < self.hibernate_seconds <= idle:
+                session.hibernate()
+
+    def find(self, token):
+        """再接続できるセッションがあれば返す。"""
+        if token is None:
+            return None
+        session = self._by_token.get(token)
+        if session is None or session.ended:
+            return None
+        return session
+
+    def create(self, token, process, master_fd):
+        session = GameSession(self, token, process, master_fd)
+        session.cgroup_path = self.cgroup.add(process.pid)
+        session.recorder = self.recording.open(process.pid)
+        if token is not None:
+            old = self._by_token.get(token)
+            if old is not None:
+                old.terminate()
+            self._by_token[token] = session
+        self._sessions.add(session)
+        SESSIONS_STARTED.inc(label_values=("new",))
+        session.start()
+        return session
+
+    def remove(self, session):
+        self._sessions.discard(session)
+        if session.token is not None and self._by_token.get(session.token) is session:
+            del self._by_token[session.token]
+
+    async def close(self):
+        """全セッションのゲームプロセスを終了させ、後始末が終わるのを待つ。"""
+        if self._monitor:
+            self._monitor.cancel()
+        sessions = list(self._sessions)
+        for session in sessions:
+            session.terminate()
+        for session in sessions:
+            await session.wait_closed()
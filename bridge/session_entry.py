@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: セッションプロセスのエントリポイント
+# DESCRIPTION: オーケストレーターを事前にインポートした状態で待機し、
+#              サーバーから開始の合図を受けたら __main__ として実行する。
+#
+# 使い方: python3 -m bridge.session_entry [--ctty] [--go-fd FD] [--rlimit-cpu SEC] [--rlimit-as MB]
+#             ./yggdrasil_orchestrator_v2.py
+
+import argparse
+import contextlib
+import fcntl
+import io
+import os
+import random
+import runpy
+import sys
+import termios
+import types
+
+from bridge.resources import ResourceLimits, label_archives
+
+
+def preload(script_path):
+    """
+    スクリプトをコンパイルし、__main__ 以外の名前で一度実行しておく。
+    トップレベルの import (games/archive_* など) はここで sys.modules に載る。
+
+    Returns:
+        code: コンパイル済みのコードオブジェクト。失敗した場合は None
+              (本番の実行時に同じエラーを PTY 上へ出させるため、ここでは握りつぶす)。
+    """
+    try:
+        with open(script_path, 'rb') as f:
+            source = f.read()
+        code = compile(source, script_path, 'exec')
+        module = types.ModuleType('_ygg_preload')
+        module.__file__ = script_path
+        sink = io.StringIO()
+        with contextlib.redirect_stdout(sink), contextlib.redirect_stderr(sink):
+            exec(code, module.__dict__)
+        return code
+    except BaseException:
+        return None
+
+
+def run_main(script_path, code):
+    """プリロード済みのコードを __main__ モジュールとして実行する。"""
+    if code is None:
+        runpy.run_path(script_path, run_name='__main__')
+        return
+    main_module = types.ModuleType('__main__')
+    main_module.__file__ = script_path
+    sys.modules['__main__'] = main_module
+    exec(code, main_module.__dict__)
+
+
+def acquire_ctty():
+    """
+    stdin の PTY を制御端末にする。start_new_session=True で setsid 済みであることが前提。
+    これで端末サイズ変更時の SIGWINCH や切断時の SIGHUP が届くようになる。
+    """
+    try:
+        fcntl.ioctl(0, termios.TIOCSCTTY, 0)
+    except OSError:
+        pass
+
+
+def wait_for_go(go_fd):
+    """
+    サーバーが go_fd に書き込むまで待機する。
+
+    Returns:
+        bool: 開始の合図なら True。合図なしでパイプが閉じられた (プールから破棄された) なら False。
+    """
+    try:
+        return os.read(go_fd, 1) != b''
+    finally:
+        os.close(go_fd)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Yggdrasil session entry point")
+    parser.add_argument('--ctty', action='store_true',
+                        help="stdin の PTY を制御端末として取得する")
+    parser.add_argument('--go-fd', type=int, default=None,
+                        help="開始の合図を待つパイプの fd (省略時は即座に開始)")
+    ResourceLimits.add_arguments(parser)
+    parser.add_argument('script', help="実行するオーケストレーターのパス")
+    args = parser.parse_args()
+
+    script_path = os.path.abspath(args.script)
+    # `python3 script.py` と同じく、スクリプトのディレクトリを import パスの先頭に置く
+    sys.path[0] = os.path.dirname(script_path)
+    sys.argv = [args.script]
+
+    if args.ctty:
+        acquire_ctty()
+    code = preload(script_path)
+    if args.go_fd is not None and not wait_for_go(args.go_fd):
+        sys.exit(0)
+    # 制限はプリロードの後に掛ける (待機中の分は数えない)
+    ResourceLimits.from_args(args).apply()
+    label_archives()
+    # 記録した入力を再生する時は、乱数の種を固定して毎回同じ展開にする (benchmarks.replay)
+    seed = os.environ.get("YGG_REPLAY_SEED")
+    if seed:
+        random.seed(int(seed))
+    run_main(script_path, code)
+
+
+if __name__ == "__main__":
+    main()
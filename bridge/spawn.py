@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: セッションプロセスの高速な起動
+# DESCRIPTION: preexec_fn=os.setsid を使うと CPython は Python のフックを挟むため
+#              fork+exec の遅い経路に固定され、vfork が使えない。ここでは
+#              start_new_session=True (setsid は C 側で実行) を使い、制御端末の設定は
+#              子プロセス側の bridge.session_entry --ctty、ウィンドウサイズは親が
+#              master fd に対して設定することで、Python の preexec フックを不要にしている。
+
+import asyncio
+import fcntl
+import os
+import pty
+import struct
+import sys
+import termios
+
+
+def set_winsize(fd, rows, cols):
+    """PTY のウィンドウサイズを設定する。"""
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack("HHHH", rows, cols, 0, 0))
+
+
+def get_winsize(fd):
+    """PTY のウィンドウサイズを (rows, cols) で返す。"""
+    rows, cols, _, _ = struct.unpack("HHHH", fcntl.ioctl(fd, termios.TIOCGWINSZ, b'\0' * 8))
+    return rows, cols
+
+
+def session_command(script, go_fd=None, limits=None):
+    """bridge.session_entry 経由でオーケストレーターを起動するコマンドライン。"""
+    command = [sys.executable, "-m", "bridge.session_entry", "--ctty"]
+    if go_fd is not None:
+        command += ["--go-fd", str(go_fd)]
+    if limits is not None:
+        command += limits.args()
+    command.append(script)
+    return command
+
+
+async def spawn_session(script, rows=24, cols=80, env=None, go_fd=None, limits=None):
+    """
+    新しい PTY 上にセッションプロセスを起動する。
+
+    Args:
+        script (str): 実行するオーケストレーターのパス。
+        rows (int), cols (int): 起動時の PTY サイズ。
+        env (dict): 子プロセスの環境変数 (省略時はサーバーと同じ)。
+        go_fd (int): 渡すと、その fd に合図が来るまで子プロセスは待機する (ウォームプール用)。
+        limits (ResourceLimits): 子プロセスに掛ける rlimit (省略時は子プロセスの環境変数 YGG_RLIMIT_* の設定)。
+
+    Returns:
+        tuple: (asyncio.subprocess.Process, 非ブロッキングに設定済みの master fd)
+    """
+    master_fd, slave_fd = pty.openpty()
+    try:
+        set_winsize(master_fd, rows, cols)
+        process = await asyncio.create_subprocess_exec(
+            *session_command(script, go_fd, limits),
+            stdin=slave_fd,
+            stdout=slave_fd,
+            stderr=slave_fd,
+            env=env,
+            pass_fds=(go_fd,) if go_fd is not None else (),
+            start_new_session=True
+        )
+    except BaseException:
+        os.close(master_fd)
+        raise
+    finally:
+        # 親側のslave fdを閉じておくと、子プロセス終了時にmaster側がEOF(EIO)になる
+        os.close(slave_fd)
+    fcntl.fcntl(master_fd, fcntl.F_SETFL, os.O_NONBLOCK)
+    return process, master_fd
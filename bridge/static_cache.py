@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: 静的ファイルのメモリキャッシュ
+# DESCRIPTION: public/ を起動時にすべてメモリに読み込み、gzip (brotli が入っていれば brotli も)
+#              で圧縮した版を事前に作っておく。リクエストごとにディスクを読まず、
+#              強い ETag と If-None-Match (304) でブラウザのキャッシュを再検証させる。
+#              YGG_STATIC_DEV=1 の開発モードでは、リクエストのたびに更新日時を見て読み直す。
+
+import gzip
+import hashlib
+import html
+import mimetypes
+import os
+import time
+from email.utils import formatdate
+
+from aiohttp import hdrs, web
+
+from bridge.metrics import STATIC_REQUESTS
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 圧縮して効果のある Content-Type (画像などは圧縮済みなのでそのまま送る)
+COMPRESSIBLE_TYPES = (
+    "text/", "application/javascript", "application/json", "application/xml", "image/svg+xml",
+)
+
+# Content-Encoding の優先順 (Accept-Encoding で同じ q 値なら前のものを選ぶ)
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, default).lower() in ("1", "true", "yes")
+
+
+class Asset:
+    """1 ファイル分の中身と、事前に圧縮した版 (encoding -> bytes)。"""
+    __slots__ = ("content_type", "body", "etag", "last_modified", "mtime", "variants")
+
+    def __init__(self, content_type, body, mtime, min_compress_bytes):
+        self.content_type = content_type
+        self.body = body
+        self.mtime = mtime
+        self.last_modified = formatdate(mtime, usegmt=True)
+        # 強い ETag は表現ごとに別の値にする (gzip 版と元の版はバイト列が違う)
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        self.variants = {}
+        if len(body) >= min_compress_bytes and content_type.startswith(COMPRESSIBLE_TYPES):
+            for encoding in ENCODINGS:
+                compressed = _compress(encoding, body)
+                if len(compressed) < len(body):
+                    self.variants[encoding] = (compressed, f'"{digest}-{encoding}"')
+
+    def select(self, accept_encoding):
+        """Accept-Encoding に合う (body, etag, encoding)。圧縮版が使えなければ encoding は None。"""
+        if self.variants and accept_encoding:
+            accepted = _parse_accept_encoding(accept_encoding)
+            best = max(((accepted.get(encoding, accepted.get("*", 0.0)), -i, encoding)
+                        for i, encoding in enumerate(ENCODINGS) if encoding in self.variants),
+                       default=None)
+            if best is not None and best[0] > 0:
+                body, etag = self.variants[best[2]]
+                return body, etag, best[2]
+        return self.body, self.etag, None
+
+
+def _compress(encoding, data):
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    # mtime=0 にして、同じ内容なら毎回同じバイト列 (= 同じ ETag) になるようにする
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _parse_accept_encoding(value):
+    """'gzip, br;q=0.5' -> {'gzip': 1.0, 'br': 0.5}"""
+    accepted = {}
+    for item in value.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    return accepted
+
+
+def _etag_matches(if_none_match, etag):
+    """If-None-Match の照合 (RFC 9110 の弱い比較なので W/ は無視する)。"""
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class StaticAssets:
+    """
+    ディレクトリ 1 つ分の静的ファイルをメモリに持つ。環境変数で既定値を変えられる:
+      YGG_STATIC_DEV          1 でリクエストごとに更新を確認して読み直す (開発用)
+      YGG_STATIC_MIN_BYTES    これより小さいファイルは圧縮版を作らない
+      YGG_STATIC_CACHE_CONTROL 返す Cache-Control (既定は ETag で毎回再検証させる no-cache)
+    """
+    DEV = _env_flag("YGG_STATIC_DEV", "0")
+    MIN_COMPRESS_BYTES = int(os.environ.get("YGG_STATIC_MIN_BYTES", 256))
+    CACHE_CONTROL = os.environ.get("YGG_STATIC_CACHE_CONTROL", "no-cache")
+
+    def __init__(self, directory, show_index=False, dev=None, min_compress_bytes=None):
+        """
+        Args:
+            directory (str): 配信するディレクトリ (public など)。
+            show_index (bool): ディレクトリへのリクエストにファイル一覧を返す (add_static と同じ)。
+            dev (bool): 開発モード。None なら YGG_STATIC_DEV に従う。
+        """
+        self.directory = os.path.abspath(directory)
+        self.show_index = show_index
+        self.dev = self.DEV if dev is None else dev
+        self.min_compress_bytes = self.MIN_COMPRESS_BYTES if min_compress_bytes is None else min_compress_bytes
+        self.assets = {}
+        self.load_seconds = 0.0
+        self.reload()
+
+    def reload(self):
+        """
+        ディレクトリを走査して、新しいファイルや更新日時が変わったファイルだけ読み込み直す。
+        消えたファイルはキャッシュから外す。読み直したファイル数を返す。
+        """
+        started = time.perf_counter()
+        assets = {}
+        listings = {}
+        changed = 0
+        for root, dirs, files in os.walk(self.directory):
+            dirs.sort()
+            rel_dir = os.path.relpath(root, self.directory).replace(os.sep, "/")
+            rel_dir = "" if rel_dir == "." else rel_dir + "/"
+            listings[rel_dir] = [d + "/" for d in dirs] + sorted(files)
+            for name in files:
+                key = rel_dir + name
+                path = os.path.join(root, name)
+                try:
+                    mtime = os.stat(path).st_mtime
+                    cached = self.assets.get(key)
+                    if cached is not None and cached.mtime == mtime:
+                        assets[key] = cached
+                        continue
+                    with open(path, "rb") as f:
+                        body = f.read()
+                except OSError as e:
+                    print(f"静的ファイル: {path} を読み込めませんでした: {e}")
+                    continue
+                content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                if content_type.startswith("text/") or content_type == "application/javascript":
+                    content_type += "; charset=utf-8"
+                assets[key] = Asset(content_type, body, mtime, self.min_compress_bytes)
+                changed += 1
+        if self.show_index:
+            for rel_dir, names in listings.items():
+                assets[rel_dir] = self._listing(rel_dir, names, assets)
+        self.assets = assets
+        self.load_seconds = time.perf_counter() - started
+        return changed
+
+    def _listing(self, rel_dir, names, assets):
+        """ディレクトリの一覧ページ (aiohttp の show_index=True と同じ体裁)。"""
+        title = html.escape(f"Index of /{rel_dir}")
+        items = "\n".join(f'<li><a href="{html.escape(name)}">{html.escape(name)}</a></li>' for name in names)
+        page = (f"<html>\n<head>\n<title>{title}</title>\n</head>\n<body>\n<h1>{title}</h1>\n"
+                f"<ul>\n{items}\n</ul>\n</body>\n</html>")
+        mtime = max((assets[rel_dir + n].mtime for n in names if rel_dir + n in assets),
+                    default=0)
+        return Asset("text/html; charset=utf-8", page.encode("utf-8"), mtime, self.min_compress_bytes)
+
+    def response(self, request, key):
+        """
+        key (ディレクトリからの相対パス) のファイルを返すレスポンス。無ければ HTTPNotFound を送出する。
+        """
+        if self.dev:
+            self.reload()
+        asset = self.assets.get(key)
+        if asset is None:
+            STATIC_REQUESTS.inc(label_values=("miss",))
+            raise web.HTTPNotFound()
+
+        body, etag, encoding = asset.select(request.headers.get(hdrs.ACCEPT_ENCODING))
+        headers = {
+            hdrs.ETAG: etag,
+            hdrs.LAST_MODIFIED: asset.last_modified,
+            hdrs.CACHE_CONTROL: self.CACHE_CONTROL,
+        }
+        if asset.variants:
+            headers[hdrs.VARY] = hdrs.ACCEPT_ENCODING
+        if_none_match = request.headers.get(hdrs.IF_NONE_MATCH)
+        if if_none_match is not None and _etag_matches(if_none_match, etag):
+            STATIC_REQUESTS.inc(label_values=("not_modified",))
+            return web.Response(status=304, headers=headers)
+        if encoding is not None:
+            headers[hdrs.CONTENT_ENCODING] = encoding
+        headers[hdrs.CONTENT_TYPE] = asset.content_type
+        STATIC_REQUESTS.inc(label_values=(encoding or "identity",))
+        return web.Response(body=body, headers=headers)
+
+    async def handler(self, request):
+        """add_route 用のハンドラ。ルートの {path} をキーにする。"""
+        return self.response(request, request.match_info.get("path", ""))
+
+    def describe(self):
+        files = [a for key, a in self.assets.items() if not key.endswith("/") and key != ""]
+        raw = sum(len(a.body) for a in files)
+        compressed = sum(len(v[0]) for a in files for v in a.variants.values())
+        mode = "開発モード (更新を確認して読み直す)" if self.dev else "起動時に読み込み済み"
+        return (f"{self.directory}: {len(files)} ファイル {raw / 1024:.1f} KiB "
+                f"+ 圧縮版 {compressed / 1024:.1f} KiB ({'/'.join(ENCODINGS)}), "
+                f"{self.load_seconds * 1000:.1f} ms, {mode}")
+
+
+def add_static_assets(app, prefix, directory, show_index=False, name=None):
+    """
+    app.router.add_static() の代わりに、メモリキャッシュから配信するルートを追加する。
+    StaticAssets を返すので、index.html を返すハンドラなどから assets.response() を使える。
+    """
+    assets = StaticAssets(directory, show_index=show_index)
+    prefix = prefix.rstrip("/")
+    app.router.add_get(prefix + "/{path:.*}", assets.handler, name=name)
+    print(f"静的ファイル: {assets.describe()}")
+    return assets
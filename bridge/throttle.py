@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: セッションごとの出力の上限
+# DESCRIPTION: 描画の無限ループ (入力がなくても 50 ms ごとに再描画するアーカイブなど) が
+#              帯域と送信 CPU を使い続けないよう、クライアントへ送る出力をバイト数とフレーム数の
+#              トークンバケツで制限する。上限に達したセッションは送信を待たされ、その間の出力は
+#              送信キュー (bridge.send_queue) が最新の画面にまとめる。
+
+import os
+import time
+
+from bridge.metrics import OUTPUT_THROTTLE_SAVED_BYTES, OUTPUT_THROTTLED, OUTPUT_THROTTLED_SECONDS
+from bridge.resources import UNKNOWN_LABEL, read_archive
+
+
+class OutputBudget:
+    """
+    1 セッション分の出力の上限。環境変数で既定値を変えられる:
+      YGG_OUTPUT_BYTES_PER_SEC   1 秒あたりに送るバイト数 (0 で制限しない)
+      YGG_OUTPUT_FRAMES_PER_SEC  1 秒あたりに送るフレーム数 (0 で制限しない)
+      YGG_OUTPUT_BURST_SEC       何秒分まで貯めておけるか (キー入力直後の描画などの一時的な増加は許す)
+
+    上限に達してから、ゲームの出力 (まとめる前) が BURST_SEC の間上限を下回るまでを
+    1 回の「間引き」とし、実行中のアーカイブ別にメトリクスへ記録する。
+    (間引き中に実際に送る量は少ないので、送った量で終わりを決めると間引きと解除を繰り返す)
+    """
+    BYTES_PER_SEC = int(os.environ.get("YGG_OUTPUT_BYTES_PER_SEC", 64 * 1024))
+    FRAMES_PER_SEC = float(os.environ.get("YGG_OUTPUT_FRAMES_PER_SEC", 20))
+    BURST_SECONDS = float(os.environ.get("YGG_OUTPUT_BURST_SEC", 2))
+
+    def __init__(self, pid=None, bytes_per_sec=None, frames_per_sec=None, burst_seconds=None):
+        """
+        Args:
+            pid (int): メトリクスのラベルにするアーカイブ名を読むゲームプロセスの PID。
+        """
+        self.pid = pid
+        self.bytes_per_sec = self.BYTES_PER_SEC if bytes_per_sec is None else bytes_per_sec
+        self.frames_per_sec = self.FRAMES_PER_SEC if frames_per_sec is None else frames_per_sec
+        self.burst_seconds = self.BURST_SECONDS if burst_seconds is None else burst_seconds
+        self.bytes_capacity = self.bytes_per_sec * self.burst_seconds
+        # 1 フレームも貯められないと、上限以下の出力でも毎回待たされる
+        self.frames_capacity = max(1.0, self.frames_per_sec * self.burst_seconds)
+        self._bytes = self.bytes_capacity
+        self._frames = self.frames_capacity
+        self._refilled_at = time.monotonic()
+        self.throttled_since = None
+        self.throttled_seconds = 0.0
+        self._archive = None
+        self._demand_since = None
+        self._demand_bytes = 0
+        self._demand_frames = 0
+
+    def __bool__(self):
+        return self.bytes_per_sec > 0 or self.frames_per_sec > 0
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        if self.bytes_per_sec > 0:
+            self._bytes = min(self.bytes_capacity, self._bytes + elapsed * self.bytes_per_sec)
+        if self.frames_per_sec > 0:
+            self._frames = min(self.frames_capacity, self._frames + elapsed * self.frames_per_sec)
+
+    def delay(self):
+        """次のフレームを送れるまでの秒数 (今すぐ送れるなら 0)。"""
+        self._refill()
+        wait = 0.0
+        if self.frames_per_sec > 0 and self._frames < 1:
+            wait = (1 - self._frames) / self.frames_per_sec
+        if self.bytes_per_sec > 0 and self._bytes <= 0:
+            # 大きなフレームは送ってから借りを返す (送る前に大きさは分からないため)
+            wait = max(wait, -self._bytes / self.bytes_per_sec + 1e-3)
+        return wait
+
+    def spend(self, nbytes):
+        """1 フレーム (nbytes バイト) を送った分をバケツから引く。"""
+        if self.frames_per_sec > 0:
+            self._frames -= 1
+        if self.bytes_per_sec > 0:
+            self._bytes -= nbytes
+
+    # --- 間引きの記録 ---
+
+    def demand(self, nbytes):
+        """間引き中にゲームが出力した 1 フレーム (まとめる前) を数える。"""
+        self._demand_bytes += nbytes
+        self._demand_frames += 1
+
+    def calm(self):
+        """
+        直近の BURST_SEC 以上の間、ゲームの出力が上限を下回っていたか (間引きを終えてよいか)。
+        測り終えた区間は捨て、次の呼び出しでは新しい区間を測る。
+        """
+        now = time.monotonic()
+        elapsed = now - self._demand_since
+        if elapsed < self.burst_seconds:
+            return False
+        calm = ((self.bytes_per_sec <= 0 or self._demand_bytes <= self.bytes_per_sec * elapsed)
+                and (self.frames_per_sec <= 0 or self._demand_frames <= self.frames_per_sec * elapsed))
+        self._demand_since = now
+        self._demand_bytes = self._demand_frames = 0
+        return calm
+
+    def start_throttle(self):
+        self.throttled_since = self._demand_since = time.monotonic()
+        self._demand_bytes = self._demand_frames = 0
+        self._archive = (read_archive(self.pid) if self.pid is not None else None) or UNKNOWN_LABEL
+        OUTPUT_THROTTLED.inc(label_values=(self._archive,))
+
+    def end_throttle(self, saved_bytes=0):
+        """間引きを終える。saved_bytes は間引きで送らずに済んだバイト数。間引いていた秒数を返す。"""
+        if self.throttled_since is None:
+            return 0.0
+        elapsed = time.monotonic() - self.throttled_since
+        self.throttled_since = None
+        self.throttled_seconds += elapsed
+        OUTPUT_THROTTLED_SECONDS.inc(elapsed, label_values=(self._archive,))
+        if saved_bytes > 0:
+            OUTPUT_THROTTLE_SAVED_BYTES.inc(saved_bytes, label_values=(self._archive,))
+        return elapsed
+
+    def describe(self):
+        if not self:
+            return "出力上限なし"
+        rate = f"{self.bytes_per_sec / 1024:g} KiB/s" if self.bytes_per_sec > 0 else "無制限"
+        frames = f"{self.frames_per_sec:g} frames/s" if self.frames_per_sec > 0 else "無制限"
+        return f"出力上限 {rate}, {frames} (バースト {self.burst_seconds:g}s)"
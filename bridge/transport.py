@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: WebSocket への出力送信
+# DESCRIPTION: PTY の生バイトをバイナリフレームで送るか、UTF-8 を逐次デコードして
+#              テキストフレームで送るか、サーバー側エミュレータのセル差分を送るかを切り替える。
+
+import codecs
+import json
+
+from bridge.vt_screen import Screen
+
+
+def wants_binary(request):
+    """
+    クライアントがバイナリ転送を要求しているかどうか。
+    WebSocket の URL に ?binary=1 を付けるとオプトインになる。
+    """
+    return request.query.get("binary", "").lower() in ("1", "true", "yes")
+
+
+def wants_diff(request):
+    """
+    クライアントがセル差分モードを要求しているかどうか (?diff=1)。
+    サーバー側で画面をエミュレートし、変化したセルの区間だけを送る。
+    """
+    return request.query.get("diff", "").lower() in ("1", "true", "yes")
+
+
+def make_sender(request, ws, rows=24, cols=80):
+    """接続時のクエリに応じた送信方式を選ぶ。"""
+    if wants_diff(request):
+        return DiffSender(ws, rows, cols)
+    return FrameSender(ws, binary=wants_binary(request))
+
+
+class FrameSender:
+    """
+    1 フレーム分の PTY 出力を WebSocket に送る。
+
+    バイナリモードでは受け取ったバイト列をそのまま send_bytes() に渡す (デコードもコピーもしない)。
+    テキストモードではインクリメンタルデコーダを使い、チャンク境界で分断された
+    マルチバイト文字 (日本語のメニュー等) を次のフレームに持ち越して正しく復元する。
+    """
+    # 出力はバイト列として積み、送る時にまとめて連結する (bridge.send_queue)
+    stateful = False
+
+    def __init__(self, ws, binary=False):
+        """
+        Args:
+            ws (web.WebSocketResponse): 送信先。
+            binary (bool): True ならバイナリフレームで送る。
+        """
+        self.ws = ws
+        self.binary = binary
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    async def send(self, data):
+        if self.binary:
+            await self.ws.send_bytes(data)
+            return
+        text = self._decoder.decode(data)
+        if text:
+            await self.ws.send_str(text)
+
+    async def flush(self):
+        """EOF 時に、デコーダに残っている不完全なバイト列を吐き出す。"""
+        if self.binary:
+            return
+        text = self._decoder.decode(b'', final=True)
+        if text:
+            await self.ws.send_str(text)
+
+    def resize(self, rows, cols):
+        pass  # 生の出力を中継するだけなので、サイズはクライアント側の端末が扱う
+
+
+class DiffSender:
+    """
+    PTY 出力をサーバー側の Screen に流し込み、前回送った画面との差分を
+    JSON メッセージ (bridge.vt_screen の形式) で送る。
+    curses が再描画のたびに画面全体を出力しても、実際に変わったセルだけが送られる。
+    """
+    # 出力は受け取った時点で画面に反映し、送る時には最新の画面との差分だけを作る
+    stateful = True
+
+    def __init__(self, ws, rows=24, cols=80):
+        self.ws = ws
+        self.screen = Screen(rows, cols)
+
+    async def _send_message(self, message):
+        text = json.dumps(message, ensure_ascii=False, separators=(',', ':'))
+        await self.ws.send_str(text)
+        return len(text)
+
+    def feed(self, data):
+        self.screen.feed(data)
+
+    async def send_update(self):
+        """前回送った画面から変わった部分を送り、送ったメッセージの長さを返す (変化がなければ 0)。"""
+        message = self.screen.diff()
+        if not message:
+            return 0
+        return await self._send_message(message)
+
+    async def send(self, data):
+        self.feed(data)
+        await self.send_update()
+
+    async def flush(self):
+        pass
+
+    def resize(self, rows, cols):
+        self.screen.resize(rows, cols)
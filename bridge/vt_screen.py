@@ -0,0 +1,699 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: サーバー側ターミナルエミュレータ
+# DESCRIPTION: curses (TERM=xterm-256color) が出力する VT100/xterm のエスケープシーケンスを
+#              解釈してセル単位の画面 (rows x cols) を保持し、前回送った画面との差分だけを
+#              「変化したセルの連続区間 (run)」として取り出す。
+#
+# 差分メッセージ (JSON、WebSocket のテキストフレーム):
+#   {"t": "s", "rows": 24, "cols": 80, "r": [...], "c": [y, x, 1]}   画面全体 (スナップショット)
+#   {"t": "d", "r": [...], "c": [y, x, 1]}                           前回からの差分
+#   r の各要素は [行, 桁, SGR パラメータ文字列, テキスト]。SGR が "" なら既定の属性。
+#   c はカーソル位置と表示/非表示。
+
+import codecs
+import functools
+import re
+import unicodedata
+
+# DEC Special Graphics (ESC ( 0) — curses の border() などが罫線に使う
+DEC_SPECIAL = {
+    '`': '◆', 'a': '▒', 'f': '°', 'g': '±', 'j': '┘', 'k': '┐', 'l': '┌', 'm': '└',
+    'n': '┼', 'o': '⎺', 'p': '⎻', 'q': '─', 'r': '⎼', 's': '⎽', 't': '├', 'u': '┤',
+    'v': '┴', 'w': '┬', 'x': '│', 'y': '≤', 'z': '≥', '{': 'π', '|': '≠', '}': '£',
+    '~': '·',
+}
+
+# 属性は (前景色, 背景色, フラグ) のタプル。色は SGR パラメータ文字列 ("31", "38;5;200") か None
+DEFAULT_ATTR = (None, None, 0)
+BOLD, DIM, ITALIC, UNDERLINE, BLINK, REVERSE, INVISIBLE, STRIKE = (1 << i for i in range(8))
+_FLAG_SGR = ((BOLD, "1"), (DIM, "2"), (ITALIC, "3"), (UNDERLINE, "4"), (BLINK, "5"),
+             (REVERSE, "7"), (INVISIBLE, "8"), (STRIKE, "9"))
+_FLAG_ON = {1: BOLD, 2: DIM, 3: ITALIC, 4: UNDERLINE, 5: BLINK, 7: REVERSE, 8: INVISIBLE, 9: STRIKE}
+_FLAG_OFF = {22: BOLD | DIM, 23: ITALIC, 24: UNDERLINE, 25: BLINK, 27: REVERSE, 28: INVISIBLE,
+             29: STRIKE}
+
+_CONTROL = re.compile(r'[\x00-\x1f\x7f]')
+_CSI = re.compile(r'\x1b\[([?>=!]?)([0-9;:]*)([ -/]*)([@-~])')
+_CSI_PARTIAL = re.compile(r'\x1b\[[?>=!]?[0-9;:]*[ -/]*\Z')
+_OSC = re.compile(r'\x1b\].*?(?:\x07|\x1b\\)', re.DOTALL)
+_MAX_PENDING = 4096
+
+# 差分の区間をまとめる際、この桁数以下の未変更セルを挟むなら 1 つの区間にする
+_MERGE_GAP = 3
+
+
+@functools.lru_cache(maxsize=4096)
+def char_width(ch):
+    """端末上の表示幅 (結合文字 0、全角 2、それ以外 1)。"""
+    if unicodedata.combining(ch):
+        return 0
+    return 2 if unicodedata.east_asian_width(ch) in ('W', 'F') else 1
+
+
+@functools.lru_cache(maxsize=1024)
+def attr_to_sgr(attr):
+    """属性タプルを SGR パラメータ文字列に変換する (既定の属性なら "")。"""
+    fg, bg, flags = attr
+    params = [code for flag, code in _FLAG_SGR if flags & flag]
+    if fg:
+        params.append(fg)
+    if bg:
+        params.append(bg)
+    return ";".join(params)
+
+
+class Screen:
+    """
+    VT100/xterm 互換の画面バッファ。
+
+    各行は文字のリスト (chars) と属性のリスト (attrs) で表す。全角文字は先頭セルに文字、
+    次のセルに '' (継続セル) を置く。変更された行は dirty に記録し、diff() で
+    前回送った内容と比較する。
+    """
+    def __init__(self, rows=24, cols=80):
+        self.rows = rows
+        self.cols = cols
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._pending = ''
+        self.reset()
+
+    # --- 状態 ---
+
+    def reset(self):
+        self.chars = [self._blank_chars() for _ in range(self.rows)]
+        self.attrs = [self._blank_attrs() for _ in range(self.rows)]
+        self.x = 0
+        self.y = 0
+        self.attr = DEFAULT_ATTR
+        self.top = 0
+        self.bottom = self.rows - 1
+        self.wrap_pending = False
+        self.autowrap = True
+        self.cursor_visible = True
+        self.charsets = ['B', 'B']
+        self.active_charset = 0
+        self.last_char = ' '
+        self.saved_cursor = None
+        self.alt_saved = None
+        self.sent_chars = None
+        self.sent_attrs = None
+        self.sent_cursor = None
+        self.dirty = set(range(self.rows))
+
+    def _blank_chars(self, cols=None):
+        return [' '] * (cols or self.cols)
+
+    def _blank_attrs(self, cols=None, attr=DEFAULT_ATTR):
+        return [attr] * (cols or self.cols)
+
+    def _erase_attr(self):
+        # xterm は背景色消去 (bce)。前景色やフラグは引き継がない
+        return (None, self.attr[1], 0)
+
+    def resize(self, rows, cols):
+        """
+        画面サイズを変更する。次の差分は画面全体になる。
+        代替画面の使用中は、退避してある通常画面も同じサイズにする (戻った時に行の長さが合うように)。
+        """
+        if rows == self.rows and cols == self.cols:
+            return
+        self.y -= self._resize_buffer(self.chars, self.attrs, rows, cols, self.y)
+        if self.alt_saved is not None:
+            saved_y = self.saved_cursor[0] if self.saved_cursor is not None else 0
+            drop = self._resize_buffer(*self.alt_saved, rows, cols, saved_y)
+            if self.saved_cursor is not None:
+                # 通常画面へ戻る時に復元されるカーソルも、捨てた行の分だけ上へずらす
+                self.saved_cursor = (max(0, saved_y - drop),) + self.saved_cursor[1:]
+        self.rows = rows
+        self.cols = cols
+        self.top = 0
+        self.bottom = rows - 1
+        self.x = min(self.x, cols - 1)
+        self.y = min(max(self.y, 0), rows - 1)
+        self.wrap_pending = False
+        self.sent_chars = None
+        self.sent_attrs = None
+        self.dirty = set(range(rows))
+
+    def _resize_buffer(self, chars, attrs, rows, cols, y):
+        """
+        chars/attrs の行を rows x cols にそろえる。下の行ではなく上の行を捨て、
+        カーソル (y 行目) 付近の内容を残す。捨てた行数を返す。
+        """
+        for row in range(len(chars)):
+            if cols > self.cols:
+                chars[row] += self._blank_chars(cols - self.cols)
+                attrs[row] += self._blank_attrs(cols - self.cols)
+            else:
+                del chars[row][cols:]
+                del attrs[row][cols:]
+                # 右端で切れた全角文字の先頭は空白にする
+                if chars[row] and chars[row][-1] and char_width(chars[row][-1][0]) == 2:
+                    chars[row][-1] = ' '
+        if rows > self.rows:
+            chars += [self._blank_chars(cols) for _ in range(rows - self.rows)]
+            attrs += [self._blank_attrs(cols) for _ in range(rows - self.rows)]
+            return 0
+        drop = max(0, min(self.rows - rows, y - rows + 1))
+        del chars[:drop]
+        del attrs[:drop]
+        del chars[rows:]
+        del attrs[rows:]
+        return drop
+
+    # --- 入力 ---
+
+    def feed(self, data):
+        """PTY の出力 (bytes) を解釈して画面に反映する。"""
+        text = self._pending + self._decoder.decode(data)
+        self._pending = ''
+        i = 0
+        length = len(text)
+        while i < length:
+            match = _CONTROL.search(text, i)
+            if match is None:
+                self._print(text[i:])
+                break
+            start = match.start()
+            if start > i:
+                self._print(text[i:start])
+            ch = text[start]
+            if ch == '\x1b':
+                consumed = self._escape(text, start)
+                if consumed is None:
+                    rest = text[start:]
+                    if len(rest) <= _MAX_PENDING:
+                        self._pending = rest
+                    break
+                i = start + consumed
+            else:
+                self._control(ch)
+                i = start + 1
+
+    def _control(self, ch):
+        if ch == '\r':
+            self.x = 0
+            self.wrap_pending = False
+        elif ch in '\n\x0b\x0c':
+            self._index()
+        elif ch == '\x08':
+            if self.x > 0:
+                self.x -= 1
+            self.wrap_pending = False
+        elif ch == '\t':
+            self.x = min(self.cols - 1, (self.x // 8 + 1) * 8)
+            self.wrap_pending = False
+        elif ch == '\x0e':
+            self.active_charset = 1
+        elif ch == '\x0f':
+            self.active_charset = 0
+
+    def _escape(self, text, start):
+        """ESC から始まるシーケンスを処理し、消費した文字数を返す。不完全なら None。"""
+        if start + 1 >= len(text):
+            return None
+        kind = text[start + 1]
+        if kind == '[':
+            match = _CSI.match(text, start)
+            if match is None:
+                if _CSI_PARTIAL.match(text, start):
+                    return None
+                return 2  # 壊れた CSI は ESC [ だけ捨てる
+            self._csi(*match.groups())
+            return match.end() - start
+        if kind == ']':
+            match = _OSC.match(text, start)
+            if match is None:
+                return None
+            return match.end() - start  # OSC (ウィンドウタイトル等) は無視
+        if kind in '()*+#':
+            if start + 2 >= len(text):
+                return None
+            if kind in '()':
+                self.charsets[0 if kind == '(' else 1] = text[start + 2]
+            return 3
+        self._esc(kind)
+        return 2
+
+    def _esc(self, kind):
+        if kind == '7':
+            self._save_cursor()
+        elif kind == '8':
+            self._restore_cursor()
+        elif kind == 'D':
+            self._index()
+        elif kind == 'E':
+            self.x = 0
+            self._index()
+        elif kind == 'M':
+            self._reverse_index()
+        elif kind == 'c':
+            self.reset()
+        # ESC = / ESC > (キーパッドモード) などは画面に影響しない
+
+    # --- 文字の出力 ---
+
+    def _print(self, text):
+        charset = self.charsets[self.active_charset]
+        for ch in text:
+            if charset == '0':
+                ch = DEC_SPECIAL.get(ch, ch)
+            width = char_width(ch)
+            if width == 0:
+                self._combine(ch)
+                continue
+            if width == 2 and self.cols < 2:
+                width = 1  # 1 桁の画面には全角文字が収まらない
+            if self.wrap_pending:
+                self.wrap_pending = False
+                if self.autowrap:
+                    self.x = 0
+                    self._index()
+            if width == 2 and self.x == self.cols - 1:
+                if not self.autowrap:
+                    continue
+                self._put(' ', 1)
+                self.x = 0
+                self._index()
+            self._put(ch, width)
+            self.last_char = ch
+            if self.x + width >= self.cols:
+                self.x = self.cols - 1
+                self.wrap_pending = True
+            else:
+                self.x += width
+
+    def _put(self, ch, width):
+        chars = self.chars[self.y]
+        attrs = self.attrs[self.y]
+        x = self.x
+        # 全角文字の片側だけを上書きする場合は、残った片側を空白にする
+        if chars[x] == '' and x > 0:
+            chars[x - 1] = ' '
+        end = x + width
+        if end < self.cols and chars[end] == '':
+            chars[end] = ' '
+        chars[x] = ch
+        attrs[x] = self.attr
+        if width == 2:
+            chars[x + 1] = ''
+            attrs[x + 1] = self.attr
+        self.dirty.add(self.y)
+
+    def _combine(self, ch):
+        x = self.x if self.wrap_pending else self.x - 1
+        if x < 0:
+            return
+        chars = self.chars[self.y]
+        if chars[x] == '' and x > 0:
+            x -= 1
+        chars[x] += ch
+        self.dirty.add(self.y)
+
+    # --- カーソルとスクロール ---
+
+    def _index(self):
+        self.wrap_pending = False
+        if self.y == self.bottom:
+            self._scroll_up(1, self.top, self.bottom)
+        elif self.y < self.rows - 1:
+            self.y += 1
+
+    def _reverse_index(self):
+        self.wrap_pending = False
+        if self.y == self.top:
+            self._scroll_down(1, self.top, self.bottom)
+        elif self.y > 0:
+            self.y -= 1
+
+    def _scroll_up(self, count, top, bottom):
+        count = min(count, bottom - top + 1)
+        erase = self._erase_attr()
+        del self.chars[top:top + count]
+        del self.attrs[top:top + count]
+        for _ in range(count):
+            self.chars.insert(bottom - count + 1, self._blank_chars())
+            self.attrs.insert(bottom - count + 1, self._blank_attrs(attr=erase))
+        self.dirty.update(range(top, bottom + 1))
+
+    def _scroll_down(self, count, top, bottom):
+        count = min(count, bottom - top + 1)
+        erase = self._erase_attr()
+        del self.chars[bottom - count + 1:bottom + 1]
+        del self.attrs[bottom - count + 1:bottom + 1]
+        for _ in range(count):
+            self.chars.insert(top, self._blank_chars())
+            self.attrs.insert(top, self._blank_attrs(attr=erase))
+        self.dirty.update(range(top, bottom + 1))
+
+    def _move_to(self, y, x):
+        self.y = min(max(y, 0), self.rows - 1)
+        self.x = min(max(x, 0), self.cols - 1)
+        self.wrap_pending = False
+
+    def _save_cursor(self):
+        self.saved_cursor = (self.y, self.x, self.attr, list(self.charsets), self.active_charset)
+
+    def _restore_cursor(self):
+        if self.saved_cursor is None:
+            self._move_to(0, 0)
+            return
+        y, x, self.attr, charsets, self.active_charset = self.saved_cursor
+        self.charsets = list(charsets)
+        self._move_to(y, x)
+
+    # --- 消去 ---
+
+    def _erase(self, row, start, end):
+        start = max(0, start)
+        end = min(self.cols, end)
+        if start >= end:
+            return
+        chars = self.chars[row]
+        if chars[start] == '' and start > 0:
+            chars[start - 1] = ' '
+        if end < self.cols and chars[end] == '':
+            chars[end] = ' '
+        erase = self._erase_attr()
+        chars[start:end] = [' '] * (end - start)
+        self.attrs[row][start:end] = [erase] * (end - start)
+        self.dirty.add(row)
+
+    def _erase_display(self, mode):
+        if mode == 0:
+            self._erase(self.y, self.x, self.cols)
+            for row in range(self.y + 1, self.rows):
+                self._erase(row, 0, self.cols)
+        elif mode == 1:
+            for row in range(self.y):
+                self._erase(row, 0, self.cols)
+            self._erase(self.y, 0, self.x + 1)
+        else:
+            for row in range(self.rows):
+                self._erase(row, 0, self.cols)
+
+    def _erase_line(self, mode):
+        if mode == 0:
+            self._erase(self.y, self.x, self.cols)
+        elif mode == 1:
+            self._erase(self.y, 0, self.x + 1)
+        else:
+            self._erase(self.y, 0, self.cols)
+
+    def _insert_chars(self, count):
+        chars = self.chars[self.y]
+        attrs = self.attrs[self.y]
+        count = min(count, self.cols - self.x)
+        # 全角文字の途中に挿入する場合は、分かれる両側を空白にする
+        if chars[self.x] == '' and self.x > 0:
+            chars[self.x - 1] = ' '
+            chars[self.x] = ' '
+        chars[self.x:self.x] = [' '] * count
+        attrs[self.x:self.x] = [self._erase_attr()] * count
+        del chars[self.cols:]
+        del attrs[self.cols:]
+        if chars[-1] and char_width(chars[-1][0]) == 2:
+            chars[-1] = ' '  # 右端で継続セルを失った全角文字
+        self.dirty.add(self.y)
+
+    def _delete_chars(self, count):
+        chars = self.chars[self.y]
+        attrs = self.attrs[self.y]
+        count = min(count, self.cols - self.x)
+        if chars[self.x] == '' and self.x > 0:
+            chars[self.x - 1] = ' '
+        del chars[self.x:self.x + count]
+        del attrs[self.x:self.x + count]
+        chars += [' '] * count
+        attrs += [self._erase_attr()] * count
+        if chars[self.x] == '':
+            chars[self.x] = ' '
+        self.dirty.add(self.y)
+
+    # --- CSI ---
+
+    def _csi(self, private, params, intermediate, final):
+        if intermediate:
+            return  # DECSCUSR (カーソル形状) など、画面に影響しないもの
+        args = [int(p) if p else 0 for p in params.replace(':', ';').split(';')] if params else []
+
+        def arg(index, default=1):
+            value = args[index] if index < len(args) else 0
+            return value if value else default
+
+        if private:
+            if final in 'hl' and private == '?':
+                for mode in args:
+                    self._set_private_mode(mode, final == 'h')
+            return
+
+        if final in 'Hf':
+            self._move_to(arg(0) - 1, arg(1) - 1)
+        elif final == 'A':
+            self._move_to(max(self.y - arg(0), self.top if self.y >= self.top else 0), self.x)
+        elif final == 'B':
+            self._move_to(min(self.y + arg(0), self.bottom if self.y <= self.bottom else self.rows - 1), self.x)
+        elif final == 'C':
+            self._move_to(self.y, self.x + arg(0))
+        elif final == 'D':
+            self._move_to(self.y, self.x - arg(0))
+        elif final == 'E':
+            self._move_to(self.y + arg(0), 0)
+        elif final == 'F':
+            self._move_to(self.y - arg(0), 0)
+        elif final in 'G`':
+            self._move_to(self.y, arg(0) - 1)
+        elif final == 'd':
+            self._move_to(arg(0) - 1, self.x)
+        elif final == 'J':
+            self._erase_display(arg(0, 0))
+        elif final == 'K':
+            self._erase_line(arg(0, 0))
+        elif final == 'L':
+            if self.top <= self.y <= self.bottom:
+                self._scroll_down(arg(0), self.y, self.bottom)
+                self.x = 0
+        elif final == 'M':
+            if self.top <= self.y <= self.bottom:
+                self._scroll_up(arg(0), self.y, self.bottom)
+                self.x = 0
+        elif final == '@':
+            self._insert_chars(arg(0))
+        elif final == 'P':
+            self._delete_chars(arg(0))
+        elif final == 'X':
+            self._erase(self.y, self.x, self.x + arg(0))
+        elif final == 'S':
+            self._scroll_up(arg(0), self.top, self.bottom)
+        elif final == 'T':
+            self._scroll_down(arg(0), self.top, self.bottom)
+        elif final == 'b':
+            self._print(self.last_char * min(arg(0), self.rows * self.cols))
+        elif final == 'm':
+            self._sgr(args)
+        elif final == 'r':
+            top = arg(0) - 1
+            bottom = arg(1, self.rows) - 1
+            if 0 <= top < bottom < self.rows:
+                self.top, self.bottom = top, bottom
+                self._move_to(0, 0)
+        elif final == 's':
+            self._save_cursor()
+        elif final == 'u':
+            self._restore_cursor()
+        # それ以外 (DSR, DA, ウィンドウ操作 t など) は画面に影響しないので無視する
+
+    def _set_private_mode(self, mode, enabled):
+        if mode == 25:
+            self.cursor_visible = enabled
+        elif mode == 7:
+            self.autowrap = enabled
+        elif mode in (47, 1047, 1049):
+            if mode == 1049 and enabled:
+                self._save_cursor()
+            self._switch_alt_screen(enabled)
+            if mode == 1049 and not enabled:
+                self._restore_cursor()
+        elif mode == 1048:
+            if enabled:
+                self._save_cursor()
+            else:
+                self._restore_cursor()
+
+    def _switch_alt_screen(self, enabled):
+        if enabled and self.alt_saved is None:
+            self.alt_saved = (self.chars, self.attrs)
+            self.chars = [self._blank_chars() for _ in range(self.rows)]
+            self.attrs = [self._blank_attrs() for _ in range(self.rows)]
+        elif not enabled and self.alt_saved is not None:
+            self.chars, self.attrs = self.alt_saved
+            self.alt_saved = None
+        else:
+            return
+        self.dirty = set(range(self.rows))
+
+    def _sgr(self, args):
+        fg, bg, flags = self.attr
+        if not args:
+            args = [0]
+        i = 0
+        while i < len(args):
+            code = args[i]
+            if code == 0:
+                fg, bg, flags = DEFAULT_ATTR
+            elif code in _FLAG_ON:
+                flags |= _FLAG_ON[code]
+            elif code in _FLAG_OFF:
+                flags &= ~_FLAG_OFF[code]
+            elif 30 <= code <= 37 or 90 <= code <= 97:
+                fg = str(code)
+            elif 40 <= code <= 47 or 100 <= code <= 107:
+                bg = str(code)
+            elif code == 39:
+                fg = None
+            elif code == 49:
+                bg = None
+            elif code in (38, 48):
+                color = None
+                mode = args[i + 1] if i + 1 < len(args) else None
+                if mode == 5 and i + 2 < len(args):
+                    color = f"{code};5;{args[i + 2]}"
+                    i += 2
+                elif mode == 2 and i + 4 < len(args):
+                    color = f"{code};2;{args[i + 2]};{args[i + 3]};{args[i + 4]}"
+                    i += 4
+                if color:
+                    if code == 38:
+                        fg = color
+                    else:
+                        bg = color
+            i += 1
+        self.attr = (fg, bg, flags)
+
+    # --- 差分の取り出し ---
+
+    def _row_runs(self, row, start, end):
+        """row の [start, end) を、同じ属性が続く run に分けて返す。"""
+        chars = self.chars[row]
+        attrs = self.attrs[row]
+        # 全角文字の途中から/途中までにならないように区間を広げる
+        if start > 0 and chars[start] == '':
+            start -= 1
+        if end < self.cols and chars[end] == '':
+            end += 1
+        runs = []
+        run_start = start
+        for col in range(start + 1, end + 1):
+            if col == end or attrs[col] != attrs[run_start]:
+                text = ''.join(chars[run_start:col])
+                if text:
+                    runs.append([row, run_start, attr_to_sgr(attrs[run_start]), text])
+                run_start = col
+        return runs
+
+    def _changed_spans(self, row):
+        chars = self.chars[row]
+        attrs = self.attrs[row]
+        sent_chars = self.sent_chars[row]
+        sent_attrs = self.sent_attrs[row]
+        spans = []
+        col = 0
+        while col < self.cols:
+            if chars[col] == sent_chars[col] and attrs[col] == sent_attrs[col]:
+                col += 1
+                continue
+            start = col
+            end = col + 1
+            gap = 0
+            col += 1
+            while col < self.cols and gap <= _MERGE_GAP:
+                if chars[col] == sent_chars[col] and attrs[col] == sent_attrs[col]:
+                    gap += 1
+                else:
+                    gap = 0
+                    end = col + 1
+                col += 1
+            spans.append((start, end))
+            col = end
+        return spans
+
+    def _cursor(self):
+        return [self.y, self.x, 1 if self.cursor_visible else 0]
+
+    def _mark_sent(self):
+        self.sent_chars = [list(row) for row in self.chars]
+        self.sent_attrs = [list(row) for row in self.attrs]
+        self.sent_cursor = self._cursor()
+        self.dirty = set()
+
+    def snapshot(self):
+        """画面全体のメッセージを返し、以降の差分の基準にする。"""
+        runs = []
+        for row in range(self.rows):
+            chars = self.chars[row]
+            attrs = self.attrs[row]
+            # 既定属性の空白が続く行末は送らない (クライアント側で消去済み)
+            end = self.cols
+            while end > 0 and chars[end - 1] == ' ' and attrs[end - 1] == DEFAULT_ATTR:
+                end -= 1
+            if end:
+                runs.extend(self._row_runs(row, 0, end))
+        self._mark_sent()
+        return {"t": "s", "rows": self.rows, "cols": self.cols, "r": runs, "c": self._cursor()}
+
+    def diff(self):
+        """
+        前回の diff()/snapshot() 以降の変化を返す。
+        まだ一度も送っていない (またはリサイズ直後) ならスナップショットを返す。
+
+        Returns:
+            dict: 差分メッセージ。変化が無ければ None。
+        """
+        if self.sent_chars is None:
+            return self.snapshot()
+        runs = []
+        for row in sorted(self.dirty):
+            for start, end in self._changed_spans(row):
+                runs.extend(self._row_runs(row, start, end))
+            self.sent_chars[row] = list(self.chars[row])
+            self.sent_attrs[row] = list(self.attrs[row])
+        self.dirty = set()
+        cursor = self._cursor()
+        if not runs and cursor == self.sent_cursor:
+            return None
+        self.sent_cursor = cursor
+        return {"t": "d", "r": runs, "c": cursor}
+
+    def state_ansi(self):
+        """
+        message_to_ansi() の後に続けて送り、端末の SGR と文字集合をこの画面の状態に戻す ANSI 文字列。
+        以降に生の出力を中継しても、プログラム (curses) の想定どおりに表示される。
+        """
+        designate = ''.join(f"\x1b{'()'[i]}{charset}" for i, charset in enumerate(self.charsets))
+        shift = '\x0e' if self.active_charset else '\x0f'
+        sgr = attr_to_sgr(self.attr)
+        return f"{designate}{shift}\x1b[0{';' + sgr if sgr else ''}m"
+
+    def text(self):
+        """画面の内容をプレーンテキストで返す (デバッグ用)。"""
+        return "\n".join(''.join(row).rstrip() for row in self.chars)
+
+
+def message_to_ansi(message):
+    """
+    差分/スナップショットのメッセージを、通常の端末に書き込める ANSI 文字列に戻す。
+    ブラウザ側 (public/vt_diff.js) と同じ変換で、テキストモードのクライアントへの再送にも使う。
+    """
+    parts = []
+    if message.get("t") == "s":
+        parts.append("\x1b[0m\x1b[H\x1b[2J")
+    for row, col, sgr, text in message.get("r", ()):
+        parts.append(f"\x1b[{row + 1};{col + 1}H\x1b[0{';' + sgr if sgr else ''}m{text}")
+    parts.append("\x1b[0m")
+    cursor = message.get("c")
+    if cursor:
+        parts.append(f"\x1b[{cursor[0] + 1};{cursor[1] + 1}H")
+        parts.append("\x1b[?25h" if cursor[2] else "\x1b[?25l")
+    return ''.join(parts)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: 事前起動済みオーケストレーターのプール
+# DESCRIPTION: オーケストレーターを PTY 付きで先に起動し、アーカイブの import まで
+#              済ませた状態で待機させておく。接続時にはそれを払い出すだけで済む。
+
+import asyncio
+import os
+import time
+
+from bridge.resources import ResourceLimits
+from bridge.spawn import set_winsize, spawn_session
+
+
+class WarmSession:
+    """
+    待機中 (または払い出し済み) のセッションプロセス 1 つ分。
+    """
+    def __init__(self, process, master_fd, go_fd):
+        self.process = process
+        self.master_fd = master_fd
+        self.go_fd = go_fd
+        self.spawned_at = time.monotonic()
+
+    @property
+    def alive(self):
+        return self.process.returncode is None
+
+    def start(self, rows=None, cols=None):
+        """
+        待機中のプロセスにオーケストレーターの実行を開始させる。
+        rows/cols を渡すと、開始前に PTY のサイズを合わせる。
+        """
+        if rows and cols:
+            set_winsize(self.master_fd, rows, cols)
+        if self.go_fd is not None:
+            try:
+                os.write(self.go_fd, b'1')
+            except BrokenPipeError:
+                pass
+            os.close(self.go_fd)
+            self.go_fd = None
+
+    def discard(self):
+        """払い出さずに破棄する (プールの停止時、待機中に死んだ場合)。"""
+        if self.go_fd is not None:
+            os.close(self.go_fd)
+            self.go_fd = None
+        if self.alive:
+            self.process.kill()
+        os.close(self.master_fd)
+
+
+class WarmPool:
+    """
+    事前起動したセッションプロセスを size 個まで保持するプール。
+
+    acquire() は待機中のプロセスがあれば即座に返し、裏でプールを補充する。
+    プールが空の場合はその場で起動する (コールドスタートと同じ経路)。
+    """
+    def __init__(self, script, size=2, env=None, winsize=(24, 80), limits=None):
+        """
+        Args:
+            script (str): 実行するオーケストレーターのパス。
+            size (int): 待機させておくプロセス数。0 ならプールを使わない。
+            env (dict): 子プロセスの環境変数 (省略時はサーバーと同じ)。
+            winsize (tuple): 起動時の PTY サイズ (rows, cols)。
+            limits (ResourceLimits): 子プロセスに掛ける rlimit (省略時は環境変数の設定)。
+        """
+        self.script = script
+        self.size = size
+        self.env = env
+        self.winsize = winsize
+        self.limits = ResourceLimits() if limits is None else limits
+        self._ready = []
+        self._refill_wanted = asyncio.Event()
+        self._refill_task = None
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        # 空になった時刻 (待機中のプロセスがあれば None) と、続けて事前起動に失敗した回数。
+        # 補充中に一時的に空になるのは正常なので、ヘルスチェックは両方を見て判断する
+        self.empty_since = None
+        self.refill_failures = 0
+
+    async def start(self):
+        """プールを満たし、補充用のバックグラウンドタスクを開始する。"""
+        self._refill_task = asyncio.create_task(self._refill_loop())
+        self._refill_wanted.set()
+
+    async def close(self):
+        """補充を止め、待機中のプロセスを全て破棄する。"""
+        self._closed = True
+        if self._refill_task:
+            self._refill_task.cancel()
+            try:
+                await self._refill_task
+            except asyncio.CancelledError:
+                pass
+        for session in self._ready:
+            session.discard()
+            await session.process.wait()
+        self._ready.clear()
+
+    @property
+    def ready_count(self):
+        return len(self._ready)
+
+    def _update_empty(self):
+        if self._ready:
+            self.empty_since = None
+        elif self.empty_since is None:
+            self.empty_since = time.monotonic()
+
+    async def _spawn(self):
+        go_read, go_write = os.pipe()
+        try:
+            process, master_fd = await spawn_session(
+                self.script, *self.winsize, env=self.env, go_fd=go_read, limits=self.limits)
+        except BaseException:
+            os.close(go_write)
+            raise
+        finally:
+            os.close(go_read)
+        return WarmSession(process, master_fd, go_write)
+
+    async def _refill_loop(self):
+        while not self._closed:
+            await self._refill_wanted.wait()
+            self._refill_wanted.clear()
+            # 待機中に死んだプロセスは捨てる
+            for session in [s for s in self._ready if not s.alive]:
+                self._ready.remove(session)
+                session.discard()
+            while len(self._ready) < self.size and not self._closed:
+                try:
+                    self._ready.append(await self._spawn())
+                    self.refill_failures = 0
+                except Exception as e:
+                    self.refill_failures += 1
+                    print(f"ウォームプール: プロセスの事前起動に失敗しました: {e}")
+                    await asyncio.sleep(1)
+                self._update_empty()
+
+    async def acquire(self, rows=None, cols=None):
+        """
+        セッションプロセスを 1 つ払い出し、実行を開始させる。
+
+        Returns:
+            WarmSession: 実行を開始したセッション。
+        """
+        session = None
+        while self._ready:
+            candidate = self._ready.pop(0)
+            if candidate.alive:
+                session = candidate
+                break
+            candidate.discard()
+        self._update_empty()
+
+        if session is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            session = await self._spawn()
+        self._refill_wanted.set()
+        session.start(rows, cols)
+        return session
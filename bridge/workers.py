@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: マルチプロセス起動 (SO_REUSEPORT)
+# DESCRIPTION: サーバースクリプトをワーカープロセスとして N 個起動し、全員を同じポートに
+#              SO_REUSEPORT で bind させる。接続はカーネルがワーカーに振り分け、各ワーカーが
+#              自分のセッションを持つ。落ちたワーカーはスーパーバイザーが再起動する。
+#
+# 使い方: python3 -m bridge.workers [--workers N] server.py
+#         (N の既定値は CPU コア数。環境変数 YGG_WORKERS でも指定できる)
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+
+def worker_id():
+    """ワーカーとして起動されていればその番号、単独起動なら None。"""
+    value = os.environ.get("YGG_WORKER_ID")
+    return int(value) if value is not None else None
+
+
+def reuse_port():
+    """
+    TCPSite / run_app に渡す reuse_port の値。
+    スーパーバイザー配下のワーカーだけが SO_REUSEPORT でポートを共有する。
+    """
+    return worker_id() is not None
+
+
+def worker_label():
+    """ログ用の表記 (単独起動なら空文字)。"""
+    wid = worker_id()
+    return f"[worker {wid}] " if wid is not None else ""
+
+
+class Worker:
+    """スーパーバイザーが管理するワーカープロセス 1 つ分。"""
+    def __init__(self, wid, command):
+        self.wid = wid
+        self.command = command
+        self.process = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.restart_at = None
+
+    def start(self):
+        env = os.environ.copy()
+        env['YGG_WORKER_ID'] = str(self.wid)
+        env['PYTHONUNBUFFERED'] = '1'
+        self.process = subprocess.Popen(self.command, env=env)
+        self.started_at = time.monotonic()
+        self.restart_at = None
+        print(f"スーパーバイザー: ワーカー {self.wid} を起動しました (PID: {self.process.pid})")
+
+
+class Supervisor:
+    """
+    ワーカーを起動し、終了したものを再起動する。
+
+    起動直後 (MIN_UPTIME 秒以内) に落ちるワーカーは、再起動までの待ち時間を倍々に延ばす
+    (起動時のエラーで再起動を繰り返し続けないように)。SIGTERM / SIGINT は全ワーカーに転送し、
+    全員の終了を待ってから自分も終了する。
+    """
+    MIN_UPTIME = 5.0
+    MAX_BACKOFF = 30.0
+    STOP_TIMEOUT = 30.0
+
+    def __init__(self, command, count):
+        self.workers = [Worker(wid, command) for wid in range(count)]
+        self._stopping = False
+        self._stop_signal = signal.SIGTERM
+
+    def _on_signal(self, signum, frame):
+        self._stopping = True
+        self._stop_signal = signum
+
+    def _backoff(self, worker):
+        uptime = time.monotonic() - worker.started_at
+        if uptime >= self.MIN_UPTIME:
+            worker.restarts = 0
+            return 0.0
+        worker.restarts += 1
+        return min(0.5 * 2 ** (worker.restarts - 1), self.MAX_BACKOFF)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._on_signal)
+        signal.signal(signal.SIGINT, self._on_signal)
+        for worker in self.workers:
+            worker.start()
+
+        while not self._stopping:
+            now = time.monotonic()
+            for worker in self.workers:
+                if worker.restart_at is not None:
+                    if now >= worker.restart_at:
+                        worker.start()
+                    continue
+                code = worker.process.poll()
+                if code is None:
+                    continue
+                delay = self._backoff(worker)
+                print(f"スーパーバイザー: ワーカー {worker.wid} (PID: {worker.process.pid}) が終了しました "
+                      f"(Exit Code: {code})。{delay:.1f}秒後に再起動します。")
+                worker.restart_at = now + delay
+            time.sleep(0.2)
+
+        self.stop()
+
+    def stop(self):
+        running = [w for w in self.workers if w.restart_at is None and w.process.poll() is None]
+        print(f"スーパーバイザー: {len(running)} 個のワーカーを停止します。")
+        for worker in running:
+            worker.process.send_signal(self._stop_signal)
+        deadline = time.monotonic() + self.STOP_TIMEOUT
+        for worker in running:
+            try:
+                worker.process.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                print(f"スーパーバイザー: ワーカー {worker.wid} が停止しないため強制終了します。")
+                worker.process.kill()
+                worker.process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SO_REUSEPORT で複数のワーカーを起動する")
+    parser.add_argument('--workers', type=int,
+                        default=int(os.environ.get("YGG_WORKERS", os.cpu_count() or 1)),
+                        help="ワーカー数 (既定: CPU コア数)")
+    parser.add_argument('script', help="起動するサーバースクリプト (例: server.py)")
+    parser.add_argument('args', nargs=argparse.REMAINDER, help="スクリプトに渡す引数")
+    args = parser.parse_args()
+
+    command = [sys.executable, args.script] + args.args
+    print(f"スーパーバイザー: {args.script} を {args.workers} ワーカーで起動します。")
+    Supervisor(command, max(1, args.workers)).run()
+
+
+if __name__ == "__main__":
+    main()
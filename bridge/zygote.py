@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# PTY BRIDGE: Zygote フォークサーバー
+# DESCRIPTION: インタプリタ・curses・games/archive_* モジュール・H コード辞書・
+#              カナタの台詞 JSON を一度だけ読み込んだ親 (zygote) から、セッションごとに
+#              新しい PTY 上へ fork する。子プロセスはそれらのページを copy-on-write で共有する。
+#
+# 使い方 (通常はサーバーが ZygoteSpawner 経由で起動する):
+#     python3 -m bridge.zygote --socket /tmp/ygg-zygote.sock ./yggdrasil_orchestrator_v4.py
+
+import argparse
+import asyncio
+import errno
+import fcntl
+import gc
+import glob
+import importlib
+import json
+import os
+import pty
+import selectors
+import signal
+import socket
+import sys
+import tempfile
+import termios
+import traceback
+
+from bridge import session_entry
+from bridge.resources import ResourceLimits, label_archives
+from bridge.spawn import set_winsize
+from bridge.warm_pool import WarmSession
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GAMES_DIR = os.path.join(PROJECT_ROOT, 'games')
+
+# 読み取り専用として扱うデータファイル (プロフィールのような書き換えるファイルは含めない)
+PRELOAD_JSON = [
+    os.path.join(PROJECT_ROOT, 'game_data', 'kanata_dialogue.json'),
+    os.path.join(PROJECT_ROOT, 'game_design', 'h_code_sequence_dictionary.json'),
+    os.path.join(PROJECT_ROOT, 'game_design', 'next_war_h_codes.json'),
+]
+
+
+# --- Zygote 側 (同期、selectors ベース) ---
+
+class JsonCache:
+    """
+    事前にパースした JSON を、子プロセスの json.load() 呼び出しに対して返す。
+    ファイルの mtime が変わっていれば通常どおり読み直す。
+    """
+    def __init__(self, paths):
+        self.entries = {}
+        for path in paths:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries[path] = (os.path.getmtime(path), json.load(f))
+            except (OSError, json.JSONDecodeError):
+                pass
+
+    def install(self):
+        original_load = json.load
+        entries = self.entries
+
+        def cached_load(fp, *args, **kwargs):
+            path = os.path.abspath(getattr(fp, 'name', '') or '')
+            entry = entries.get(path)
+            if entry is not None and not args and not kwargs:
+                try:
+                    if os.path.getmtime(path) == entry[0]:
+                        return entry[1]
+                except OSError:
+                    pass
+            return original_load(fp, *args, **kwargs)
+
+        json.load = cached_load
+
+
+class Zygote:
+    """
+    Unix ソケットで生成要求を受け付け、PTY 付きの子プロセスを fork するサーバー。
+
+    プロトコル (1 接続 = 1 セッション、JSON 1 行ずつ):
+      要求: {"rows": 24, "cols": 80, "env": {...}}
+      応答: {"pid": 1234}  (SCM_RIGHTS で PTY master fd を添付)
+      終了: {"exit": 0}    (子プロセスが終了した時点で送り、接続を閉じる)
+    サーバー側が先に接続を閉じた場合は、その子プロセスのグループを kill する。
+    """
+    def __init__(self, script_path, socket_path, limits=None):
+        self.script_path = os.path.abspath(script_path)
+        self.socket_path = socket_path
+        self.limits = ResourceLimits() if limits is None else limits
+        self.code = None
+        self.json_cache = None
+        self.children = {}  # pid -> conn
+        self.selector = selectors.DefaultSelector()
+        self.listener = None
+        self._wakeup_r = None
+        self._wakeup_w = None
+
+    def preload(self):
+        import curses  # noqa: F401  (子プロセスで共有するためだけに読み込む)
+
+        sys.path[0] = os.path.dirname(self.script_path)
+        if GAMES_DIR not in sys.path:
+            sys.path.insert(0, GAMES_DIR)
+        for path in sorted(glob.glob(os.path.join(GAMES_DIR, '*.py'))):
+            name = os.path.splitext(os.path.basename(path))[0]
+            try:
+                importlib.import_module(name)
+            except BaseException:
+                pass
+        self.code = session_entry.preload(self.script_path)
+        self.json_cache = JsonCache(PRELOAD_JSON)
+        # 以降に確保されるオブジェクトだけを GC の対象にし、共有ページへの書き込みを減らす
+        gc.collect()
+        gc.freeze()
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.socket_path)
+        self.listener.listen(128)
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ, self._accept)
+
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        os.set_blocking(self._wakeup_w, False)
+        signal.set_wakeup_fd(self._wakeup_w)
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ, self._on_signal)
+        # stdin はサーバーとのパイプ。EOF になったらサーバーが落ちたので子プロセスごと終了する
+        self.selector.register(sys.stdin.fileno(), selectors.EVENT_READ, self._on_parent_closed)
+
+        print("READY", flush=True)
+        try:
+            while True:
+                for key, _ in self.selector.select():
+                    key.data(key.fileobj)
+        finally:
+            for pid in list(self.children):
+                self._kill_group(pid)
+            os.unlink(self.socket_path)
+
+    def _accept(self, listener):
+        try:
+            conn, _ = listener.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(True)
+        self.selector.register(conn, selectors.EVENT_READ, self._on_request)
+
+    def _on_request(self, conn):
+        self.selector.unregister(conn)
+        try:
+            line = conn.makefile('rb').readline()
+            request = json.loads(line) if line else None
+        except (OSError, ValueError):
+            request = None
+        if not request:
+            conn.close()
+            return
+        try:
+            pid = self._spawn(conn, request)
+        except OSError as e:
+            print(f"zygote: 子プロセスの生成に失敗しました: {e}", file=sys.stderr)
+            conn.close()
+            return
+        self.children[pid] = conn
+        # 以降この接続で読めるのは EOF (サーバー側のクローズ) だけ
+        self.selector.register(conn, selectors.EVENT_READ, self._on_client_closed)
+
+    def _spawn(self, conn, request):
+        master_fd, slave_fd = pty.openpty()
+        set_winsize(master_fd, request.get('rows', 24), request.get('cols', 80))
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            self._run_child(conn, master_fd, slave_fd, request)  # 戻らない
+        os.close(slave_fd)
+        try:
+            message = json.dumps({"pid": pid}).encode('utf-8') + b"\n"
+            socket.send_fds(conn, [message], [master_fd])
+        finally:
+            os.close(master_fd)
+        return pid
+
+    def _run_child(self, conn, master_fd, slave_fd, request):
+        exit_code = 1
+        try:
+            signal.set_wakeup_fd(-1)
+            for signum in (signal.SIGCHLD, signal.SIGTERM):
+                signal.signal(signum, signal.SIG_DFL)
+            self.selector.close()
+            self.listener.close()
+            conn.close()
+            for child_conn in self.children.values():
+                child_conn.close()
+            os.close(self._wakeup_r)
+            os.close(self._wakeup_w)
+            os.close(master_fd)
+
+            # 新しいセッションを作り、slave を制御端末にする (SIGWINCH/SIGHUP を受け取れるように)
+            os.setsid()
+            fcntl.ioctl(slave_fd, termios.TIOCSCTTY, 0)
+            for fd in (0, 1, 2):
+                os.dup2(slave_fd, fd)
+            if slave_fd > 2:
+                os.close(slave_fd)
+
+            os.environ.update(request.get('env') or {})
+            sys.argv = [self.script_path]
+            self.json_cache.install()
+            self.limits.apply()
+            label_archives()
+            session_entry.run_main(self.script_path, self.code)
+            exit_code = 0
+        except SystemExit as e:
+            if e.code is None:
+                exit_code = 0
+            elif isinstance(e.code, int):
+                exit_code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                exit_code = 1
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(exit_code)
+
+    def _on_signal(self, wakeup_r):
+        try:
+            while os.read(wakeup_r, 512):
+                pass
+        except BlockingIOError:
+            pass
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            conn = self.children.pop(pid, None)
+            if conn is None:
+                continue
+            try:
+                self.selector.unregister(conn)
+            except KeyError:
+                pass  # サーバー側が先に切断していた
+            try:
+                message = {"exit": os.waitstatus_to_exitcode(status)}
+                conn.sendall(json.dumps(message).encode('utf-8') + b"\n")
+            except OSError:
+                pass
+            conn.close()
+
+    def _on_parent_closed(self, fd):
+        if not os.read(fd, 512):
+            sys.exit(0)
+
+    def _on_client_closed(self, conn):
+        # 子プロセスの回収と接続のクローズは SIGCHLD 側で行う
+        self.selector.unregister(conn)
+        for pid, child_conn in list(self.children.items()):
+            if child_conn is conn:
+                self._kill_group(pid)
+
+    def _kill_group(self, pid):
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+# --- サーバー側 (asyncio) ---
+
+class ZygoteProcess:
+    """
+    zygote が fork したセッションプロセスのハンドル。
+    asyncio.subprocess.Process と同じ pid / returncode / wait() / terminate() / kill() を持つ。
+    """
+    def __init__(self, pid, sock, buffered=b''):
+        self.pid = pid
+        self.returncode = None
+        self._sock = sock
+        self._exited = asyncio.get_running_loop().create_future()
+        self._watcher = asyncio.create_task(self._watch(buffered))
+
+    async def _watch(self, buffered):
+        exit_code = -signal.SIGKILL
+        try:
+            reader, writer = await asyncio.open_unix_connection(sock=self._sock)
+            line = buffered if buffered.endswith(b"\n") else buffered + await reader.readline()
+            if line.strip():
+                exit_code = json.loads(line).get('exit', exit_code)
+            writer.close()
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.returncode = exit_code
+            self._exited.set_result(exit_code)
+
+    async def wait(self):
+        return await asyncio.shield(self._exited)
+
+    def send_signal(self, signum):
+        if self.returncode is not None:
+            return
+        try:
+            os.killpg(self.pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+class ZygoteSpawner:
+    """
+    zygote プロセスを起動・監視し、acquire() でセッションを払い出す。
+    WarmPool と同じ start() / close() / acquire() を持つので、サーバー側で差し替えられる。
+    """
+    def __init__(self, script, env=None, winsize=(24, 80), socket_path=None, limits=None):
+        """
+        Args:
+            script (str): 実行するオーケストレーターのパス。
+            env (dict): 子プロセスで上書きする環境変数 (TERM など)。
+            winsize (tuple): 既定の PTY サイズ (rows, cols)。
+            socket_path (str): zygote の Unix ソケット (省略時は一時ディレクトリ内)。
+            limits (ResourceLimits): 子プロセスに掛ける rlimit (省略時は環境変数の設定)。
+        """
+        self.script = script
+        self.env = env or {}
+        self.winsize = winsize
+        self.limits = ResourceLimits() if limits is None else limits
+        self.socket_path = socket_path or os.path.join(
+            tempfile.gettempdir(), f"ygg-zygote-{os.getpid()}.sock")
+        self.process = None
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "bridge.zygote",
+            "--socket", self.socket_path, *self.limits.args(), self.script,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+        )
+        line = await self.process.stdout.readline()
+        if line.strip() != b"READY":
+            raise RuntimeError("zygote の起動に失敗しました")
+        print(f"zygoteを起動しました (PID: {self.process.pid})")
+
+    async def close(self):
+        if self.process and self.process.returncode is None:
+            self.process.terminate()
+            await self.process.wait()
+
+    async def _ensure_running(self):
+        async with self._lock:
+            if self.process is None or self.process.returncode is not None:
+                print("zygoteが停止しているため再起動します。")
+                await self.start()
+
+    async def acquire(self, rows=None, cols=None):
+        """
+        zygote に fork を依頼し、PTY master fd を受け取る。
+
+        Returns:
+            WarmSession: 実行中のセッション (process は ZygoteProcess)。
+        """
+        await self._ensure_running()
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            await loop.sock_connect(sock, self.socket_path)
+            request = {
+                "rows": rows or self.winsize[0],
+                "cols": cols or self.winsize[1],
+                "env": self.env,
+            }
+            await loop.sock_sendall(sock, json.dumps(request).encode('utf-8') + b"\n")
+            data, fds = await _recv_fds(sock)
+        except BaseException:
+            sock.close()
+            raise
+        if not fds:
+            sock.close()
+            raise RuntimeError("zygote から PTY を受け取れませんでした")
+        header, _, rest = data.partition(b"\n")
+        master_fd = fds[0]
+        fcntl.fcntl(master_fd, fcntl.F_SETFL, os.O_NONBLOCK)
+        process = ZygoteProcess(json.loads(header)["pid"], sock, rest)
+        return WarmSession(process, master_fd, None)
+
+
+async def _recv_fds(sock, maxfds=1):
+    """非ブロッキングソケットから、添付 fd 付きのメッセージを 1 つ受け取る。"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            data, fds, _, _ = socket.recv_fds(sock, 4096, maxfds)
+            return data, fds
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+        readable = loop.create_future()
+        loop.add_reader(sock.fileno(), readable.set_result, None)
+        try:
+            await readable
+        finally:
+            loop.remove_reader(sock.fileno())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Yggdrasil zygote fork server")
+    parser.add_argument('--socket', required=True, help="待ち受ける Unix ソケットのパス")
+    ResourceLimits.add_arguments(parser)
+    parser.add_argument('script', help="子プロセスで実行するオーケストレーターのパス")
+    args = parser.parse_args()
+
+    zygote = Zygote(args.script, args.socket, ResourceLimits.from_args(args))
+    zygote.preload()
+    zygote.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+// クライアント → サーバーのコンパクトな入力プロトコル (bridge/input_protocol.py と対応)
+// 先頭 1 バイトがオペコード、その後ろにペイロード。WebSocket の URL に ?input=1 を付けて使う。
+//   0x00 INPUT  : UTF-8 のキー入力
+//   0x01 RESIZE : rows, cols (それぞれ 2 バイト、ビッグエンディアン)
+//   0x02 PING   : キープアライブ
+const YGG_INPUT_PROTOCOL_VERSION = 1;
+const YGG_OP_INPUT = 0x00;
+const YGG_OP_RESIZE = 0x01;
+const YGG_OP_PING = 0x02;
+
+const yggTextEncoder = new TextEncoder();
+
+function yggEncodeInput(data) {
+    const payload = yggTextEncoder.encode(data);
+    const frame = new Uint8Array(payload.length + 1);
+    frame[0] = YGG_OP_INPUT;
+    frame.set(payload, 1);
+    return frame;
+}
+
+function yggEncodeResize(rows, cols) {
+    const frame = new Uint8Array(5);
+    const view = new DataView(frame.buffer);
+    frame[0] = YGG_OP_RESIZE;
+    view.setUint16(1, rows);
+    view.setUint16(3, cols);
+    return frame;
+}
+
+function yggEncodePing() {
+    return new Uint8Array([YGG_OP_PING]);
+}
@@ -0,0 +1,21 @@
+// サーバー側ターミナルエミュレータ (?diff=1) から届く差分メッセージを
+// ANSI エスケープシーケンスに戻し、xterm.js にそのまま書き込めるようにする。
+//
+//   {"t": "s", "rows": 24, "cols": 80, "r": [...], "c": [y, x, 1]}  画面全体
+//   {"t": "d", "r": [...], "c": [y, x, 1]}                          差分
+//   r の各要素は [行, 桁, SGRパラメータ, テキスト] (行・桁は0始まり)
+function yggDiffToAnsi(message) {
+    let out = '';
+    if (message.t === 's') {
+        out += '\x1b[0m\x1b[H\x1b[2J';
+    }
+    for (const [row, col, sgr, text] of message.r) {
+        out += `\x1b[${row + 1};${col + 1}H\x1b[0${sgr ? ';' + sgr : ''}m${text}`;
+    }
+    out += '\x1b[0m';
+    if (message.c) {
+        const [y, x, visible] = message.c;
+        out += `\x1b[${y + 1};${x + 1}H` + (visible ? '\x1b[?25h' : '\x1b[?25l');
+    }
+    return out;
+}
@@ -4,6 +4,10 @@ import asyncio
 from aiohttp import web
 import curses
 
+from bridge.event_loop import install_event_loop
+from bridge.health import add_health_routes
+from bridge.static_cache import add_static_assets
+
 # gamesフォルダを読み込むためのパス設定
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
@@ -69,7 +73,9 @@ async def init_app():
     app = web.Application()
     app.add_routes([web.get('/ws', websocket_handler)])
     # publicフォルダ内のindex.html等を表示
-    app.router.add_static('/', path='public', name='public', show_index=True)
+    # ヘルスチェックは / 以下の静的ファイルより先に登録する (一覧ページを作らずに答える)
+    add_health_routes(app)
+    add_static_assets(app, '/', 'public', show_index=True, name='public')
     return app
 
 if __name__ == '__main__':
@@ -78,6 +84,7 @@ if __name__ == '__main__':
     
     # もしローカル実行ならCursesを起動、Renderならサーバーを起動
     if 'RENDER' in os.environ:
+        print(f"イベントループ: {install_event_loop()}")
         app = asyncio.run(init_app())
         web.run_app(app, host='0.0.0.0', port=port)
     else:
@@ -2,6 +2,10 @@ import os
 import asyncio
 from aiohttp import web
 
+from bridge.event_loop import install_event_loop
+from bridge.health import add_health_routes
+from bridge.static_cache import add_static_assets
+
 async def websocket_handler(request):
     ws = web.WebSocketResponse()
     await ws.prepare(request)
@@ -17,12 +21,16 @@ async def websocket_handler(request):
 async def init_app():
     app = web.Application()
     app.add_routes([web.get('/ws', websocket_handler)])
-    app.router.add_static('/', path='public', show_index=True)
+    # ヘルスチェックは / 以下の静的ファイルより先に登録する (一覧ページを作らずに答える)
+    add_health_routes(app)
+    add_static_assets(app, '/', 'public', show_index=True)
     return app
 
 if __name__ == '__main__':
     # 【ここが重要！】Renderが指定するポートを使い、なければ8080にする
     port = int(os.environ.get('PORT', 8080))
+    # YGG_EVENT_LOOP=uvloop なら uvloop を使う (入っていなければ標準のループ)
+    print(f"イベントループ: {install_event_loop()}")
     
     app = asyncio.run(init_app())
     # 起動ログを出す（RenderのLogsタブで見れます）
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+#
+# bridge.admission の待合室の回帰テスト (python3 -m pytest tests)
+
+import asyncio
+
+from bridge.admission import AdmissionController, wait_for_admission
+
+
+class GoneSender:
+    """切断済みの接続への送信 (aiohttp は ConnectionResetError 系を送出する)。"""
+    async def send(self, data):
+        raise ConnectionResetError("Cannot write to closing transport")
+
+
+class VanishingWebSocket:
+    """何も送らずに、wait_after 秒後に切断するクライアント。"""
+    closed = False
+
+    def __init__(self, wait_after):
+        self.wait_after = wait_after
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.sleep(self.wait_after)
+        self.closed = True
+        raise StopAsyncIteration
+
+    async def close(self, **kwargs):
+        raise ConnectionResetError("Cannot write to closing transport")
+
+
+def full_server(max_waiting):
+    return AdmissionController(registry=[object()], max_sessions=1, min_memory_mb=0,
+                               max_cpu_percent=100, max_waiting=max_waiting)
+
+
+def test_rejecting_a_client_that_already_left():
+    """待合室も満員で断る時、クライアントが既に消えていても例外を出さない。"""
+    admission = full_server(max_waiting=0)
+    result = asyncio.run(wait_for_admission(admission, VanishingWebSocket(10), GoneSender()))
+    assert result == (False, None)
+
+
+def test_waiting_client_that_left_leaves_the_queue():
+    """待ち順を送れなくても待ち続け、切断が分かったら列から抜ける。"""
+    admission = full_server(max_waiting=5)
+
+    async def run():
+        result = await wait_for_admission(admission, VanishingWebSocket(0.1), GoneSender())
+        return result, admission.waiting
+
+    assert asyncio.run(run()) == ((False, None), 0)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+#
+# bridge.drain / bridge.resources.read_archive の回帰テスト (python3 -m pytest tests)
+
+import asyncio
+import os
+
+from bridge.drain import DrainController
+from bridge.resources import read_archive
+
+
+class UnlabelledSession:
+    """label_archives() を呼ばないスクリプトのセッション (comm は "python3" などのまま)。"""
+    attached = False
+
+    def __init__(self):
+        self.process = type('Process', (), {'pid': os.getpid()})()
+        self.ended = False
+        self.result = None
+
+    def terminate(self):
+        self.ended = True
+
+    async def wait_closed(self):
+        pass
+
+
+def test_unlabelled_process_is_not_at_menu():
+    """ラベルのないプロセスや、もういないプロセスのアーカイブは不明 (None)。"""
+    assert read_archive(os.getpid()) is None
+    assert read_archive(2 ** 22 + 1) is None
+
+
+def test_drain_waits_for_deadline_when_archive_is_unknown():
+    """状態の分からないセッションは、メニューに戻ったとみなさずに期限まで待つ。"""
+    session = UnlabelledSession()
+    drain = DrainController({'sessions': [session]}, deadline_seconds=DrainController.MENU_SETTLE_SECONDS + 0.6)
+    asyncio.run(drain.drain())
+    assert session.ended
+    assert drain.results == {"deadline": 1}
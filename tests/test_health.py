@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+#
+# bridge.health の準備完了判定の回帰テスト (python3 -m pytest tests)
+
+import time
+
+from bridge.health import HealthMonitor
+from bridge.warm_pool import WarmPool
+
+
+def monitor_with_empty_pool(empty_for, refill_failures):
+    pool = WarmPool("unused.py", size=2)
+    pool.empty_since = time.monotonic() - empty_for
+    pool.refill_failures = refill_failures
+    return HealthMonitor({'spawner': pool}, pool_empty_seconds=30)
+
+
+def test_refill_in_progress_stays_ready():
+    """払い出し直後の補充中 (プールは空だが失敗していない) は準備完了のまま。"""
+    assert monitor_with_empty_pool(empty_for=0.5, refill_failures=0).readiness_problems() == []
+    # 補充に時間が掛かっていても、失敗していなければその場で起動できる
+    assert monitor_with_empty_pool(empty_for=60, refill_failures=0).readiness_problems() == []
+
+
+def test_brief_refill_failure_stays_ready():
+    assert monitor_with_empty_pool(empty_for=5, refill_failures=2).readiness_problems() == []
+
+
+def test_pool_empty_with_failing_refills_is_not_ready():
+    assert monitor_with_empty_pool(empty_for=60, refill_failures=5).readiness_problems() == ["warm_pool_empty"]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+#
+# bridge.input_protocol の回帰テスト (python3 -m pytest tests)
+
+import json
+
+from aiohttp import WSMessage, WSMsgType
+
+from bridge.input_protocol import MAX_TERMINAL_SIZE, InputHandler, decode_resize, encode_resize
+
+
+def handler():
+    sizes = []
+    return InputHandler(session=None, on_resize=lambda rows, cols: sizes.append((rows, cols))), sizes
+
+
+def test_binary_resize_is_clamped():
+    """65535x65535 のような要求は上限に、0 は 1 に収める。"""
+    h, sizes = handler()
+    h.feed(WSMessage(WSMsgType.BINARY, encode_resize(65535, 0), None))
+    assert sizes == [(MAX_TERMINAL_SIZE, 1)]
+
+
+def test_json_resize_is_clamped():
+    h, sizes = handler()
+    h.feed(WSMessage(WSMsgType.TEXT, json.dumps({"type": "resize", "rows": 100000, "cols": 120}), None))
+    assert sizes == [(MAX_TERMINAL_SIZE, 120)]
+
+
+def test_waiting_room_resize_is_clamped():
+    """入場待ちの間に拾うリサイズ (decode_resize) も同じく収める。"""
+    assert decode_resize(WSMessage(WSMsgType.BINARY, encode_resize(40, 65535), None)) == (40, MAX_TERMINAL_SIZE)
+    assert decode_resize(WSMessage(WSMsgType.TEXT, '{"type":"resize","rows":"x","cols":1}', None)) is None
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+#
+# bridge.send_queue の間引き (生バイトモードのサーバー側 Screen) の回帰テスト (python3 -m pytest tests)
+
+import asyncio
+
+from bridge.input_protocol import MAX_TERMINAL_SIZE
+from bridge.send_queue import SendQueue
+from bridge.throttle import OutputBudget
+from bridge.vt_screen import Screen
+
+
+class RecordingSender:
+    """送ったバイト列を溜めておく FrameSender の代わり。"""
+    stateful = False
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, data):
+        self.sent.append(data)
+
+    async def flush(self):
+        pass
+
+    def resize(self, rows, cols):
+        pass
+
+
+def throttled_queue(history, rows, cols):
+    sender = RecordingSender()
+    queue = SendQueue(sender, budget=OutputBudget(), screen_seed=lambda: (history, rows, cols))
+    queue._start_throttle()
+    return queue, sender
+
+
+def test_mirror_size_is_capped():
+    """PTY が 65535x65535 にされていても、間引き用の Screen は上限の大きさまでしか作らない。"""
+    queue, _ = throttled_queue(b'', 65535, 65535)
+    assert (queue._mirror.rows, queue._mirror.cols) == (MAX_TERMINAL_SIZE, MAX_TERMINAL_SIZE)
+    queue.record_stats()
+
+
+def test_resize_on_alt_screen_while_throttled():
+    """curses の代替画面で間引き中にリサイズされ、通常画面に戻っても送信が止まらない。"""
+    async def run():
+        queue, sender = throttled_queue(b'menu\x1b[?1049h', 24, 80)
+        queue.resize(30, 100)
+        await queue.put(b'\x1b[?1049l\x1b[30;100HX')
+        assert await queue._send_pending() > 0
+        queue.record_stats()
+        client = Screen(30, 100)
+        client.feed(b''.join(sender.sent))
+        assert client.chars[29][99] == 'X'
+        assert ''.join(client.chars[0]).startswith('menu')
+
+    asyncio.run(run())
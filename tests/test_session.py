@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+#
+# bridge.session の回帰テスト (python3 -m pytest tests)
+
+import asyncio
+import os
+import pty
+
+from bridge.session import GameSession, SessionRegistry
+from bridge.spawn import get_winsize
+
+
+class FakeProcess:
+    pid = os.getpid()
+    returncode = None
+
+
+def test_resize_after_game_ended_is_ignored():
+    """ゲームの終了後に届いたリサイズは、(閉じた/再利用された) master_fd に触れない。"""
+    async def run():
+        master_fd, slave_fd = pty.openpty()
+        try:
+            session = GameSession(SessionRegistry(), "token", FakeProcess(), master_fd)
+            assert session.resize(30, 100)
+            assert get_winsize(master_fd) == (30, 100)
+            session.ended = True  # _finish() の冒頭と同じ状態
+            assert not session.resize(40, 120)
+            assert get_winsize(master_fd) == (30, 100)
+            session.reader.close()
+        finally:
+            os.close(master_fd)
+            os.close(slave_fd)
+
+    asyncio.run(run())
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#
+# bridge.vt_screen の回帰テスト (python3 -m pytest tests)
+
+import random
+
+from bridge.vt_screen import Screen, message_to_ansi
+
+
+def assert_geometry(screen):
+    assert len(screen.chars) == len(screen.attrs) == screen.rows
+    assert all(len(row) == screen.cols for row in screen.chars)
+    assert all(len(row) == screen.cols for row in screen.attrs)
+    assert 0 <= screen.y < screen.rows and 0 <= screen.x < screen.cols
+
+
+def test_resize_on_alt_screen_then_leave_grows_primary():
+    """代替画面 (curses) の使用中に広げてから通常画面へ戻っても、右下隅に書ける。"""
+    s = Screen(24, 80)
+    s.feed(b'primary')
+    s.feed(b'\x1b[?1049h')
+    s.resize(30, 100)
+    s.feed(b'\x1b[?1049l')
+    assert_geometry(s)
+    s.feed(b'\x1b[30;100HX')
+    assert s.chars[29][99] == 'X'
+    assert ''.join(s.chars[0]).startswith('primary')
+    assert s.diff()["t"] == "s"
+
+
+def test_resize_on_alt_screen_then_leave_shrinks_primary():
+    """狭めた場合は、退避してあったカーソルも新しい画面の中に収まる。"""
+    s = Screen(24, 80)
+    s.feed(b'\x1b[20;70Hcursor\x1b[?1049h')
+    s.resize(10, 20)
+    s.feed(b'\x1b[?1049l')
+    assert_geometry(s)
+    s.feed(b'X\x1b[10;20HY')
+    assert s.chars[9][19] == 'Y'
+
+
+def test_wide_char_on_one_column_screen():
+    """1 桁の画面では全角文字を幅 1 として扱う。"""
+    s = Screen(3, 1)
+    s.feed('漢字a'.encode('utf-8'))
+    assert_geometry(s)
+    assert [row[0] for row in s.chars] == ['漢', '字', 'a']
+
+
+def test_insert_chars_inside_wide_char():
+    """ICH で全角文字の途中に挿入すると、分かれた両側は空白になる (孤立した継続セルを残さない)。"""
+    s = Screen(2, 10)
+    s.feed('あいう'.encode('utf-8'))
+    s.feed(b'\x1b[1;4H\x1b[1@')
+    assert s.chars[0][:7] == ['あ', '', ' ', ' ', ' ', 'う', '']
+
+
+# 差分プロトコルの往復テストで流す出力の断片 ({} は 1〜12 の乱数)
+FRAGMENTS = ['あいう', 'メニュー', '漢字テスト', 'abc', 'x', ' ', '\r\n', '\n', '\b', '\t',
+             '\x1b[{}@', '\x1b[{}P', '\x1b[{}X', '\x1b[K', '\x1b[1K', '\x1b[2K', '\x1b[J', '\x1b[1J',
+             '\x1b[{};{}H', '\x1b[{}C', '\x1b[{}D', '\x1b[{}A', '\x1b[{}B', '\x1b[{}L', '\x1b[{}M',
+             '\x1b[{}S', '\x1b[{}T', '\x1b[{};{}r', '\x1bM', '\x1bD', '\x1b7', '\x1b8',
+             '\x1b[31m', '\x1b[1;44m', '\x1b[7m', '\x1b[0m', '\x1b(0qqx\x1b(B', '\x1b[?1049h', '\x1b[?1049l']
+
+
+def random_output(rng):
+    fragments = []
+    for _ in range(rng.randint(1, 6)):
+        fragment = rng.choice(FRAGMENTS)
+        fragments.append(fragment.format(*(rng.randint(1, 12) for _ in range(fragment.count('{}')))))
+    return ''.join(fragments).encode('utf-8')
+
+
+def test_diff_round_trip():
+    """diff() を message_to_ansi() でクライアント側の Screen に流すと、サーバー側と同じ画面になる。"""
+    for seed in range(300):
+        rng = random.Random(seed)
+        server = Screen(8, 12)
+        client = Screen(8, 12)
+        for _ in range(30):
+            server.feed(random_output(rng))
+            message = server.diff()
+            if message:
+                client.feed(message_to_ansi(message).encode('utf-8'))
+            assert client.chars == server.chars, f"seed {seed}"
+            assert client.attrs == server.attrs, f"seed {seed}"